@@ -3,6 +3,7 @@
 from .basic_route import modules
 from .experiment import experiment_bp
 from .pause import pause_bp
+from .profile import profile_bp
 from .status import status_bp
 from .task import task_bp
 from .user_input import userinput_bp
@@ -16,3 +17,4 @@ def init_app(app):
     app.register_blueprint(userinput_bp)
     app.register_blueprint(pause_bp)
     app.register_blueprint(task_bp)
+    app.register_blueprint(profile_bp)
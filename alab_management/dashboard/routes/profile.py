@@ -0,0 +1,22 @@
+"""Routes for the profile of the database operations, which is recorded if ``[db_profiler]`` is enabled."""
+
+from flask import Blueprint, request
+
+from alab_management.utils.db_profiler import get_profile
+
+profile_bp = Blueprint("/profile", __name__, url_prefix="/api/profile")
+
+
+@profile_bp.route("/")
+def get_db_profile():
+    """
+    Get the database operations in the last ``seconds`` (default: 3600), grouped by call site, command and
+    collection. The ``limit`` (default: 50) call sites with the longest total time are returned.
+    """
+    try:
+        seconds = float(request.args.get("seconds", 3600))
+        limit = int(request.args.get("limit", 50))
+    except ValueError as exception:
+        return {"status": "error", "errors": exception.args[0]}, 400
+    profile = get_profile(seconds)
+    return {"status": "success", "data": profile[:limit]}
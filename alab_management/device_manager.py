@@ -6,9 +6,12 @@ redirect all the method calls to the real device object via RabbitMQ. The real d
 DeviceManager class, which will handle all the request to run certain methods on the real device.
 """
 
+import os
+import threading
 import time
 from collections.abc import Callable
 from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from contextlib import contextmanager
 from enum import Enum, auto
 from functools import partial
@@ -17,7 +20,6 @@ from typing import Any, NoReturn, cast
 from unittest.mock import Mock
 from uuid import uuid4
 
-import dill
 import pika
 from bson import ObjectId
 from pika import BasicProperties
@@ -25,8 +27,12 @@ from pika.adapters.blocking_connection import BlockingChannel
 from pika.spec import Basic
 
 from .config import AlabOSConfig
+from .device_view.device import get_all_devices
 from .device_view.device_view import DeviceTaskStatus, DeviceView
-from .utils.data_objects import get_rabbitmq_connection
+from .utils.codec import CONTENT_TYPE_MSGPACK, get_codec
+from .utils.data_objects import get_collection, get_rabbitmq_connection
+from .utils.db_watcher import CollectionWatcher
+from .utils.keyed_executor import KeyedExecutor
 from .utils.module_ops import load_definition
 
 DEFAULT_SERVER_QUEUE_SUFFIX = ".device_rpc"
@@ -50,6 +56,157 @@ class DeviceMethodCallState:
     last_updated: float
 
 
+class DeviceCallMetrics:
+    """The statistics of the device method calls (per device and method), which is thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: dict[tuple[str, str], dict[str, float]] = {}
+
+    def record(
+        self,
+        device: str,
+        method: str,
+        queue_seconds: float,
+        call_seconds: float,
+        success: bool,
+    ):
+        """
+        Record a finished call.
+
+        Args:
+            device: the name of the device
+            method: the name of the method
+            queue_seconds: the time between receiving the call and starting it
+            call_seconds: the time to run the call
+            success: whether the call succeeded
+        """
+        with self._lock:
+            metrics = self._metrics.setdefault(
+                (device, method),
+                {
+                    "calls": 0,
+                    "failures": 0,
+                    "total_queue_seconds": 0.0,
+                    "max_queue_seconds": 0.0,
+                    "total_call_seconds": 0.0,
+                    "max_call_seconds": 0.0,
+                },
+            )
+            metrics["calls"] += 1
+            metrics["failures"] += int(not success)
+            metrics["total_queue_seconds"] += queue_seconds
+            metrics["max_queue_seconds"] = max(
+                metrics["max_queue_seconds"], queue_seconds
+            )
+            metrics["total_call_seconds"] += call_seconds
+            metrics["max_call_seconds"] = max(metrics["max_call_seconds"], call_seconds)
+
+    def summary(self) -> dict[str, dict[str, dict[str, float]]]:
+        """Get the statistics in the format of ``{device: {method: {metric: value}}}``."""
+        with self._lock:
+            summary: dict[str, dict[str, dict[str, float]]] = {}
+            for (device, method), metrics in self._metrics.items():
+                summary.setdefault(device, {})[method] = {
+                    "calls": metrics["calls"],
+                    "failures": metrics["failures"],
+                    "mean_queue_seconds": metrics["total_queue_seconds"]
+                    / metrics["calls"],
+                    "max_queue_seconds": metrics["max_queue_seconds"],
+                    "mean_call_seconds": metrics["total_call_seconds"]
+                    / metrics["calls"],
+                    "max_call_seconds": metrics["max_call_seconds"],
+                }
+            return summary
+
+
+class DeviceOccupancyCache:
+    """
+    A local copy of which task occupies each device, kept up to date by a change stream
+    on the ``devices`` collection.
+
+    The cache is only trusted while the change stream is open. It is used to authorize the
+    calls without a database round-trip: if the cache does not say that the device is occupied
+    by the task, the caller should check the database as usual.
+    """
+
+    def __init__(self):
+        self._device_collection = get_collection("devices")
+        self._lock = threading.Lock()
+        # device name -> (status, task_id)
+        self._occupancy: dict[str, tuple[str, ObjectId | None]] = {}
+        self._names: dict[ObjectId, str] = {}
+        self._loaded_at_reopened: int | None = None
+        self._watcher = CollectionWatcher(
+            self._device_collection,
+            pipeline=[
+                {
+                    "$match": {
+                        "operationType": {
+                            "$in": ["insert", "update", "replace", "delete"]
+                        }
+                    }
+                }
+            ],
+            full_document="updateLookup",
+            on_change=self._on_change,
+        )
+
+    @property
+    def available(self) -> bool:
+        """Whether the cache can be trusted now."""
+        return self._watcher.available
+
+    def start(self) -> bool:
+        """Start watching the devices. Return False if change streams are not supported."""
+        if not self._watcher.start():
+            return False
+        self._load()
+        return True
+
+    def stop(self):
+        """Stop watching the devices."""
+        self._watcher.stop()
+
+    def is_occupied_by(self, device_name: str, task_id: ObjectId) -> bool:
+        """Whether the device is occupied by the task according to the cache. Always False if the cache is unavailable."""
+        if not self._watcher.available:
+            return False
+        if self._loaded_at_reopened != self._watcher.reopened:
+            # the change stream has been lost in between, some changes may be missed
+            self._load()
+        with self._lock:
+            status, occupied_by = self._occupancy.get(device_name, (None, None))
+        return status == DeviceTaskStatus.OCCUPIED.name and occupied_by == task_id
+
+    def _load(self):
+        reopened = self._watcher.reopened
+        device_entries = list(
+            self._device_collection.find({}, projection=["name", "status", "task_id"])
+        )
+        with self._lock:
+            self._occupancy = {
+                entry["name"]: (entry["status"], entry["task_id"])
+                for entry in device_entries
+            }
+            self._names = {entry["_id"]: entry["name"] for entry in device_entries}
+            self._loaded_at_reopened = reopened
+
+    def _on_change(self, change: dict[str, Any]):
+        with self._lock:
+            document = change.get("fullDocument")
+            if document is None:
+                # deleted, or deleted before the update can be looked up
+                name = self._names.pop(change["documentKey"]["_id"], None)
+                self._occupancy.pop(name, None)
+                return
+            self._names[document["_id"]] = document["name"]
+            self._occupancy[document["name"]] = (
+                document["status"],
+                document["task_id"],
+            )
+
+
 class DeviceWrapper:
     """A wrapper over the device."""
 
@@ -128,7 +285,29 @@ class DeviceManager:
             )
         self._device_view = DeviceView(connect_to_devices=True)
         self._check_status = _check_status
-        self.threads = []
+
+        # The calls to the same device are executed one by one (most device drivers are not thread-safe),
+        # while the calls to different devices run in parallel in a bounded thread pool. The number of
+        # unacknowledged messages is limited by the prefetch count, so that the back-pressure is kept in RabbitMQ.
+        device_manager_config = AlabOSConfig().get("device_manager", {})
+        self._executor = KeyedExecutor(
+            max_workers=device_manager_config.get(
+                "max_workers", max(len(get_all_devices()), 8)
+            ),
+            max_concurrency_per_key=device_manager_config.get(
+                "max_calls_per_device", 1
+            ),
+        )
+        self._prefetch_count = device_manager_config.get("prefetch_count", 256)
+        self.metrics = DeviceCallMetrics()
+
+        # authorize the calls with a local copy of the device occupancy, which is kept up to date
+        # by a change stream. Only the calls that are not authorized by the cache check the database.
+        self._occupancy_cache: DeviceOccupancyCache | None = None
+        if _check_status and device_manager_config.get("cache_occupancy", True):
+            self._occupancy_cache = DeviceOccupancyCache()
+            if not self._occupancy_cache.start():
+                self._occupancy_cache = None
 
     def refresh_devices(self):
         """Re-connect the devices in the device view."""
@@ -155,6 +334,7 @@ class DeviceManager:
         """Start to listen on the device_rpc queue and conduct the command one by one."""
         self.connection = get_rabbitmq_connection()
         with self.connection.channel() as channel:
+            channel.basic_qos(prefetch_count=self._prefetch_count)
             channel.queue_declare(
                 queue=self._rpc_queue_name,
                 auto_delete=True,
@@ -167,6 +347,16 @@ class DeviceManager:
                 consumer_tag=self._rpc_queue_name,
             )
             channel.start_consuming()
+        self._executor.shutdown(wait=False)
+        if self._occupancy_cache is not None:
+            self._occupancy_cache.stop()
+
+    def get_metrics(self) -> dict[str, Any]:
+        """Get the number of queued/running calls and the call statistics of every device."""
+        return {
+            "queue_depth": self._executor.queue_depths(),
+            "calls": self.metrics.summary(),
+        }
 
     def _execute_command_wrapper(
         self,
@@ -179,7 +369,13 @@ class DeviceManager:
         *args,
         **kwargs,
     ):
-        """Execute a command on the device. Acknowledges completion on rabbitmq channel."""
+        """
+        Execute a command on the device. Acknowledges completion on rabbitmq channel.
+
+        Returns
+        -------
+            True if the command succeeded.
+        """
 
         def callback_publish(channel, delivery_tag, props, response):
             if isinstance(response, Mock):
@@ -187,48 +383,40 @@ class DeviceManager:
                     f"You are trying to call a method on a Mock device. Please specify a mock value for {response}."
                 )
             if props.reply_to is not None:
+                # reply in the same format as the request, so that the client can always decode it
+                codec = get_codec(props.content_type)
+                try:
+                    body = codec.encode(response)
+                except Exception as e:  # pylint: disable=broad-except
+                    # this runs in the I/O loop, an exception here would stop the device manager
+                    body = codec.encode(
+                        {
+                            "status": "failure",
+                            "result": TypeError(
+                                f"Cannot serialize the result of the device method: {e!r}"
+                            ),
+                        }
+                    )
                 channel.basic_publish(
                     exchange="",
                     routing_key=props.reply_to,
                     properties=pika.BasicProperties(
                         correlation_id=props.correlation_id,
-                        content_type="application/python-dill",
+                        content_type=codec.content_type,
                     ),
-                    body=dill.dumps(response),
+                    body=body,
                 )
 
             channel.basic_ack(delivery_tag=cast(int, delivery_tag))
 
         try:
-            device_entry: dict[str, Any] | None = self._device_view.get_device(device)
-
-            # check if the device is currently occupied by this task
+            # check if the device is currently occupied by this task, the database is only
+            # queried if it cannot be confirmed by the cache
             if self._check_status and (
-                device_entry is None
-                or device_entry["status"] != DeviceTaskStatus.OCCUPIED.name
-                or device_entry["task_id"] != ObjectId(task_id)
+                self._occupancy_cache is None
+                or not self._occupancy_cache.is_occupied_by(device, ObjectId(task_id))
             ):
-                if device_entry is None:
-                    raise PermissionError("There is no such device in the device view.")
-                if device_entry["status"] != DeviceTaskStatus.OCCUPIED.name:
-                    # Wait a few seconds for the device to be OCCUPIED.
-                    for _ in range(5):
-                        time.sleep(1)
-                        device_entry: dict[str, Any] | None = (
-                            self._device_view.get_device(device)
-                        )
-                        if device_entry["status"] == DeviceTaskStatus.OCCUPIED.name:
-                            break
-                    if device_entry["status"] != DeviceTaskStatus.OCCUPIED.name:
-                        raise PermissionError(
-                            f"Currently the device ({device}) is NOT OCCUPIED, it is currently in status {device_entry['status']}"
-                        )
-                if device_entry["task_id"] != ObjectId(task_id):
-                    device_task_id = str(device_entry["task_id"])
-                    raise PermissionError(
-                        f"Currently the task ({task_id}) "
-                        f"does not occupy this device: {device}, which is currently occupied by task {device_task_id}"
-                    )
+                self._check_device_occupied_by(device, task_id)
 
             result = self._device_view.execute_command(device, method, *args, **kwargs)
             response = {"status": "success", "result": result}
@@ -237,6 +425,43 @@ class DeviceManager:
 
         cb = partial(callback_publish, channel, delivery_tag, props, response)
         self.connection.add_callback_threadsafe(cb)
+        return response["status"] == "success"
+
+    def _check_device_occupied_by(self, device: str, task_id: str):
+        """Check if the device is occupied by the task in the database, raise ``PermissionError`` if not."""
+        device_entry: dict[str, Any] | None = self._device_view.get_device(device)
+        if device_entry is None:
+            raise PermissionError("There is no such device in the device view.")
+        if device_entry["status"] != DeviceTaskStatus.OCCUPIED.name:
+            # Wait a few seconds for the device to be OCCUPIED.
+            for _ in range(5):
+                time.sleep(1)
+                device_entry = self._device_view.get_device(device)
+                if device_entry["status"] == DeviceTaskStatus.OCCUPIED.name:
+                    break
+            if device_entry["status"] != DeviceTaskStatus.OCCUPIED.name:
+                raise PermissionError(
+                    f"Currently the device ({device}) is NOT OCCUPIED, it is currently in status {device_entry['status']}"
+                )
+        if device_entry["task_id"] != ObjectId(task_id):
+            device_task_id = str(device_entry["task_id"])
+            raise PermissionError(
+                f"Currently the task ({task_id}) "
+                f"does not occupy this device: {device}, which is currently occupied by task {device_task_id}"
+            )
+
+    def _execute_command_with_metrics(
+        self, received_at: float, device: str, method: str, *args, **kwargs
+    ):
+        started_at = time.perf_counter()
+        success = self._execute_command_wrapper(*args, **kwargs)
+        self.metrics.record(
+            device=device,
+            method=method,
+            queue_seconds=started_at - received_at,
+            call_seconds=time.perf_counter() - started_at,
+            success=success,
+        )
 
     def on_message(
         self,
@@ -260,23 +485,24 @@ class DeviceManager:
               "kwargs": Dict,
           }
         """
-        body: dict[str, Any] = dill.loads(_body)
-
-        thread = Thread(
-            target=self._execute_command_wrapper,
-            args=(
-                channel,
-                method.delivery_tag,
-                props,
-                body["device"],
-                body["method"],
-                body["task_id"],
-                *body["args"],
-            ),
-            kwargs=body["kwargs"],
+        received_at = time.perf_counter()
+        body: dict[str, Any] = get_codec(props.content_type).decode(_body)
+
+        self._executor.submit(
+            body["device"],
+            self._execute_command_with_metrics,
+            received_at,
+            body["device"],
+            body["method"],
+            channel,
+            method.delivery_tag,
+            props,
+            body["device"],
+            body["method"],
+            body["task_id"],
+            *body["args"],
+            **body["kwargs"],
         )
-        self.threads.append(thread)
-        thread.start()
 
 
 class DevicesClient:  # pylint: disable=too-many-instance-attributes
@@ -305,28 +531,15 @@ class DevicesClient:  # pylint: disable=too-many-instance-attributes
             self._rpc_queue_name = (
                 AlabOSConfig()["general"]["name"] + DEFAULT_SERVER_QUEUE_SUFFIX
             )
-        # self._rpc_reply_queue_name = ( str(task_id) + DEFAULT_CLIENT_QUEUE_SUFFIX )  # TODO does this have to be
-        #  taskid, or can be random? I think this dies with the resourcerequest context manager anyways?
-        self._rpc_reply_queue_name = str(uuid4()) + DEFAULT_CLIENT_QUEUE_SUFFIX
         self._task_id = task_id
-        self._waiting: dict[ObjectId, Future] = {}
-
-        self._conn = get_rabbitmq_connection()
-        self._channel = self._conn.channel()
-        self._channel.queue_declare(
-            self._rpc_reply_queue_name, exclusive=False, auto_delete=True
+        # the codec of the requests, the replies are decoded by their content type
+        self._codec = get_codec(
+            AlabOSConfig()
+            .get("device_manager", {})
+            .get("rpc_content_type", CONTENT_TYPE_MSGPACK)
         )
-
-        self._thread: Thread | None = None
-
-        self._channel.basic_consume(
-            queue=self._rpc_reply_queue_name,
-            on_message_callback=self.on_message,
-            auto_ack=True,
-        )
-        self._thread = Thread(target=self._channel.start_consuming)
-        self._thread.daemon = True
-        self._thread.start()
+        # all the clients in the process share one connection and one reply queue
+        _SharedRPCConnection.get()
 
         self._timeout = timeout
 
@@ -364,45 +577,128 @@ class DevicesClient:  # pylint: disable=too-many-instance-attributes
         -------
             the result of function
         """
-        assert self._conn and self._channel
+        connection = _SharedRPCConnection.get()
+        f = connection.call(
+            routing_key=self._rpc_queue_name,
+            body=self._codec.encode(
+                {
+                    "device": device_name,
+                    "method": method,
+                    "args": args,
+                    "kwargs": kwargs,
+                    "task_id": str(self._task_id),
+                }
+            ),
+            content_type=self._codec.content_type,
+        )
+        try:
+            return f.result(timeout=self._timeout)
+        except FutureTimeoutError:
+            connection.discard(f)
+            raise
+
+
+class _SharedRPCConnection:
+    """
+    The RabbitMQ connection shared by all the ``DevicesClient`` in a process.
+
+    The replies of all the calls are sent to one reply queue and dispatched to the
+    waiting futures by their ``correlation_id``. The connection is created again if it
+    is closed, or if the process is forked (pika connections cannot be shared across processes).
+    """
+
+    _instance: "_SharedRPCConnection | None" = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.reply_queue_name = str(uuid4()) + DEFAULT_CLIENT_QUEUE_SUFFIX
+        self._waiting: dict[str, Future] = {}
+        self._waiting_lock = threading.Lock()
 
+        self._conn = get_rabbitmq_connection()
+        self._channel = self._conn.channel()
+        self._channel.queue_declare(
+            self.reply_queue_name, exclusive=False, auto_delete=True
+        )
+        self._channel.basic_consume(
+            queue=self.reply_queue_name,
+            on_message_callback=self._on_message,
+            auto_ack=True,
+        )
+        self._thread = Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def get(cls) -> "_SharedRPCConnection":
+        """Get the connection of this process, create it if there is no open one."""
+        with cls._instance_lock:
+            instance = cls._instance
+            if (
+                instance is None
+                or instance.pid != os.getpid()
+                or not instance.is_open()
+            ):
+                cls._instance = instance = cls()
+            return instance
+
+    def is_open(self) -> bool:
+        """Whether the connection can still be used."""
+        return self._conn.is_open and self._thread.is_alive()
+
+    def call(self, routing_key: str, body: bytes, content_type: str) -> Future:
+        """Send a message and return a future of the decoded reply."""
+        correlation_id = str(ObjectId())
         f: Future = Future()
-        correlation_id = ObjectId()
-        self._waiting[correlation_id] = f
+        with self._waiting_lock:
+            self._waiting[correlation_id] = f
         self._conn.add_callback_threadsafe(
             lambda: self._channel.basic_publish(
                 exchange="",
-                routing_key=self._rpc_queue_name,
-                body=dill.dumps(
-                    {
-                        "device": device_name,
-                        "method": method,
-                        "args": args,
-                        "kwargs": kwargs,
-                        "task_id": str(self._task_id),
-                    }
-                ),
+                routing_key=routing_key,
+                body=body,
                 properties=BasicProperties(
-                    reply_to=self._rpc_reply_queue_name,
-                    content_type="application/python-dill",
-                    correlation_id=str(correlation_id),
+                    reply_to=self.reply_queue_name,
+                    content_type=content_type,
+                    correlation_id=correlation_id,
                 ),
             )
         )
-        return f.result()
+        return f
 
-    def on_message(
+    def discard(self, f: Future):
+        """Stop waiting for the reply of a call (e.g. after timeout)."""
+        with self._waiting_lock:
+            for correlation_id, waiting_f in list(self._waiting.items()):
+                if waiting_f is f:
+                    del self._waiting[correlation_id]
+
+    def _consume(self):
+        try:
+            self._channel.start_consuming()
+        finally:
+            # no reply will arrive anymore
+            with self._waiting_lock:
+                waiting, self._waiting = self._waiting, {}
+            for f in waiting.values():
+                f.set_exception(ConnectionError("The RabbitMQ connection is closed."))
+
+    def _on_message(
         self,
-        channel: BlockingChannel,
+        channel: BlockingChannel,  # pylint: disable=unused-argument
         method_frame: Basic.Deliver,  # pylint: disable=unused-argument
         properties: BasicProperties,
         _body: bytes,
     ):
         """Callback function to handle a returned message from Device Manager."""
-        f = self._waiting.pop(ObjectId(properties.correlation_id))
+        with self._waiting_lock:
+            f = self._waiting.pop(properties.correlation_id, None)
+        if f is None:
+            # the caller has given up waiting
+            return
 
         try:
-            body = dill.loads(_body)
+            body = get_codec(properties.content_type).decode(_body)
 
             if body["status"] == "success":
                 f.set_result(body["result"])
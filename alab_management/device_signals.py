@@ -0,0 +1,562 @@
+"""
+The storage of the device signals (e.g. the temperature of a furnace), which are logged by the methods decorated
+with ``@log_signal`` or by ``DBLogger.log_device_signal``.
+
+The signals are stored in a MongoDB time-series collection ``device_signals`` (one document per reading,
+with ``meta = {"device_name", "signal_name"}``), so that they are bucketed and compressed by the server and
+do not bloat the ``logs`` collection. The numeric readings are also aggregated into ``device_signals_rollup``
+(min/max/mean/count per ``rollup_seconds``), which is kept much longer than the raw readings.
+
+The retention is set in the config file:
+
+.. code-block:: toml
+
+  [device_signals]
+  retention_days = 30  # the raw readings
+  rollup_seconds = 60
+  rollup_retention_days = 365
+
+If MongoDB does not support time-series collections (< 5.0), a regular collection with a TTL index is used.
+"""
+
+import atexit
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from numbers import Real
+from typing import Any
+
+import numpy as np
+import pymongo
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure
+
+from alab_management.config import AlabOSConfig
+from alab_management.logger import get_log_buffer
+from alab_management.utils.data_objects import get_collection, get_db
+
+SIGNAL_COLLECTION = "device_signals"
+ROLLUP_COLLECTION = "device_signals_rollup"
+LATEST_COLLECTION = "device_signal_latest"
+# the target number of readings in one document of the columnar aggregation (see ``get_signal_array``),
+# about 2 MB per document, far below the 16 MB limit of MongoDB even if the readings are not evenly spread
+_ARRAY_CHUNK_SIZE = 65536
+
+
+class DeviceSignalStore:
+    """
+    Write and read the device signals.
+
+    There is one store in every process (see ``get_device_signal_store``), which keeps the rollups of the
+    current time window in memory. A rollup is written (merged with ``$min``/``$max``/``$inc``, so that
+    several processes can log the same signal) when a reading of the next window arrives, when
+    :py:meth:`flush` is called and at exit.
+
+    The last reading of every signal is also upserted into ``device_signal_latest`` (one document per
+    device and signal) and cached in the process for ``latest_cache_seconds``, so that
+    :py:meth:`get_latest` does not query the readings.
+    """
+
+    def __init__(self):
+        config = AlabOSConfig().get("device_signals", {})
+        self.retention = timedelta(days=config.get("retention_days", 30))
+        self.rollup_seconds = config.get("rollup_seconds", 60)
+        self.rollup_retention = timedelta(days=config.get("rollup_retention_days", 365))
+        self.latest_cache_seconds = config.get("latest_cache_seconds", 1.0)
+
+        self._signal_collection = self._create_signal_collection()
+        self._signal_collection.create_index(
+            [
+                ("meta.device_name", pymongo.ASCENDING),
+                ("meta.signal_name", pymongo.ASCENDING),
+                ("timestamp", pymongo.DESCENDING),
+            ]
+        )
+        self._rollup_collection = get_collection(ROLLUP_COLLECTION)
+        self._rollup_collection.create_index(
+            [
+                ("device_name", pymongo.ASCENDING),
+                ("signal_name", pymongo.ASCENDING),
+                ("timestamp", pymongo.ASCENDING),
+            ],
+            unique=True,
+        )
+        self._rollup_collection.create_index(
+            "timestamp",
+            expireAfterSeconds=int(self.rollup_retention.total_seconds()),
+        )
+        self._latest_collection = get_collection(LATEST_COLLECTION)
+        self._latest_collection.create_index(
+            [("device_name", pymongo.ASCENDING), ("signal_name", pymongo.ASCENDING)],
+            unique=True,
+        )
+        self._buffer = get_log_buffer(SIGNAL_COLLECTION)
+
+        # (device name, signal name) -> the rollup of the current window
+        self._pending_rollups: dict[tuple[str, str], dict[str, Any]] = {}
+        # (device name, signal name) -> (the time it expires, the last reading)
+        self._latest_cache: dict[tuple[str, str], tuple[float, dict[str, Any]]] = {}
+        # (device name, signal name) -> the last reading that is not written yet, if the readings are buffered
+        self._pending_latest: dict[tuple[str, str], dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if self._buffer is not None:
+            self._buffer.flush_callbacks.append(self._write_pending_latest)
+
+    def _create_signal_collection(self):
+        db = get_db()
+        if SIGNAL_COLLECTION not in db.list_collection_names(
+            filter={"name": SIGNAL_COLLECTION}
+        ):
+            try:
+                db.create_collection(
+                    SIGNAL_COLLECTION,
+                    timeseries={
+                        "timeField": "timestamp",
+                        "metaField": "meta",
+                        "granularity": "seconds",
+                    },
+                    expireAfterSeconds=int(self.retention.total_seconds()),
+                )
+            except CollectionInvalid:
+                # created by another process in the meantime
+                pass
+            except OperationFailure:
+                # time-series collections are not supported by the server
+                db[SIGNAL_COLLECTION].create_index(
+                    "timestamp",
+                    expireAfterSeconds=int(self.retention.total_seconds()),
+                )
+        return db[SIGNAL_COLLECTION]
+
+    def log(
+        self,
+        device_name: str,
+        signal_name: str,
+        value: Any,
+        timestamp: datetime | None = None,
+    ) -> ObjectId:
+        """Store a reading of a signal. The numeric readings are added to the rollups."""
+        timestamp = timestamp or datetime.now()
+        entry = {
+            "_id": ObjectId(),
+            "meta": {"device_name": device_name, "signal_name": signal_name},
+            "timestamp": timestamp,
+            "value": value,
+        }
+        if self._buffer is not None:
+            self._buffer.put(entry)
+        else:
+            self._signal_collection.insert_one(entry)
+
+        latest = {
+            "device_name": device_name,
+            "signal_name": signal_name,
+            "value": value,
+            "timestamp": timestamp,
+        }
+        key = (device_name, signal_name)
+        with self._lock:
+            cached = self._latest_cache.get(key)
+            if cached is None or cached[1]["timestamp"] <= timestamp:
+                self._latest_cache[key] = (
+                    time.monotonic() + self.latest_cache_seconds,
+                    latest,
+                )
+            if self._buffer is not None:
+                pending = self._pending_latest.get(key)
+                if pending is None or pending["timestamp"] <= timestamp:
+                    self._pending_latest[key] = latest
+        if self._buffer is None:
+            self._upsert_latest([latest])
+
+        if isinstance(value, Real) and not isinstance(value, bool):
+            self._add_to_rollup(device_name, signal_name, float(value), timestamp)
+        return entry["_id"]
+
+    def _add_to_rollup(
+        self, device_name: str, signal_name: str, value: float, timestamp: datetime
+    ):
+        window = datetime.fromtimestamp(
+            timestamp.timestamp() // self.rollup_seconds * self.rollup_seconds
+        )
+        key = (device_name, signal_name)
+        with self._lock:
+            rollup = self._pending_rollups.get(key)
+            if rollup is not None and rollup["timestamp"] != window:
+                finished = self._pending_rollups.pop(key)
+                rollup = None
+            else:
+                finished = None
+            if rollup is None:
+                rollup = self._pending_rollups[key] = {
+                    "timestamp": window,
+                    "min": value,
+                    "max": value,
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            rollup["min"] = min(rollup["min"], value)
+            rollup["max"] = max(rollup["max"], value)
+            rollup["sum"] += value
+            rollup["count"] += 1
+        if finished is not None:
+            self._write_rollups({key: finished})
+
+    def _write_rollups(self, rollups: dict[tuple[str, str], dict[str, Any]]):
+        if not rollups:
+            return
+        self._rollup_collection.bulk_write(
+            [
+                pymongo.UpdateOne(
+                    {
+                        "device_name": device_name,
+                        "signal_name": signal_name,
+                        "timestamp": rollup["timestamp"],
+                    },
+                    {
+                        "$min": {"min": rollup["min"]},
+                        "$max": {"max": rollup["max"]},
+                        "$inc": {"sum": rollup["sum"], "count": rollup["count"]},
+                        "$setOnInsert": {"interval_seconds": self.rollup_seconds},
+                    },
+                    upsert=True,
+                )
+                for (device_name, signal_name), rollup in rollups.items()
+            ],
+            ordered=False,
+        )
+
+    def _upsert_latest(self, readings: list[dict[str, Any]]):
+        """Store the readings as the last ones of their signals, unless newer readings are stored."""
+        if not readings:
+            return
+        try:
+            self._latest_collection.bulk_write(
+                [
+                    pymongo.UpdateOne(
+                        {
+                            "device_name": reading["device_name"],
+                            "signal_name": reading["signal_name"],
+                            "timestamp": {"$lte": reading["timestamp"]},
+                        },
+                        {
+                            "$set": {
+                                "value": reading["value"],
+                                "timestamp": reading["timestamp"],
+                            }
+                        },
+                        upsert=True,
+                    )
+                    for reading in readings
+                ],
+                ordered=False,
+            )
+        except BulkWriteError as error:
+            # the duplicate key errors mean that a newer reading is stored (e.g. by another process)
+            if any(e["code"] != 11000 for e in error.details["writeErrors"]):
+                raise
+
+    def _write_pending_latest(self):
+        with self._lock:
+            readings, self._pending_latest = self._pending_latest, {}
+        self._upsert_latest(list(readings.values()))
+
+    def flush(self):
+        """Write the buffered readings and the rollups of the current window to the database."""
+        if self._buffer is not None:
+            self._buffer.flush()
+        with self._lock:
+            rollups, self._pending_rollups = self._pending_rollups, {}
+        self._write_rollups(rollups)
+
+    def get_latest(self, device_name: str, signal_name: str) -> dict[str, Any]:
+        """
+        Get the last reading of a signal, in the form of ``{"device_name", "signal_name", "value", "timestamp"}``.
+        The value is None if the signal has never been logged.
+
+        The result may be up to ``latest_cache_seconds`` old if the signal is logged by another process.
+        """
+        key = (device_name, signal_name)
+        with self._lock:
+            cached = self._latest_cache.get(key)
+            has_pending = key in self._pending_latest
+        if cached is not None and cached[0] > time.monotonic():
+            return dict(cached[1])
+        if has_pending:
+            self._write_pending_latest()
+
+        result = self._latest_collection.find_one(
+            {"device_name": device_name, "signal_name": signal_name}
+        )
+        if result is None:
+            # the signal may be logged before the last readings are stored separately
+            if self._buffer is not None:
+                self._buffer.flush()
+            result = self._signal_collection.find_one(
+                {"meta.device_name": device_name, "meta.signal_name": signal_name},
+                sort=[("timestamp", pymongo.DESCENDING)],
+            )
+        latest = {
+            "device_name": device_name,
+            "signal_name": signal_name,
+            "value": result["value"] if result is not None else None,
+            "timestamp": (
+                result["timestamp"] if result is not None else datetime.now()
+            ),
+        }
+        with self._lock:
+            self._latest_cache[key] = (
+                time.monotonic() + self.latest_cache_seconds,
+                latest,
+            )
+        return dict(latest)
+
+    def get_signal(
+        self, device_name: str, signal_name: str, within: timedelta
+    ) -> dict[str, Any]:
+        """
+        Get the readings of a signal within a range of time, in the form of
+        ``{"device_name", "signal_name", "timestamp": [...], "value": [...]}`` (oldest first).
+        """
+        if self._buffer is not None:
+            self._buffer.flush()
+        result = self._signal_collection.find(
+            {
+                "meta.device_name": device_name,
+                "meta.signal_name": signal_name,
+                "timestamp": {"$gte": datetime.now() - within},
+            },
+            projection={"_id": False, "timestamp": True, "value": True},
+            sort=[("timestamp", pymongo.ASCENDING)],
+        )
+        data: dict[str, Any] = {
+            "device_name": device_name,
+            "signal_name": signal_name,
+            "timestamp": [],
+            "value": [],
+        }
+        for entry in result:
+            data["timestamp"].append(entry["timestamp"])
+            data["value"].append(entry["value"])
+        return data
+
+    def get_rollups(
+        self, device_name: str, signal_name: str, within: timedelta
+    ) -> dict[str, Any]:
+        """
+        Get the rollups of a numeric signal within a range of time, in the form of
+        ``{"device_name", "signal_name", "timestamp": [...], "min": [...], "max": [...], "mean": [...],
+        "count": [...]}`` (oldest first). The timestamp is the start of each window.
+        """
+        self.flush()
+        result = self._rollup_collection.find(
+            {
+                "device_name": device_name,
+                "signal_name": signal_name,
+                "timestamp": {"$gte": datetime.now() - within},
+            },
+            sort=[("timestamp", pymongo.ASCENDING)],
+        )
+        data: dict[str, Any] = {
+            "device_name": device_name,
+            "signal_name": signal_name,
+            "timestamp": [],
+            "min": [],
+            "max": [],
+            "mean": [],
+            "count": [],
+        }
+        for entry in result:
+            data["timestamp"].append(entry["timestamp"])
+            data["min"].append(entry["min"])
+            data["max"].append(entry["max"])
+            data["mean"].append(entry["sum"] / entry["count"])
+            data["count"].append(entry["count"])
+        return data
+
+    def get_signal_array(
+        self,
+        device_name: str,
+        signal_name: str,
+        within: timedelta | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        max_points: int | None = None,
+    ) -> dict[str, Any]:
+        """
+        Get the readings of a signal as NumPy arrays, which is much faster than :py:meth:`get_signal` for
+        long ranges of time.
+
+        The result is ``{"device_name", "signal_name", "timestamp": datetime64[ms] array, "value": float64 array}``
+        (oldest first). The readings that are not numbers are NaN.
+
+        If ``max_points`` is given, the readings are downsampled by the database into at most ``max_points``
+        time buckets of the same length, and ``value`` is the mean of each bucket, with the ``min``, ``max`` and
+        ``count`` arrays in addition. The timestamp is the start of each bucket, and the empty buckets are
+        skipped. The rollups are used instead of the raw readings if the buckets are longer than the rollups.
+
+        Args:
+            device_name: the name of the device
+            signal_name: the name of the signal
+            within: how far back from ``end`` to get the readings, if ``start`` is not given
+            start: the start of the range of time
+            end: the end of the range of time, now by default
+            max_points: the max number of points to return
+        """
+        end = end or datetime.now()
+        if start is None:
+            if within is None:
+                raise ValueError("Either within or start must be given.")
+            start = end - within
+        if max_points is not None:
+            return self._get_downsampled_array(
+                device_name, signal_name, start, end, max_points
+            )
+
+        if self._buffer is not None:
+            self._buffer.flush()
+        match = {
+            "meta.device_name": device_name,
+            "meta.signal_name": signal_name,
+            "timestamp": {"$gte": start, "$lte": end},
+        }
+        # the readings are packed into columns by the database: every chunk of time is one document with
+        # the arrays of the timestamps (ms after ``start``) and the values, so only a few documents are
+        # decoded instead of one per reading. The chunks are sized by the number of readings in the range.
+        span_ms = max(math.ceil((end - start) / timedelta(milliseconds=1)), 1)
+        chunks = math.ceil(
+            self._signal_collection.count_documents(match) / _ARRAY_CHUNK_SIZE
+        )
+        chunk_ms = max(math.ceil(span_ms / max(chunks, 1)), 1)
+        offset = {"$subtract": ["$timestamp", start]}
+        documents = self._signal_collection.aggregate(
+            [
+                {"$match": match},
+                {"$sort": {"timestamp": pymongo.ASCENDING}},
+                {
+                    "$group": {
+                        "_id": {"$floor": {"$divide": [offset, chunk_ms]}},
+                        "timestamp": {"$push": offset},
+                        # the readings that are not numbers are NaN, $add converts the integers to doubles
+                        "value": {
+                            "$push": {
+                                "$cond": [
+                                    {"$isNumber": "$value"},
+                                    {"$add": ["$value", 0.0]},
+                                    {"$literal": math.nan},
+                                ]
+                            }
+                        },
+                    }
+                },
+                {"$sort": {"_id": pymongo.ASCENDING}},
+            ],
+            allowDiskUse=True,
+        )
+        timestamps = [np.empty(0, dtype=np.int64)]
+        values = [np.empty(0, dtype=np.float64)]
+        for document in documents:
+            timestamps.append(np.asarray(document["timestamp"], dtype=np.int64))
+            values.append(np.asarray(document["value"], dtype=np.float64))
+        return {
+            "device_name": device_name,
+            "signal_name": signal_name,
+            "timestamp": np.datetime64(start, "ms")
+            + np.concatenate(timestamps).astype("timedelta64[ms]"),
+            "value": np.concatenate(values),
+        }
+
+    def _get_downsampled_array(
+        self,
+        device_name: str,
+        signal_name: str,
+        start: datetime,
+        end: datetime,
+        max_points: int,
+    ) -> dict[str, Any]:
+        """Group the readings into ``max_points`` time buckets in the database (see ``get_signal_array``)."""
+        if max_points < 1:
+            raise ValueError("max_points must be at least 1.")
+        bucket_ms = max(
+            math.ceil((end - start) / timedelta(milliseconds=1) / max_points), 1
+        )
+        if bucket_ms >= self.rollup_seconds * 1000:
+            self.flush()
+            collection = self._rollup_collection
+            match = {"device_name": device_name, "signal_name": signal_name}
+            accumulators = {
+                "sum": {"$sum": "$sum"},
+                "count": {"$sum": "$count"},
+                "min": {"$min": "$min"},
+                "max": {"$max": "$max"},
+            }
+        else:
+            if self._buffer is not None:
+                self._buffer.flush()
+            collection = self._signal_collection
+            match = {
+                "meta.device_name": device_name,
+                "meta.signal_name": signal_name,
+                "value": {"$type": "number"},
+            }
+            accumulators = {
+                "sum": {"$sum": "$value"},
+                "count": {"$sum": 1},
+                "min": {"$min": "$value"},
+                "max": {"$max": "$value"},
+            }
+        buckets = list(
+            collection.aggregate(
+                [
+                    {"$match": {**match, "timestamp": {"$gte": start, "$lte": end}}},
+                    {
+                        "$group": {
+                            "_id": {
+                                "$floor": {
+                                    "$divide": [
+                                        {"$subtract": ["$timestamp", start]},
+                                        bucket_ms,
+                                    ]
+                                }
+                            },
+                            **accumulators,
+                        }
+                    },
+                    {"$sort": {"_id": pymongo.ASCENDING}},
+                ]
+            )
+        )
+        index = np.array([bucket["_id"] for bucket in buckets], dtype=np.int64)
+        count = np.array([bucket["count"] for bucket in buckets], dtype=np.int64)
+        return {
+            "device_name": device_name,
+            "signal_name": signal_name,
+            "timestamp": np.datetime64(start, "ms")
+            + index * np.timedelta64(bucket_ms, "ms"),
+            "value": np.array([bucket["sum"] for bucket in buckets], dtype=np.float64)
+            / np.maximum(count, 1),
+            "min": np.array([bucket["min"] for bucket in buckets], dtype=np.float64),
+            "max": np.array([bucket["max"] for bucket in buckets], dtype=np.float64),
+            "count": count,
+        }
+
+
+_device_signal_store: DeviceSignalStore | None = None
+_device_signal_store_lock = threading.Lock()
+
+
+def get_device_signal_store() -> DeviceSignalStore:
+    """Get the device signal store of this process."""
+    global _device_signal_store
+    with _device_signal_store_lock:
+        if _device_signal_store is None:
+            _device_signal_store = DeviceSignalStore()
+            atexit.register(_device_signal_store.flush)
+    return _device_signal_store
+
+
+def flush_device_signals():
+    """Write the buffered device signals of this process to the database, if any has been logged."""
+    if _device_signal_store is not None:
+        _device_signal_store.flush()
@@ -3,15 +3,16 @@
 import datetime
 import functools
 import os
-import threading
-import time
 from abc import ABC, abstractmethod
 from collections.abc import Callable
-from queue import Empty, PriorityQueue
 from traceback import format_exc
 from typing import Any
 from unittest.mock import Mock
 
+from alab_management.device_view.signal_scheduler import (
+    SignalStats,
+    get_signal_scheduler,
+)
 from alab_management.logger import DBLogger
 from alab_management.sample_view.sample import SamplePosition
 from alab_management.user_input import request_maintenance_input
@@ -380,7 +381,11 @@ class BaseDevice(ABC):
         return request_maintenance_input(prompt=prompt, options=options)
 
     def retrieve_signal(
-        self, signal_name: str, within: datetime.timedelta | None = None
+        self,
+        signal_name: str,
+        within: datetime.timedelta | None = None,
+        as_array: bool = False,
+        max_points: int | None = None,
     ):
         """
         Retrieve a signal from the database.
@@ -390,6 +395,10 @@ class BaseDevice(ABC):
               ``@log_device_signal`` decorator
             within (Optional[datetime.timedelta], optional):
               timedelta defining how far back to pull logs from (relative to current time). Defaults to None.
+            as_array (bool): return the timestamps and values as NumPy arrays (datetime64 and float64), which is
+              much faster for long ranges of time. Only used if ``within`` is given.
+            max_points (Optional[int]): downsample the signal to at most ``max_points`` points (the mean of
+              each time bucket, see ``DeviceSignalStore.get_signal_array``). Implies ``as_array``.
 
         Returns
         -------
@@ -398,7 +407,9 @@ class BaseDevice(ABC):
             "value": "signal_value" or ["signal_value_1", "signal_value_2", ...]], "timestamp": "timestamp" or [
             "timestamp_1", "timestamp_2", ...] }
         """
-        return self._signalemitter.retrieve_signal(signal_name, within)
+        return self._signalemitter.retrieve_signal(
+            signal_name, within, as_array=as_array, max_points=max_points
+        )
 
 
 # DeviceSignalEmitter and related decorator #
@@ -430,6 +441,10 @@ class DeviceSignalEmitter:
     """
     This class is responsible for periodically logging device signals to the database.
     It is intended to be used as a singleton, and should be instantiated once per device.
+
+    The signals of all the devices are read by the lab-wide
+    :py:class:`SignalScheduler <alab_management.device_view.signal_scheduler.SignalScheduler>`,
+    which the emitter registers the signals of its device with when it starts.
     """
 
     def __init__(self, device: BaseDevice):
@@ -439,10 +454,6 @@ class DeviceSignalEmitter:
         self.dblogger = DBLogger(task_id=None)
         self.device = device
         self.is_logging = False
-        self.queue: PriorityQueue = PriorityQueue()
-
-        self._logging_thread: threading.Thread | None = None
-        self._start_time: datetime.datetime | None = None
 
     def get_methods_to_log(self):
         """
@@ -468,61 +479,6 @@ class DeviceSignalEmitter:
                 }
         return methods_to_log
 
-    def _worker(self):
-        """This is the worker thread that will periodically log device signals to the database."""
-
-        def wait_with_option_to_kill(time_to_wait: float):
-            """
-            Waits until the next log is due, or until the logging is stopped. When stopping
-            the logging worker, the worker will complete its current logging task before
-            stopping the worker thread. This may result in long blockages if the logging
-            interval is long. This function will allow the worker to periodically check if
-            it should stop mid-wait to avoid this issue.
-
-            Args:
-                time_to_wait (float): The total time to wait, assuming the logging worker is not stopped.
-            """
-            if time_to_wait < 0:
-                # we are behind schedule, don't wait at all!
-                return
-
-            total_time_to_wait = time_to_wait
-            while total_time_to_wait > 0:
-                if not self.is_logging:
-                    return
-                time_to_wait = min(
-                    total_time_to_wait, 0.2
-                )  # we will wait 0.2 second at a time
-                total_time_to_wait -= time_to_wait
-                time.sleep(time_to_wait)
-
-        if len(self.get_methods_to_log()) == 0:
-            return  # no need to run if we aren't logging any methods
-
-        while True:
-            # we check if logging is active within the loop. This is to allow the logging worker
-            # to be stopped mid-wait if necessary. Prevents us blocking a `.stop()` call if stuck
-            # waiting to log method on a long interval.
-            try:
-                log_at, method_name, signal_name, interval, count = self.queue.get(
-                    block=False
-                )
-            except Empty:
-                # wait for queue to refill. We shouldn't reach this under normal circumstances
-                time.sleep(1)
-                continue
-            time_until_this_log = (log_at - datetime.datetime.now()).total_seconds()
-            wait_with_option_to_kill(time_until_this_log)
-            if not self.is_logging:
-                break
-            self.log_method_to_db(method_name=method_name, signal_name=signal_name)
-
-            count += 1
-            next_log_at = self._start_time + datetime.timedelta(
-                seconds=interval * count
-            )
-            self.queue.put((next_log_at, method_name, signal_name, interval, count))
-
     def log_method_to_db(self, method_name: str, signal_name: str):
         """
         Logs a method to the database. This is called by the worker thread.
@@ -552,41 +508,45 @@ class DeviceSignalEmitter:
 
     def start(self):
         """
-        Start the logging worker thread. This will start logging all
-        methods decorated with `@log_signal` to the database.
+        Start logging all methods decorated with `@log_signal` to the database, by registering them
+        with the signal scheduler.
         """
-        self.queue = PriorityQueue()
+        scheduler = get_signal_scheduler()
         for method_name, logging_properties in self.get_methods_to_log().items():
-            # queue items are tuples of the form:
-            # tuple(
-            #      0. timestamp of next log,
-            #      1. method name (to get value from device),
-            #      2. signal name (what to call this in the database),
-            #      3. interval (seconds),
-            #      4. count (how many times this has been logged since starting)
-            #  )
-            self.queue.put(
-                (
-                    datetime.datetime.now()
-                    + datetime.timedelta(seconds=logging_properties["interval"]),
-                    method_name,
-                    logging_properties["signal_name"],
-                    logging_properties["interval"],
-                    1,
-                )
+            scheduler.add(
+                key=self.device.name,
+                name=logging_properties["signal_name"],
+                interval=logging_properties["interval"],
+                fn=functools.partial(
+                    self.log_method_to_db,
+                    method_name=method_name,
+                    signal_name=logging_properties["signal_name"],
+                ),
             )
         self.is_logging = True
-        self._logging_thread = threading.Thread(target=self._worker)
-        self._start_time = datetime.datetime.now()
-
-        self._logging_thread.start()
 
     def stop(self):
-        """Stop the logging worker thread. This will stop logging all."""
+        """Stop logging all the signals of the device. The readings that are running are finished first."""
+        if self.is_logging:
+            get_signal_scheduler().remove(self.device.name)
         self.is_logging = False
-        self._logging_thread.join()
 
-    def retrieve_signal(self, signal_name, within: datetime.timedelta | None = None):
+    def get_stats(self) -> dict[str, SignalStats]:
+        """Get the timing statistics (e.g. the missed and late readings) of the signals, by signal name."""
+        return {
+            signal_name: stats
+            for (_, signal_name), stats in get_signal_scheduler()
+            .get_stats(self.device.name)
+            .items()
+        }
+
+    def retrieve_signal(
+        self,
+        signal_name,
+        within: datetime.timedelta | None = None,
+        as_array: bool = False,
+        max_points: int | None = None,
+    ):
         """Retrieve a signal from the database.
 
         Args:
@@ -594,6 +554,8 @@ class DeviceSignalEmitter:
               passed to the `@log_device_signal` decorator
             within (Optional[datetime.timedelta]): timedelta defining
               how far back to pull logs from (relative to current time). Defaults to None.
+            as_array (bool): return NumPy arrays instead of lists. Only used if ``within`` is given.
+            max_points (Optional[int]): downsample the signal to at most ``max_points`` points. Implies ``as_array``.
 
         Returns
         -------
@@ -612,6 +574,13 @@ class DeviceSignalEmitter:
             return self.dblogger.get_latest_device_signal(
                 device_name=self.device.name, signal_name=signal_name
             )
+        elif as_array or max_points is not None:
+            return self.dblogger.get_device_signal_array(
+                device_name=self.device.name,
+                signal_name=signal_name,
+                within=within,
+                max_points=max_points,
+            )
         else:
             return self.dblogger.filter_device_signal(
                 device_name=self.device.name, signal_name=signal_name, within=within
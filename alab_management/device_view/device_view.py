@@ -1,6 +1,5 @@
 """Wrapper over the ``devices`` collection."""
 
-import time
 from collections.abc import Collection
 from datetime import datetime
 from enum import Enum, auto, unique
@@ -8,9 +7,10 @@ from typing import Any, TypeVar, cast
 
 import pymongo  # type: ignore
 from bson import ObjectId  # type: ignore
+from pymongo import UpdateOne, WriteConcern
 
 from alab_management.sample_view import SamplePosition, SampleView
-from alab_management.utils.data_objects import get_collection, get_lock
+from alab_management.utils.data_objects import get_collection
 
 from .device import BaseDevice, get_all_devices
 
@@ -58,8 +58,11 @@ class DeviceView:
         """
         self._device_collection = get_collection("devices")
         self._device_collection.create_index([("name", pymongo.HASHED)])
+        # the occupation/release of devices are confirmed by the write concern instead of re-reading
+        self._device_collection_majority = self._device_collection.with_options(
+            write_concern=WriteConcern(w="majority")
+        )
         self._device_list = get_all_devices()
-        self._lock = get_lock(self._device_collection.name)
         self.__connected_to_devices = False
         self._sample_view = SampleView()
 
@@ -164,6 +167,10 @@ class DeviceView:
         .. note::
             There should be no duplicated devices in the ``device_type``, or a ``ValueError`` shall be raised
 
+        .. note::
+            This method only reads the database. The devices are not reserved until they are occupied
+            with ``occupy_devices``, which only succeeds if they are still available.
+
         Args:
             task_id (ObjectId): the id of task that requests these devices
             device_names_str (Optional[Collection[str]]): the requested
@@ -187,40 +194,39 @@ class DeviceView:
             )
 
         idle_devices: dict[str, dict[str, str | bool]] = {}
-        with self._lock():  # pylint: disable=not-callable
-            for device_name in device_names_str:
-                result = self.get_available_devices(
-                    device_str=device_name, type_or_name="name", task_id=task_id
-                )
-                if not result:
-                    return None  # cannot meet all requirement, return None
-                idle_devices[device_name] = result[0]
-            for device in device_types_str:
-                result = self.get_available_devices(
-                    device_str=device, type_or_name="type", task_id=task_id
-                )
-                if not result:
-                    return None
-                same_task_devices = list(
-                    filter(lambda device_: not device_["need_release"], result)
-                )
-                if len(same_task_devices) > 0:
-                    # just pick the first device
-                    idle_devices[device] = same_task_devices[0]
-                else:
-                    # if no device is held by the same task, pick the device with least samples
-                    minimum_number_of_samples = 999999999
-                    for device_ in result:
-                        samples_on_device_ = self._sample_view.get_samples_on_device(
-                            device_["name"]
-                        )
-                        number_of_samples_in_device_ = sum(
-                            len(samples) for samples in samples_on_device_.values()
-                        )
-                        if number_of_samples_in_device_ < minimum_number_of_samples:
-                            minimum_number_of_samples = number_of_samples_in_device_
-                            idle_devices[device] = device_
-            return idle_devices
+        for device_name in device_names_str:
+            result = self.get_available_devices(
+                device_str=device_name, type_or_name="name", task_id=task_id
+            )
+            if not result:
+                return None  # cannot meet all requirement, return None
+            idle_devices[device_name] = result[0]
+        for device in device_types_str:
+            result = self.get_available_devices(
+                device_str=device, type_or_name="type", task_id=task_id
+            )
+            if not result:
+                return None
+            same_task_devices = list(
+                filter(lambda device_: not device_["need_release"], result)
+            )
+            if len(same_task_devices) > 0:
+                # just pick the first device
+                idle_devices[device] = same_task_devices[0]
+            else:
+                # if no device is held by the same task, pick the device with least samples
+                minimum_number_of_samples = 999999999
+                for device_ in result:
+                    samples_on_device_ = self._sample_view.get_samples_on_device(
+                        device_["name"]
+                    )
+                    number_of_samples_in_device_ = sum(
+                        len(samples) for samples in samples_on_device_.values()
+                    )
+                    if number_of_samples_in_device_ < minimum_number_of_samples:
+                        minimum_number_of_samples = number_of_samples_in_device_
+                        idle_devices[device] = device_
+        return idle_devices
 
     def get_samples_on_device(self, device_name: str) -> dict[str, list[ObjectId]]:
         """
@@ -307,19 +313,53 @@ class DeviceView:
 
     def occupy_device(self, device: BaseDevice | str, task_id: ObjectId):
         """Occupy a device with given task id."""
-        self._update_status(
-            device=device,
-            required_status=DeviceTaskStatus.IDLE,
-            target_status=DeviceTaskStatus.OCCUPIED,
-            task_id=task_id,
+        self.occupy_devices(devices=[device], task_id=task_id)
+
+    def occupy_devices(self, devices: list[BaseDevice | str], task_id: ObjectId):
+        """
+        Occupy a list of devices with given task id in one ``bulk_write``.
+
+        A device can only be occupied if it is IDLE and not paused, or already held by the same task.
+        The write is acknowledged by the majority of the replica set, so there is no need
+        to wait for the change to be visible.
+        """
+        device_names = [
+            device.name if isinstance(device, BaseDevice) else device
+            for device in devices
+        ]
+        if not device_names:
+            return
+        result = self._device_collection_majority.bulk_write(
+            [
+                UpdateOne(
+                    {
+                        "name": device_name,
+                        "$or": [
+                            {"task_id": task_id},
+                            {
+                                "status": DeviceTaskStatus.IDLE.name,
+                                "pause_status": DevicePauseStatus.RELEASED.name,
+                            },
+                        ],
+                    },
+                    {
+                        "$set": {
+                            "status": DeviceTaskStatus.OCCUPIED.name,
+                            "task_id": task_id,
+                            "last_updated": datetime.now(),
+                        }
+                    },
+                )
+                for device_name in device_names
+            ],
+            ordered=False,
         )
-        device_name = device.name if isinstance(device, BaseDevice) else device
-        # Wait until the device status has been updated to OCCUPIED
-        while (
-            self.get_status(device_name=device_name).name
-            != DeviceTaskStatus.OCCUPIED.name
-        ):
-            time.sleep(0.5)
+        if result.matched_count != len(device_names):
+            self._raise_for_unchanged_devices(
+                device_names=device_names,
+                task_id=task_id,
+                target_status=DeviceTaskStatus.OCCUPIED,
+            )
 
     def get_devices_by_task(self, task_id: ObjectId | None) -> list[BaseDevice]:
         """Get devices given a task id (regardless of its status!)."""
@@ -334,31 +374,99 @@ class DeviceView:
 
         device: name of device to be released
         """
-        device_entry = self.get_device(device_name=device_name)
+        self.release_devices(device_names=[device_name])
+
+    def release_devices(self, device_names: list[str], task_id: ObjectId | None = None):
+        """
+        Release a list of devices in one ``bulk_write``.
 
+        If the pause of a device has been requested, it will be paused after being released.
+
+        Args:
+            device_names: the names of the devices to release
+            task_id: if provided, only release the devices that are held by this task (used to roll back
+              a failed occupation), and the other devices are skipped without error.
+        """
+        if not device_names:
+            return
+        task_filter = {} if task_id is None else {"task_id": task_id}
         update_dict = {
             "task_id": None,
             "last_updated": datetime.now(),
             "status": DeviceTaskStatus.IDLE.name,
         }
-
-        if (
-            DevicePauseStatus[device_entry["pause_status"]]
-            == DevicePauseStatus.REQUESTED
-        ):
-            update_dict.update(
-                {
-                    "pause_status": DevicePauseStatus.PAUSED.name,
-                }
+        operations = []
+        for device_name in device_names:
+            # exactly one of the two operations will match an existing device
+            operations.append(
+                UpdateOne(
+                    {
+                        "name": device_name,
+                        "pause_status": {"$ne": DevicePauseStatus.REQUESTED.name},
+                        **task_filter,
+                    },
+                    {"$set": update_dict},
+                )
+            )
+            operations.append(
+                UpdateOne(
+                    {
+                        "name": device_name,
+                        "pause_status": DevicePauseStatus.REQUESTED.name,
+                        **task_filter,
+                    },
+                    {
+                        "$set": {
+                            **update_dict,
+                            "pause_status": DevicePauseStatus.PAUSED.name,
+                        }
+                    },
+                )
+            )
+        result = self._device_collection_majority.bulk_write(operations, ordered=True)
+        if task_id is None and result.matched_count != len(device_names):
+            self._raise_for_unchanged_devices(
+                device_names=device_names,
+                task_id=None,
+                target_status=DeviceTaskStatus.IDLE,
             )
 
-        self._device_collection.update_one(
-            {"name": device_name},
-            {"$set": update_dict},
-        )
-        # wait until the device status has been updated to IDLE
-        while self.get_status(device_name=device_name).name != "IDLE":
-            time.sleep(0.5)
+    def _raise_for_unchanged_devices(
+        self,
+        device_names: list[str],
+        task_id: ObjectId | None,
+        target_status: DeviceTaskStatus,
+    ):
+        """Find out why some of the devices are not updated in a bulk write and raise a ``ValueError``."""
+        device_entries = {
+            device_entry["name"]: device_entry
+            for device_entry in self._device_collection.find(
+                {"name": {"$in": device_names}},
+                projection=["name", "status", "pause_status", "task_id"],
+            )
+        }
+        for device_name in device_names:
+            device_entry = device_entries.get(device_name)
+            if device_entry is None:
+                raise ValueError(
+                    f"Cannot find device ({device_name}). Did you run `setup` command?"
+                )
+            if device_entry["task_id"] != task_id:
+                if device_entry["status"] != DeviceTaskStatus.IDLE.name:
+                    raise ValueError(
+                        f"Device's current status ({device_entry['status']}) is "
+                        f"not in allowed set of statuses {[DeviceTaskStatus.IDLE.name]}. "
+                        f"Cannot change status to {target_status.name}"
+                    )
+                if (
+                    target_status == DeviceTaskStatus.OCCUPIED
+                    and device_entry.get("pause_status")
+                    != DevicePauseStatus.RELEASED.name
+                ):
+                    raise ValueError(
+                        f"Device ({device_name}) is not released (pause status: "
+                        f"{device_entry.get('pause_status')}). Cannot change status to {target_status.name}"
+                    )
 
     def _update_status(
         self,
@@ -531,7 +639,6 @@ class DeviceView:
 
     def pause_device(self, device_name: str):
         """Request pause for a specific device."""
-        # with self._lock():
         device = self.get_device(device_name=device_name)
         new_pause_status = (
             DevicePauseStatus.PAUSED.name
@@ -551,7 +658,6 @@ class DeviceView:
 
     def unpause_device(self, device_name: str):
         """Unpause a device."""
-        # with self._lock():
         device = self.get_device(device_name=device_name)
         update_dict = {
             "pause_status": DevicePauseStatus.RELEASED.name,
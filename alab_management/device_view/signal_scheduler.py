@@ -0,0 +1,313 @@
+"""
+A lab-wide scheduler that reads the device signals (the methods decorated with ``@log_signal``) at their intervals.
+
+Instead of one mostly-sleeping thread per device, there is one timer thread per process with a heap of the
+next due times. It sleeps on a condition variable until the earliest reading is due, or until a signal is added
+or removed. The readings are run in a :py:class:`KeyedExecutor <alab_management.utils.keyed_executor.KeyedExecutor>`
+keyed by the device name (at most one reading per device at a time), or in the timer thread if
+``max_workers = 0``.
+
+The readings are scheduled on a fixed grid (``first + n * interval``), so that they do not drift. A reading is
+missed if the previous reading of the signal is still running, or if the scheduler is more than one interval
+behind. The missed and late readings are counted per signal (see :py:meth:`SignalScheduler.get_stats`) and
+reported in the system log every ``report_interval`` seconds.
+"""
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass, field, replace
+from typing import Any
+
+from alab_management.config import AlabOSConfig
+from alab_management.logger import DBLogger
+from alab_management.utils.keyed_executor import KeyedExecutor
+
+cli_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SignalStats:
+    """The timing statistics of a signal."""
+
+    # the readings that are started
+    runs: int = 0
+    # the readings that are skipped because the previous one is still running or the scheduler is behind
+    missed: int = 0
+    # the readings that are started more than ``late_tolerance`` seconds after they are due
+    late: int = 0
+    total_lateness: float = 0.0
+    max_lateness: float = 0.0
+
+    @property
+    def mean_lateness(self) -> float:
+        """The average delay (in seconds) between a reading is due and it is started."""
+        return self.total_lateness / self.runs if self.runs else 0.0
+
+
+@dataclass(eq=False)
+class _SignalJob:
+    key: Hashable
+    name: str
+    interval: float
+    fn: Callable[[], Any]
+    # the time of the first reading, on the monotonic clock
+    first_due: float
+    # the index of the next reading on the grid
+    count: int = 0
+    running: bool = False
+    cancelled: bool = False
+    stats: SignalStats = field(default_factory=SignalStats)
+    # the stats at the last report
+    reported: SignalStats = field(default_factory=SignalStats)
+
+    @property
+    def next_due(self) -> float:
+        return self.first_due + self.count * self.interval
+
+
+class SignalScheduler:
+    """Call the registered functions at their intervals, with one timer thread for all of them."""
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        late_tolerance: float = 0.5,
+        phase_spread: float = 0.5,
+        report_interval: float | None = 300.0,
+    ):
+        """
+        Create a scheduler. The timer thread is started when the first signal is added.
+
+        Args:
+            max_workers: the number of threads to read the signals. If 0, the signals are read in the timer thread.
+            late_tolerance: a reading is counted as late if it starts more than ``late_tolerance`` seconds after
+              it is due
+            phase_spread: the first reading of a signal is delayed by a random fraction (less than
+              ``phase_spread``) of its interval, so that the signals with the same interval are not all read at the
+              same moment
+            report_interval: the interval (in seconds) to log the missed and late readings. None to disable it.
+        """
+        self.late_tolerance = late_tolerance
+        self.phase_spread = phase_spread
+        self.report_interval = report_interval
+        self._executor = (
+            KeyedExecutor(max_workers=max_workers) if max_workers > 0 else None
+        )
+        self._condition = threading.Condition()
+        # (due time, sequence number, job)
+        self._heap: list[tuple[float, int, _SignalJob]] = []
+        self._sequence = itertools.count()
+        self._jobs: dict[tuple[Hashable, str], _SignalJob] = {}
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+        self._next_report = (
+            time.monotonic() + report_interval if report_interval else None
+        )
+
+    def add(
+        self, key: Hashable, name: str, interval: float, fn: Callable[[], Any]
+    ) -> None:
+        """
+        Call ``fn`` every ``interval`` seconds.
+
+        Args:
+            key: the key of the signal (e.g. the device name). The calls with the same key are run one at a time.
+            name: the name of the signal, unique for the key
+            interval: the interval in seconds
+            fn: the function to call
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive.")
+        phase = random.uniform(0, self.phase_spread) if self.phase_spread else 0.0
+        job = _SignalJob(
+            key=key,
+            name=name,
+            interval=interval,
+            fn=fn,
+            first_due=time.monotonic() + interval * (1 + phase),
+        )
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("The signal scheduler is shut down.")
+            previous = self._jobs.get((key, name))
+            if previous is not None:
+                previous.cancelled = True
+            self._jobs[(key, name)] = job
+            heapq.heappush(self._heap, (job.next_due, next(self._sequence), job))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, daemon=True, name="SignalScheduler"
+                )
+                self._thread.start()
+            self._condition.notify_all()
+
+    def remove(self, key: Hashable, wait: bool = True) -> None:
+        """Stop calling the functions of a key. If ``wait``, wait until their running calls are finished."""
+        with self._condition:
+            jobs = [job for (key_, _), job in self._jobs.items() if key_ == key]
+            for job in jobs:
+                job.cancelled = True
+                del self._jobs[(job.key, job.name)]
+            self._condition.notify_all()
+            if wait:
+                self._condition.wait_for(lambda: not any(job.running for job in jobs))
+
+    def get_stats(
+        self, key: Hashable | None = None
+    ) -> dict[tuple[Hashable, str], SignalStats]:
+        """Get the timing statistics of the signals (of a key, or all of them), by (key, name)."""
+        with self._condition:
+            return {
+                (key_, name): replace(job.stats)
+                for (key_, name), job in self._jobs.items()
+                if key is None or key_ == key
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the timer thread and the reading threads."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if wait and self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                if not self._wait_until_due():
+                    return
+                job = self._pop_due_job()
+                report = None
+                if (
+                    self._next_report is not None
+                    and time.monotonic() >= self._next_report
+                ):
+                    report = self._collect_report()
+            if report:
+                self._report(report)
+            if job is not None:
+                self._dispatch(job)
+
+    def _wait_until_due(self) -> bool:
+        """
+        Wait until a reading is due or it is time to report. Return False if the scheduler is shut down.
+        Must be called with the lock held.
+        """
+        while not self._stopped:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            deadlines = [self._heap[0][0]] if self._heap else []
+            if self._next_report is not None:
+                deadlines.append(self._next_report)
+            now = time.monotonic()
+            if deadlines and min(deadlines) <= now:
+                return True
+            self._condition.wait(timeout=min(deadlines) - now if deadlines else None)
+        return False
+
+    def _pop_due_job(self) -> _SignalJob | None:
+        """
+        Take the due reading from the heap and schedule the next reading of its signal. Return the job to run,
+        or None if nothing is due or the reading is missed. Must be called with the lock held.
+        """
+        now = time.monotonic()
+        if not self._heap or self._heap[0][0] > now:
+            return None
+        due, _, job = heapq.heappop(self._heap)
+        run = not job.running
+        if run:
+            lateness = now - due
+            job.stats.runs += 1
+            job.stats.total_lateness += lateness
+            job.stats.max_lateness = max(job.stats.max_lateness, lateness)
+            if lateness > self.late_tolerance:
+                job.stats.late += 1
+            job.running = True
+        else:
+            job.stats.missed += 1
+
+        job.count += 1
+        if job.next_due <= now:
+            # skip the readings that are already past due
+            skipped = int((now - job.next_due) // job.interval) + 1
+            job.stats.missed += skipped
+            job.count += skipped
+        heapq.heappush(self._heap, (job.next_due, next(self._sequence), job))
+        return job if run else None
+
+    def _dispatch(self, job: _SignalJob):
+        if self._executor is None:
+            self._run(job)
+        else:
+            self._executor.submit(job.key, self._run, job)
+
+    def _run(self, job: _SignalJob):
+        try:
+            job.fn()
+        except Exception:  # pylint: disable=broad-except
+            cli_logger.exception(f"Failed to read the signal {job.name} of {job.key}.")
+        finally:
+            with self._condition:
+                job.running = False
+                self._condition.notify_all()
+
+    def _collect_report(self) -> list[dict[str, Any]]:
+        """Get the signals that have missed or late readings since the last report. Must be called with the lock held."""
+        self._next_report = time.monotonic() + self.report_interval  # type: ignore
+        report = []
+        for job in self._jobs.values():
+            missed = job.stats.missed - job.reported.missed
+            late = job.stats.late - job.reported.late
+            if missed or late:
+                report.append(
+                    {
+                        "device_name": job.key,
+                        "signal_name": job.name,
+                        "interval": job.interval,
+                        "missed": missed,
+                        "late": late,
+                        "max_lateness": job.stats.max_lateness,
+                    }
+                )
+            job.reported = replace(job.stats)
+        return report
+
+    @staticmethod
+    def _report(report: list[dict[str, Any]]):
+        try:
+            DBLogger(task_id=None).system_log(
+                level="WARNING",
+                log_data={
+                    "logged_by": "SignalScheduler",
+                    "type": "SignalReadingsMissed",
+                    "signals": report,
+                },
+            )
+        except Exception:  # pylint: disable=broad-except
+            cli_logger.exception("Failed to report the missed signal readings.")
+
+
+_signal_scheduler: SignalScheduler | None = None
+_signal_scheduler_lock = threading.Lock()
+
+
+def get_signal_scheduler() -> SignalScheduler:
+    """Get the signal scheduler of this process, configured by the ``[device_signals]`` section of the config."""
+    global _signal_scheduler
+    with _signal_scheduler_lock:
+        if _signal_scheduler is None:
+            config = AlabOSConfig().get("device_signals", {})
+            _signal_scheduler = SignalScheduler(
+                max_workers=config.get("scheduler_max_workers", 8),
+                late_tolerance=config.get("late_tolerance", 0.5),
+                phase_spread=config.get("phase_spread", 0.5),
+                report_interval=config.get("report_interval", 300.0),
+            )
+    return _signal_scheduler
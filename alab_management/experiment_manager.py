@@ -9,11 +9,14 @@ done.
 import time
 from typing import Any
 
+from bson import ObjectId
+
 from .config import AlabOSConfig
 from .experiment_view import CompletedExperimentView, ExperimentStatus, ExperimentView
 from .logger import DBLogger
 from .sample_view import SampleView
-from .task_view import TaskStatus, TaskView
+from .task_view import TaskView
+from .utils.data_objects import start_transaction
 from .utils.graph_ops import Graph
 
 
@@ -77,20 +80,13 @@ class ExperimentManager:
         tasks: list[dict[str, Any]] = experiment["tasks"]
 
         # check if there is any cycle in the graph
-        reversed_edges = {i: task["prev_tasks"] for i, task in enumerate(tasks)}
-        task_graph = Graph(
-            list(range(len(tasks))),
-            # reverse reserved edges to get right directions of edges
-            {
-                i: [
-                    j
-                    for j, children in reversed_edges.items()
-                    for child in children
-                    if child == i
-                ]
-                for i in list(range(len(tasks)))
-            },
-        )
+        children: dict[int, list[int]] = {i: [] for i in range(len(tasks))}
+        for i, task in enumerate(tasks):
+            for parent in task["prev_tasks"]:
+                # reverse reserved edges to get right directions of edges
+                if parent in children:
+                    children[parent].append(i)
+        task_graph = Graph(list(range(len(tasks))), children)
         if task_graph.has_cycle():
             self.experiment_view.update_experiment_status(
                 experiment["_id"], ExperimentStatus.ERROR
@@ -98,99 +94,85 @@ class ExperimentManager:
             print(f"Experiment ({experiment['_id']}) has a cycle in the graph.")
             return
 
-        # create samples in the sample database
-        sample_ids = {
-            sample["name"]: self.sample_view.create_sample(
-                sample["name"],
-                sample_id=sample.get("sample_id", None),
-                tags=sample.get("tags", []),
-                metadata=sample.get("metadata", {}),
-            )
+        # assign the ids in advance, so that the whole graph can be written at once
+        sample_entries = [
+            {
+                "name": sample["name"],
+                "sample_id": sample.get("sample_id", None) or ObjectId(),
+                "tags": sample.get("tags", []),
+                "metadata": sample.get("metadata", {}),
+            }
             for sample in samples
-        }
-
-        # create tasks in the task database
-        task_ids = []
-        for task in tasks:
-            samples = [
-                {"name": samplename, "sample_id": sample_ids[samplename]}
-                for samplename in task["samples"]
-            ]
-            task_ids.append(
-                self.task_view.create_task(
-                    task_type=task["type"],
-                    parameters=task["parameters"],
-                    samples=samples,
-                    task_id=task.get("task_id", None),
-                )
-            )
+        ]
+        sample_ids = {sample["name"]: sample["sample_id"] for sample in sample_entries}
+        task_ids = [task.get("task_id", None) or ObjectId() for task in tasks]
 
         # change the content of graph's vertices
         task_graph.vertices = task_ids
 
-        # add dependency to each task
-        for task_id in task_ids:
-            self.task_view.update_task_dependency(
-                task_id,
-                next_tasks=task_graph.get_children(task_id),
-                prev_tasks=task_graph.get_parents(task_id),
+        # create samples and tasks (with their dependency), write back their ids and mark the experiment as
+        # RUNNING at once, so that a crash in between cannot ingest the experiment twice
+        with start_transaction() as session:
+            self.sample_view.create_samples(sample_entries, session=session)
+            self.task_view.create_tasks(
+                [
+                    {
+                        "task_type": task["type"],
+                        "parameters": task["parameters"],
+                        "samples": [
+                            {"name": samplename, "sample_id": sample_ids[samplename]}
+                            for samplename in task["samples"]
+                        ],
+                        "prev_tasks": task_graph.get_parents(task_id),
+                        "next_tasks": task_graph.get_children(task_id),
+                        "task_id": task_id,
+                    }
+                    for task, task_id in zip(tasks, task_ids, strict=True)
+                ],
+                session=session,
+            )
+            # write back the assign task & sample ids
+            self.experiment_view.update_sample_task_id(
+                exp_id=experiment["_id"],
+                sample_ids=list(sample_ids.values()),
+                task_ids=task_ids,
+                session=session,
+            )
+            # update the status of experiment to RUNNING (have handled by experiment manager)
+            self.experiment_view.update_experiment_status(
+                exp_id=experiment["_id"],
+                status=ExperimentStatus.RUNNING,
+                session=session,
             )
-            self.task_view.try_to_mark_task_ready(task_id)
-
-        # write back the assign task & sample ids
-        self.experiment_view.update_sample_task_id(
-            exp_id=experiment["_id"],
-            sample_ids=list(sample_ids.values()),
-            task_ids=task_ids,
-        )
-
-        # update the status of experiment to RUNNING (have handled by experiment manager)
-        self.experiment_view.update_experiment_status(
-            exp_id=experiment["_id"], status=ExperimentStatus.RUNNING
-        )
 
     def mark_completed_experiments(self):
         """This method will scan the database to mark completed experiments in time."""
-        running_experiments = self.experiment_view.get_experiments_with_status(
-            ExperimentStatus.RUNNING
-        )
-        for experiment in running_experiments:
-            task_ids = [task["task_id"] for task in experiment["tasks"]]
-
-            # if all the tasks of an experiment have been finished
-            if all(
-                self.task_view.get_status(task_id=task_id)
-                in {
-                    TaskStatus.COMPLETED,
-                    TaskStatus.ERROR,
-                    TaskStatus.CANCELLED,
-                }
-                for task_id in task_ids
-            ):
-                self.experiment_view.update_experiment_status(
-                    exp_id=experiment["_id"], status=ExperimentStatus.COMPLETED
+        # the running experiments whose tasks have all been finished
+        for experiment in self.experiment_view.get_finished_experiments():
+            self.experiment_view.update_experiment_status(
+                exp_id=experiment["_id"], status=ExperimentStatus.COMPLETED
+            )
+            self.logger.system_log(
+                level="DEBUG",
+                log_data={
+                    "logged_by": self.__class__.__name__,
+                    "type": "ExperimentCompleted",
+                    "exp_id": experiment["_id"],
+                },
+            )
+            print(f"Experiment ({experiment['_id']}) completed.")
+
+            if self.__copy_to_completed_db:
+                self.completed_experiment_view.save_experiment(experiment["_id"])
+                print(
+                    f"Experiment ({experiment['_id']}) and associated "
+                    f"samples/tasks were copied to the completed db."
                 )
                 self.logger.system_log(
                     level="DEBUG",
                     log_data={
                         "logged_by": self.__class__.__name__,
-                        "type": "ExperimentCompleted",
+                        "type": "ExperimentSavedToCompletedDB",
                         "exp_id": experiment["_id"],
                     },
                 )
-                print(f"Experiment ({experiment['_id']}) completed.")
-
-                if self.__copy_to_completed_db:
-                    self.completed_experiment_view.save_experiment(experiment["_id"])
-                    print(
-                        f"Experiment ({experiment['_id']}) and associated "
-                        f"samples/tasks were copied to the completed db."
-                    )
-                    self.logger.system_log(
-                        level="DEBUG",
-                        log_data={
-                            "logged_by": self.__class__.__name__,
-                            "type": "ExperimentSavedToCompletedDB",
-                            "exp_id": experiment["_id"],
-                        },
-                    )
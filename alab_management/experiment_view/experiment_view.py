@@ -4,10 +4,12 @@ from datetime import datetime
 from enum import Enum, auto
 from typing import Any, cast
 
+import pymongo  # type: ignore
 from bson import ObjectId  # type: ignore
+from pymongo.client_session import ClientSession
 
 from alab_management.sample_view import SampleView
-from alab_management.task_view import TaskView
+from alab_management.task_view import TaskStatus, TaskView
 from alab_management.utils.data_objects import get_collection
 
 from .completed_experiment_view import CompletedExperimentView
@@ -30,14 +32,61 @@ class ExperimentStatus(Enum):
     ERROR = auto()
 
 
+def _get_unfinished_tasks_lookup(concise: bool) -> dict[str, Any]:
+    """
+    The ``$lookup`` stage that looks up (at most one of) the unfinished tasks of an experiment.
+
+    The concise form (``localField``/``foreignField`` with ``pipeline``) needs MongoDB 5.0+; the ``let`` +
+    ``$expr`` form works from MongoDB 3.6, but it cannot use the index on the task ids.
+    """
+    finished_statuses = [
+        TaskStatus.COMPLETED.name,
+        TaskStatus.ERROR.name,
+        TaskStatus.CANCELLED.name,
+    ]
+    pipeline: list[dict[str, Any]] = [{"$limit": 1}, {"$project": {"_id": 1}}]
+    if concise:
+        return {
+            "$lookup": {
+                "from": "tasks",
+                "localField": "tasks.task_id",
+                "foreignField": "_id",
+                "pipeline": [
+                    {"$match": {"status": {"$nin": finished_statuses}}},
+                    *pipeline,
+                ],
+                "as": "unfinished_tasks",
+            }
+        }
+    return {
+        "$lookup": {
+            "from": "tasks",
+            "let": {"task_ids": {"$ifNull": ["$tasks.task_id", []]}},
+            "pipeline": [
+                {
+                    "$match": {
+                        "status": {"$nin": finished_statuses},
+                        "$expr": {"$in": ["$_id", "$$task_ids"]},
+                    }
+                },
+                *pipeline,
+            ],
+            "as": "unfinished_tasks",
+        }
+    }
+
+
 class ExperimentView:
     """Experiment view manages the experiment status, which is a collection of tasks and samples."""
 
     def __init__(self):
         self._experiment_collection = get_collection("experiment")
+        self._experiment_collection.create_index([("status", pymongo.ASCENDING)])
         self.sample_view = SampleView()
         self.task_view = TaskView()
         self.completed_experiment_view = CompletedExperimentView()
+        # whether the server supports $lookup with both localField and pipeline (MongoDB 5.0+)
+        self._concise_lookup: bool | None = None
 
     def create_experiment(self, experiment: InputExperiment) -> ObjectId:
         """
@@ -101,6 +150,27 @@ class ExperimentView:
             ),
         )
 
+    def get_finished_experiments(self) -> list[dict[str, Any]]:
+        """
+        Get the RUNNING experiments whose tasks are all finished (COMPLETED, ERROR or CANCELLED),
+        with one aggregation.
+        """
+        if self._concise_lookup is None:
+            version = self._experiment_collection.database.client.server_info()[
+                "versionArray"
+            ]
+            self._concise_lookup = list(version[:2]) >= [5, 0]
+        return list(
+            self._experiment_collection.aggregate(
+                [
+                    {"$match": {"status": ExperimentStatus.RUNNING.name}},
+                    _get_unfinished_tasks_lookup(concise=self._concise_lookup),
+                    {"$match": {"unfinished_tasks": {"$size": 0}}},
+                    {"$project": {"unfinished_tasks": 0}},
+                ]
+            )
+        )
+
     def get_experiment(self, exp_id: ObjectId) -> dict[str, Any] | None:
         """Get an experiment by its id."""
         experiment = self._experiment_collection.find_one({"_id": exp_id})
@@ -117,8 +187,20 @@ class ExperimentView:
 
         return experiment
 
-    def update_experiment_status(self, exp_id: ObjectId, status: ExperimentStatus):
-        """Update the status of an experiment."""
+    def update_experiment_status(
+        self,
+        exp_id: ObjectId,
+        status: ExperimentStatus,
+        session: ClientSession | None = None,
+    ):
+        """
+        Update the status of an experiment.
+
+        Args:
+            exp_id: the id of the experiment
+            status: the new status
+            session: the session of the transaction (if any) to write the status in
+        """
         self.get_experiment(exp_id=exp_id)
 
         update_dict = {"status": status.name}
@@ -127,18 +209,26 @@ class ExperimentView:
         self._experiment_collection.update_one(
             {"_id": exp_id},
             {"$set": update_dict},
+            session=session,
         )
 
     def update_sample_task_id(
-        self, exp_id, sample_ids: list[ObjectId], task_ids: list[ObjectId]
+        self,
+        exp_id,
+        sample_ids: list[ObjectId],
+        task_ids: list[ObjectId],
+        session: ClientSession | None = None,
     ):
         """
         At the creation of experiment, the id of samples and tasks has not been assigned.
 
         Later, we will use this method to assign sample & task id (done by
-        :py:class:`LabView <alab_management.lab_view.LabView>`)
+        :py:class:`LabView <alab_management.lab_view.LabView>`). The ids can be written in the
+        same transaction (``session``) as the samples and tasks.
         """
-        experiment = self._experiment_collection.find_one({"_id": exp_id})
+        experiment = self._experiment_collection.find_one(
+            {"_id": exp_id}, session=session
+        )
 
         if experiment is None:
             raise ValueError(f"Cannot find experiment with id: {exp_id}")
@@ -163,6 +253,7 @@ class ExperimentView:
                     },
                 }
             },
+            session=session,
         )
 
     def get_experiment_by_task_id(self, task_id: ObjectId) -> dict[str, Any] | None:
@@ -1,12 +1,20 @@
 """Logger module takes charge of recording information, warnings and errors during executing tasks."""
 
-from collections.abc import Iterable
+import atexit
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
 from datetime import datetime, timedelta
 from enum import Enum, auto, unique
 from typing import Any, cast
 
+import bson
 from bson import ObjectId
+from bson.errors import InvalidDocument
+from pymongo.errors import BulkWriteError, ConnectionFailure
 
+from .config import AlabOSConfig
 from .utils.data_objects import get_collection
 
 
@@ -33,12 +41,209 @@ class LoggingLevel(Enum):
     DEBUG = 10
 
 
+class LogBuffer:
+    """
+    A bounded in-memory queue of log entries, which are written to the database with ``insert_many``
+    by a background thread when ``max_batch_size`` entries are queued or every ``flush_interval`` seconds.
+
+    If the database is not reachable, the entries are kept to be written later. The entries that can never be
+    written (e.g. they cannot be encoded to BSON) are dropped, and the number of dropped entries is logged.
+
+    When ``max_size`` entries are queued (e.g. the database is unreachable), the new entries are either
+    dropped (``overflow = "drop"``, the number of dropped entries is logged when the database is back) or
+    the callers wait for the queue to be written (``overflow = "block"``, at most ``block_timeout``
+    seconds, and then the entry is dropped).
+
+    There is one buffer per collection in every process (see ``get_log_buffer``), which is flushed at exit.
+    """
+
+    def __init__(
+        self,
+        collection,
+        max_batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_size: int = 10000,
+        overflow: str = "drop",
+        block_timeout: float = 10.0,
+    ):
+        if overflow not in {"drop", "block"}:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self._collection = collection
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        # called after the queued entries are written, e.g. to write the state derived from them
+        self.flush_callbacks: list[Callable[[], None]] = []
+
+        self._entries: deque[dict[str, Any]] = deque()
+        self._condition = threading.Condition()
+        # only one thread writes at a time, so that the entries are written in order
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._flush_loop, daemon=True, name="DBLoggerFlush"
+        )
+        self._thread.start()
+
+    def __len__(self) -> int:
+        """The number of queued entries."""
+        return len(self._entries)
+
+    def put(self, entry: dict[str, Any]) -> bool:
+        """Queue an entry. Return False if it is dropped because the buffer is full."""
+        with self._condition:
+            if len(self._entries) >= self.max_size and self.overflow == "block":
+                self._condition.notify_all()
+                self._condition.wait_for(
+                    lambda: len(self._entries) < self.max_size,
+                    timeout=self.block_timeout,
+                )
+            if len(self._entries) >= self.max_size:
+                self.dropped += 1
+                return False
+            self._entries.append(entry)
+            if len(self._entries) >= self.max_batch_size:
+                self._condition.notify_all()
+        return True
+
+    def flush(self):
+        """Write all the queued entries to the database in the calling thread."""
+        with self._write_lock:
+            while True:
+                with self._condition:
+                    batch = [
+                        self._entries.popleft()
+                        for _ in range(min(self.max_batch_size, len(self._entries)))
+                    ]
+                    dropped, self.dropped = self.dropped, 0
+                    # wake up the callers waiting for space
+                    self._condition.notify_all()
+                if not batch and not dropped:
+                    for callback in self.flush_callbacks:
+                        callback()
+                    return
+                try:
+                    self._write(batch)
+                    if dropped:
+                        # the notice goes to the logs, whatever the collection of the buffer is
+                        get_collection("logs").insert_one(
+                            {
+                                "task_id": None,
+                                "type": LoggingType.SYSTEM_LOG.name,
+                                "level": LoggingLevel.WARNING.value,
+                                "log_data": {
+                                    "logged_by": "DBLogger",
+                                    "type": "LogsDropped",
+                                    "collection": self._collection.name,
+                                    "message": f"{dropped} entries are dropped because they cannot be "
+                                    f"written or the log buffer is full.",
+                                },
+                                "created_at": datetime.now(),
+                            }
+                        )
+                except ConnectionFailure:
+                    # the database is not reachable: put the entries back to be written next time,
+                    # as many as the buffer holds
+                    with self._condition:
+                        room = max(self.max_size - len(self._entries), 0)
+                        self.dropped += dropped + max(len(batch) - room, 0)
+                        self._entries.extendleft(reversed(batch[:room]))
+                    raise
+                except Exception:
+                    # the entries would never be written, retrying them would block the buffer
+                    with self._condition:
+                        self.dropped += dropped + len(batch)
+                    raise
+
+    def _write(self, batch: list[dict[str, Any]]):
+        """
+        Write a batch of entries. The entries that can never be written (e.g. they cannot be encoded to BSON or
+        they are rejected by the server) are dropped and counted, the others are written.
+        The entries that are already written (e.g. by a previous try that failed halfway) are skipped.
+        """
+        if not batch:
+            return
+        try:
+            self._collection.insert_many(batch, ordered=False)
+        except InvalidDocument:
+            valid = []
+            for entry in batch:
+                try:
+                    bson.encode(entry)
+                except InvalidDocument:
+                    continue
+                valid.append(entry)
+            if len(valid) == len(batch):
+                raise
+            with self._condition:
+                self.dropped += len(batch) - len(valid)
+            self._write(valid)
+        except BulkWriteError as error:
+            # the duplicate key errors mean that the entries are already written
+            rejected = [
+                write_error
+                for write_error in error.details.get("writeErrors", [])
+                if write_error.get("code") != 11000
+            ]
+            with self._condition:
+                self.dropped += len(rejected)
+
+    def _flush_loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: len(self._entries) >= self.max_batch_size,
+                    timeout=self.flush_interval,
+                )
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                # the database is not reachable, try again later
+                time.sleep(self.flush_interval)
+
+
+_log_buffers: dict[str, LogBuffer] = {}
+_log_buffer_lock = threading.Lock()
+
+
+def get_log_buffer(collection_name: str = "logs") -> LogBuffer | None:
+    """
+    Get the log buffer of a collection in this process, or None if the buffered logging is not enabled
+    in the config.
+    """
+    config = AlabOSConfig().get("logger", {})
+    if not config.get("buffered", False):
+        return None
+    with _log_buffer_lock:
+        if collection_name not in _log_buffers:
+            log_buffer = LogBuffer(
+                collection=get_collection(collection_name),
+                max_batch_size=config.get("max_batch_size", 500),
+                flush_interval=config.get("flush_interval", 1.0),
+                max_size=config.get("max_buffer_size", 10000),
+                overflow=config.get("overflow", "drop"),
+                block_timeout=config.get("block_timeout", 10.0),
+            )
+            atexit.register(log_buffer.flush)
+            _log_buffers[collection_name] = log_buffer
+    return _log_buffers[collection_name]
+
+
 class DBLogger:
-    """A custom logger that wrote data to database, where we predefined some log pattern."""
+    """
+    A custom logger that wrote data to database, where we predefined some log pattern.
+
+    If ``buffered`` is enabled in the ``[logger]`` config, the logs are queued in memory and written in
+    batches by a background thread (see :py:class:`LogBuffer`). Call :py:meth:`flush` to make sure that
+    they are in the database, e.g. at the end of a task.
+    """
 
     def __init__(self, task_id: ObjectId | None):
         self.task_id = task_id
         self._logging_collection = get_collection("logs")
+        self._buffer = get_log_buffer()
 
     def log(
         self,
@@ -59,18 +264,30 @@ class DBLogger:
         elif isinstance(level, LoggingLevel):
             level = level.value
 
-        result = self._logging_collection.insert_one(
-            {
-                "task_id": self.task_id,
-                "type": logging_type.name,
-                "level": level,
-                "log_data": log_data,
-                "created_at": datetime.now(),
-            }
-        )
+        entry = {
+            "_id": ObjectId(),
+            "task_id": self.task_id,
+            "type": logging_type.name,
+            "level": level,
+            "log_data": log_data,
+            "created_at": datetime.now(),
+        }
+        if self._buffer is not None:
+            self._buffer.put(entry)
+            return entry["_id"]
+
+        result = self._logging_collection.insert_one(entry)
 
         return cast(ObjectId, result.inserted_id)
 
+    def flush(self):
+        """Write the buffered logs and device signals of this process to the database."""
+        from .device_signals import flush_device_signals
+
+        if self._buffer is not None:
+            self._buffer.flush()
+        flush_device_signals()
+
     def log_amount(self, log_data: dict[str, Any]):
         """Log the amount of samples and chemicals (e.g. weight)."""
         return self.log(
@@ -88,15 +305,14 @@ class DBLogger:
         )
 
     def log_device_signal(self, device_name: str, signal_name: str, signal_value: Any):
-        """Log the device sensor's signal (e.g. the voltage of batteries, the temperature of furnace)."""
-        return self.log(
-            level=LoggingLevel.DEBUG,
-            log_data={
-                "device_name": device_name,
-                "signal_name": signal_name,
-                "signal_value": signal_value,
-            },
-            logging_type=LoggingType.DEVICE_SIGNAL,
+        """
+        Log the device sensor's signal (e.g. the voltage of batteries, the temperature of furnace).
+        The signals are stored in a time-series collection (see :py:mod:`alab_management.device_signals`).
+        """
+        from .device_signals import get_device_signal_store
+
+        return get_device_signal_store().log(
+            device_name=device_name, signal_name=signal_name, value=signal_value
         )
 
     def system_log(self, level: str | int | LoggingLevel, log_data: dict[str, Any]):
@@ -114,6 +330,7 @@ class DBLogger:
         elif isinstance(level, LoggingLevel):
             level = cast(int, level.value)
 
+        self.flush()
         return self._logging_collection.find(
             {"level": {"$gte": level}, "created_at": {"$gte": datetime.now() - within}}
         )
@@ -121,7 +338,8 @@ class DBLogger:
     def get_latest_device_signal(
         self, device_name: str, signal_name: str
     ) -> dict[str, Any]:
-        """Get the last device signal log.
+        """Get the last device signal log. If the signal is not in the device signal store, the last
+        one logged in the ``logs`` collection (before the store was introduced) is returned.
 
         Args:
             device_name (str): device_name
@@ -142,31 +360,33 @@ class DBLogger:
                     "timestamp": timestamp
                 }
         """
-        result = self._logging_collection.find_one(
-            {
-                "type": LoggingType.DEVICE_SIGNAL.name,
-                "log_data.device_name": device_name,
-                "log_data.signal_name": signal_name,
-            },
-            sort=[("created_at", -1)],
+        from .device_signals import get_device_signal_store
+
+        latest = get_device_signal_store().get_latest(
+            device_name=device_name, signal_name=signal_name
         )
-        if result is not None:
-            value = result["log_data"]["signal_value"]
-            timestamp = result["created_at"]
-        else:
-            value = None  # TODO do we want to raise here instead?
-            timestamp = datetime.now()
-        return {
-            "device_name": device_name,
-            "signal_name": signal_name,
-            "value": value,
-            "timestamp": timestamp,
-        }
+        if latest["value"] is None:
+            # the signals logged before the device signal store are in the logs collection
+            self.flush()
+            result = self._logging_collection.find_one(
+                {
+                    "type": LoggingType.DEVICE_SIGNAL.name,
+                    "log_data.device_name": device_name,
+                    "log_data.signal_name": signal_name,
+                },
+                sort=[("created_at", -1)],
+            )
+            if result is not None:
+                latest["value"] = result["log_data"]["signal_value"]
+                latest["timestamp"] = result["created_at"]
+        return latest
 
     def filter_device_signal(
         self, device_name: str, signal_name: str, within: timedelta
     ) -> dict[str, Any]:
-        """Find device signal log within a range of time (1h/1d or else).
+        """Find device signal log within a range of time (1h/1d or else). If the device signal store has
+        no readings in this range, the ones logged in the ``logs`` collection (before the store was
+        introduced) are returned.
 
         Args:
             device_name (str): name of device
@@ -183,21 +403,46 @@ class DBLogger:
                     "value": [list of signal values]
                     }
         """
-        result = self._logging_collection.find(
-            {
-                "type": LoggingType.DEVICE_SIGNAL.name,
-                "log_data.device_name": device_name,
-                "log_data.signal_name": signal_name,
-                "created_at": {"$gte": datetime.now() - within},
-            }
+        from .device_signals import get_device_signal_store
+
+        data = get_device_signal_store().get_signal(
+            device_name=device_name, signal_name=signal_name, within=within
         )
-        data = {
-            "device_name": device_name,
-            "signal_name": signal_name,
-            "timestamp": [],
-            "value": [],
-        }
-        for entry in result:
-            data["timestamp"].append(entry["created_at"])
-            data["value"].append(entry["log_data"]["signal_value"])
+        if not data["timestamp"]:
+            # the signals logged before the device signal store are in the logs collection
+            self.flush()
+            result = self._logging_collection.find(
+                {
+                    "type": LoggingType.DEVICE_SIGNAL.name,
+                    "log_data.device_name": device_name,
+                    "log_data.signal_name": signal_name,
+                    "created_at": {"$gte": datetime.now() - within},
+                },
+                sort=[("created_at", 1)],
+            )
+            for entry in result:
+                data["timestamp"].append(entry["created_at"])
+                data["value"].append(entry["log_data"]["signal_value"])
         return data
+
+    def get_device_signal_array(
+        self,
+        device_name: str,
+        signal_name: str,
+        within: timedelta,
+        max_points: int | None = None,
+    ) -> dict[str, Any]:
+        """Find device signal log within a range of time as NumPy arrays, optionally downsampled to ``max_points``.
+
+        Only the device signal store is read, not the signals in the ``logs`` collection.
+        See :py:meth:`DeviceSignalStore.get_signal_array <alab_management.device_signals.DeviceSignalStore.get_signal_array>`
+        for the form of the result.
+        """
+        from .device_signals import get_device_signal_store
+
+        return get_device_signal_store().get_signal_array(
+            device_name=device_name,
+            signal_name=signal_name,
+            within=within,
+            max_points=max_points,
+        )
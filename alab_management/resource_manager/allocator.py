@@ -0,0 +1,193 @@
+"""
+The batch allocator plans the allocation for all the pending requests at once, using one
+snapshot of the resources per tick.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from traceback import format_exc
+from typing import Any
+
+from bson import ObjectId
+
+from alab_management.device_view.device_view import DeviceTaskStatus
+from alab_management.resource_manager.enums import _EXTRA_REQUEST
+from alab_management.resource_manager.resource_index import ResourceIndex
+from alab_management.sample_view.sample import SamplePosition
+from alab_management.sample_view.sample_view import SamplePositionRequest
+
+
+@dataclass
+class Allocation:
+    """The result of the allocation for one request."""
+
+    request: dict[str, Any]
+    devices: dict[str, dict[str, str | bool]] | None = None
+    parsed_sample_positions_request: list[SamplePositionRequest] | None = None
+    sample_positions: dict[str, list[dict[str, Any]]] | None = None
+    error: Exception | None = None
+
+    @property
+    def granted(self) -> bool:
+        """Whether the request can be fulfilled."""
+        return (
+            self.error is None
+            and self.devices is not None
+            and self.sample_positions is not None
+        )
+
+
+class BatchAllocator:
+    """
+    Allocate the resources for the whole queue of pending requests.
+
+    The requests are visited by their effective priority, which is the priority of the request
+    plus ``aging_rate`` for every minute it has been waiting, so that the low-priority requests
+    will not wait forever. Every granted request takes its resources from the snapshot, so the
+    requests after it are evaluated against what is left.
+
+    If a request has been waiting for more than ``starvation_seconds`` and still cannot be
+    fulfilled, the free resources it would be granted (one device per entry and the requested
+    number of sample positions) are held for it in this tick, so that the requests behind it
+    cannot keep taking them (the other requests can still use the resources it does not need).
+    """
+
+    def __init__(self, aging_rate: float = 1.0, starvation_seconds: float = 600.0):
+        """
+        Create a batch allocator.
+
+        Args:
+            aging_rate: the increase of the effective priority per minute of waiting
+            starvation_seconds: the waiting time after which the resources are held for a request
+        """
+        self.aging_rate = aging_rate
+        self.starvation_seconds = starvation_seconds
+
+    def get_effective_priority(
+        self, request: dict[str, Any], now: datetime | None = None
+    ) -> float:
+        """Get the priority of a request after aging."""
+        now = now or datetime.now()
+        waiting_minutes = (now - request["submitted_at"]).total_seconds() / 60
+        return request["priority"] + self.aging_rate * max(waiting_minutes, 0)
+
+    def solve(
+        self,
+        resource_index: ResourceIndex,
+        requests: list[dict[str, Any]],
+        now: datetime | None = None,
+    ) -> list[Allocation]:
+        """
+        Plan the allocation of the requests. The resource index is not modified.
+
+        Args:
+            resource_index: the current state of the resources
+            requests: the pending requests (as in the ``requests`` collection)
+            now: the current time, used to compute the waiting time of the requests
+
+        Returns
+        -------
+            the allocation of every request, in the order they are visited.
+        """
+        now = now or datetime.now()
+        snapshot = resource_index.snapshot()
+        requests = sorted(
+            requests,
+            key=lambda request: (
+                -self.get_effective_priority(request, now),
+                request["submitted_at"],
+            ),
+        )
+
+        allocations = []
+        for request in requests:
+            allocation = Allocation(request=request)
+            allocations.append(allocation)
+            task_id = request["task_id"]
+            try:
+                (
+                    allocation.devices,
+                    allocation.parsed_sample_positions_request,
+                    allocation.sample_positions,
+                ) = snapshot.request_resources(
+                    task_id, request["request"], priority=request["priority"]
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                error.args = (format_exc(),)
+                allocation.error = error
+                continue
+
+            if allocation.granted:
+                snapshot.occupy(
+                    task_id=task_id,
+                    devices=allocation.devices,  # type: ignore
+                    sample_positions=allocation.sample_positions,  # type: ignore
+                )
+            elif (
+                now - request["submitted_at"]
+            ).total_seconds() >= self.starvation_seconds:
+                self._hold_resources(
+                    snapshot, task_id, request["request"], priority=request["priority"]
+                )
+        return allocations
+
+    @staticmethod
+    def _hold_resources(
+        snapshot: ResourceIndex,
+        task_id: ObjectId,
+        resource_request: list[dict[str, Any]],
+        priority: int | None = None,
+    ):
+        """
+        Hold the free resources that a request would be granted in the snapshot: one device per entry
+        (picked like :py:meth:`ResourceIndex.request_devices`) and ``number`` sample positions per prefix.
+        """
+        for entry in resource_request:
+            identifier = entry["device"]["identifier"]
+            content = entry["device"]["content"]
+            if identifier == _EXTRA_REQUEST:
+                device_prefix = ""
+            elif identifier in ("name", "type"):
+                try:
+                    device = (
+                        snapshot.request_devices(
+                            task_id=task_id,
+                            device_names_str=[content] if identifier == "name" else [],
+                            device_types_str=[content] if identifier == "type" else [],
+                            priority=priority,
+                        )
+                        or {}
+                    ).get(content)
+                except ValueError:
+                    continue
+                if device is not None:
+                    device_state = snapshot.devices[device["name"]]  # type: ignore
+                    device_state.status = DeviceTaskStatus.OCCUPIED.name
+                    device_state.task_id = task_id
+                    device_name = device["name"]
+                elif identifier == "name":
+                    # the device is busy, but the request will get exactly this one
+                    device_name = content
+                else:
+                    # the device that the request will get is not known yet
+                    continue
+                device_prefix = f"{device_name}{SamplePosition.SEPARATOR}"
+            else:
+                continue
+
+            for pos in entry["sample_positions"]:
+                prefix = pos["prefix"]
+                if not prefix.startswith(device_prefix):
+                    prefix = device_prefix + prefix
+                try:
+                    positions = snapshot.get_available_sample_positions(
+                        task_id=task_id, position_prefix=prefix
+                    )
+                except ValueError:
+                    continue
+                # the positions already held by the task come first
+                positions = sorted(
+                    positions, key=lambda position: int(position["need_release"])
+                )
+                for position in positions[: pos["number"]]:
+                    snapshot.sample_positions[position["name"]].task_id = task_id
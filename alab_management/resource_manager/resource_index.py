@@ -0,0 +1,526 @@
+"""
+An in-memory index of the lab resources (devices, sample positions and the samples in them).
+
+The resource manager uses it to evaluate the pending requests without querying the database
+for every candidate device and sample position. It is loaded from the database at start, and
+the locks (the ``task_id`` of devices and sample positions) are updated write-through whenever
+the resource manager occupies or releases the resources.
+"""
+
+import time
+from dataclasses import dataclass, replace
+from typing import Any
+
+from bson import ObjectId
+
+from alab_management.device_view.device import get_all_devices
+from alab_management.device_view.device_view import DevicePauseStatus, DeviceTaskStatus
+from alab_management.resource_manager.enums import _EXTRA_REQUEST
+from alab_management.sample_view.position_index import SamplePositionIndex
+from alab_management.sample_view.sample import (
+    SamplePosition,
+    get_all_standalone_sample_positions,
+)
+from alab_management.sample_view.sample_view import SamplePositionRequest
+from alab_management.utils.data_objects import get_collection
+
+# The devices and samples can be changed by other processes (e.g. pausing a device in the dashboard,
+# moving a sample in a task), so they are read again at every refresh. The locks of sample positions
+# are only changed by the resource manager, so we only reload them once in a while just in case.
+_SAMPLE_POSITIONS_RELOAD_INTERVAL = 60.0
+
+_IDLE = DeviceTaskStatus.IDLE.name
+_RELEASED = DevicePauseStatus.RELEASED.name
+
+
+@dataclass
+class DeviceState:
+    """The state of a device that matters for the resource allocation."""
+
+    name: str
+    type: str
+    status: str
+    pause_status: str
+    task_id: ObjectId | None
+
+
+@dataclass
+class SamplePositionState:
+    """The state of a sample position that matters for the resource allocation."""
+
+    name: str
+    task_id: ObjectId | None
+    parent_device: str | None = None
+
+
+@dataclass
+class DeviceHold:
+    """
+    A soft hold of a device for a task that is expected to request it soon.
+
+    The device is kept from the requests with lower (or equal) priority of other tasks,
+    but it is not occupied in the database.
+    """
+
+    task_id: ObjectId
+    priority: int
+
+
+class ResourceIndex:
+    """
+    In-memory index of the devices, sample positions and samples.
+
+    The ``request_devices`` and ``request_sample_positions`` methods follow the same rules as
+    :py:meth:`DeviceView.request_devices <alab_management.device_view.device_view.DeviceView.request_devices>`
+    and :py:meth:`SampleView.request_sample_positions
+    <alab_management.sample_view.sample_view.SampleView.request_sample_positions>`, but only read the index.
+    """
+
+    def __init__(self):
+        self.devices: dict[str, DeviceState] = {}
+        # device type -> the names of the devices of the type
+        self._device_names_by_type: dict[str, list[str]] = {}
+        self.sample_positions: dict[str, SamplePositionState] = {}
+        # position name -> the task id of the sample in this position
+        self.samples_at_position: dict[str, ObjectId | None] = {}
+        # device name -> the number of samples in the device
+        self.sample_count_on_device: dict[str, int] = {}
+        # device name -> the soft hold of the device (see ``set_device_holds``)
+        self.device_holds: dict[str, DeviceHold] = {}
+
+        self._device_collection = None
+        self._sample_positions_collection = None
+        self._sample_collection = None
+        self._position_index = SamplePositionIndex()
+        self._sample_positions_loaded_at: float = 0.0
+
+    @classmethod
+    def from_database(cls) -> "ResourceIndex":
+        """Create an index and load the current state of all the resources from the database."""
+        index = cls()
+        index._device_collection = get_collection("devices")
+        index._sample_positions_collection = get_collection("sample_positions")
+        index._sample_collection = get_collection("samples")
+        index.load()
+        return index
+
+    @classmethod
+    def from_definitions(cls) -> "ResourceIndex":
+        """
+        Create an index of the devices and sample positions defined in the lab (the same as ``setup_lab``
+        writes to the database), with all the resources free and no samples. The index is not connected
+        to the database, e.g. it is used to simulate the lab.
+        """
+        devices = list(get_all_devices().values())
+        index = cls()
+        index.set_devices(
+            {
+                "name": device.name,
+                "type": device.__class__.__name__,
+                "status": DeviceTaskStatus.IDLE.name,
+                "pause_status": DevicePauseStatus.RELEASED.name,
+                "task_id": None,
+            }
+            for device in devices
+        )
+        index.set_sample_positions(
+            [
+                {"name": name}
+                for sample_position in get_all_standalone_sample_positions().values()
+                for name in sample_position.get_names()
+            ]
+            + [
+                {"name": name, "parent_device": device.name}
+                for device in devices
+                for sample_position in device.sample_positions
+                for name in sample_position.get_names(device.name)
+            ]
+        )
+        return index
+
+    def snapshot(self) -> "ResourceIndex":
+        """
+        Get a copy of the index, which can be modified (e.g. to plan the allocation of many requests)
+        without affecting this index. The snapshot is not connected to the database.
+        """
+        index = ResourceIndex()
+        index.devices = {name: replace(state) for name, state in self.devices.items()}
+        index._device_names_by_type = self._device_names_by_type
+        index.sample_positions = {
+            name: replace(state) for name, state in self.sample_positions.items()
+        }
+        # the samples and the position names are not changed by the allocation, so they can be shared
+        index.samples_at_position = self.samples_at_position
+        index.sample_count_on_device = self.sample_count_on_device
+        index.device_holds = self.device_holds
+        index._position_index = self._position_index
+        return index
+
+    def load(self):
+        """Rebuild the whole index from the database."""
+        self._load_sample_positions()
+        self._load_devices()
+        self._load_samples()
+
+    def refresh(self):
+        """
+        Read the state that may be changed by other processes (devices and samples) from the database.
+        This takes a constant number of queries, regardless of the number of pending requests.
+        """
+        if (
+            time.time() - self._sample_positions_loaded_at
+            > _SAMPLE_POSITIONS_RELOAD_INTERVAL
+        ):
+            self._load_sample_positions()
+        self._load_devices()
+        self._load_samples()
+
+    def _load_devices(self):
+        self.set_devices(
+            self._device_collection.find(
+                {}, projection=["name", "type", "status", "pause_status", "task_id"]
+            )
+        )
+
+    def _load_sample_positions(self):
+        self.set_sample_positions(
+            self._sample_positions_collection.find(
+                {}, projection=["name", "task_id", "parent_device"]
+            )
+        )
+        self._sample_positions_loaded_at = time.time()
+
+    def _load_samples(self):
+        self.set_samples(
+            self._sample_collection.find(
+                {"position": {"$ne": None}}, projection=["position", "task_id"]
+            )
+        )
+
+    def set_devices(self, device_entries):
+        """Replace the devices in the index with the device entries (as in the ``devices`` collection)."""
+        self.devices = {
+            entry["name"]: DeviceState(
+                name=entry["name"],
+                type=entry["type"],
+                status=entry["status"],
+                pause_status=entry["pause_status"],
+                task_id=entry["task_id"],
+            )
+            for entry in device_entries
+        }
+        self._device_names_by_type = {}
+        for device in self.devices.values():
+            self._device_names_by_type.setdefault(device.type, []).append(device.name)
+
+    def set_sample_positions(self, sample_position_entries):
+        """Replace the sample positions in the index (as in the ``sample_positions`` collection)."""
+        self.sample_positions = {
+            entry["name"]: SamplePositionState(
+                name=entry["name"],
+                task_id=entry.get("task_id"),
+                parent_device=entry.get("parent_device"),
+            )
+            for entry in sample_position_entries
+        }
+        self._position_index = SamplePositionIndex(
+            {"name": name} for name in self.sample_positions
+        )
+
+    def set_samples(self, sample_entries):
+        """Replace the samples in the index (as in the ``samples`` collection)."""
+        self.samples_at_position = {}
+        self.sample_count_on_device = {}
+        for entry in sample_entries:
+            position = entry.get("position")
+            if position is None:
+                continue
+            # if there are multiple samples in one position, the first one is used (same as ``find_one``)
+            self.samples_at_position.setdefault(position, entry.get("task_id"))
+            device_name = position.split(SamplePosition.SEPARATOR, 1)[0]
+            if device_name != position:
+                self.sample_count_on_device[device_name] = (
+                    self.sample_count_on_device.get(device_name, 0) + 1
+                )
+
+    def set_device_holds(self, device_holds: dict[str, DeviceHold]):
+        """
+        Replace the soft holds of the devices. A held device is only available to the task holding it
+        and to the requests with a higher priority than the hold.
+        """
+        self.device_holds = device_holds
+
+    def is_held_for_others(
+        self, device_name: str, task_id: ObjectId | None, priority: int | None = None
+    ) -> bool:
+        """Whether the device is held for another task that the request (with the priority) cannot preempt."""
+        hold = self.device_holds.get(device_name)
+        if hold is None or hold.task_id == task_id:
+            return False
+        return priority is None or priority <= hold.priority
+
+    def get_positions_with_prefix(self, prefix: str) -> list[str]:
+        """Get the names of all the sample positions that start with ``prefix``."""
+        return self._position_index.get_names_with_prefix(prefix)
+
+    def get_available_devices(
+        self,
+        device_str: str,
+        type_or_name: str,
+        task_id: ObjectId | None = None,
+        priority: int | None = None,
+    ) -> list[dict[str, str | bool]]:
+        """
+        Get the devices with the type or name that are either idle or held by the task.
+        The idle devices that are soft-held for other tasks are excluded, unless the priority
+        of the request is higher than the hold.
+
+        The structure of returned list is ``{"name": str, "need_release": bool}``.
+        """
+        if type_or_name == "type":
+            devices = [
+                self.devices[name]
+                for name in self._device_names_by_type.get(device_str, [])
+            ]
+        elif type_or_name == "name":
+            devices = [self.devices[device_str]] if device_str in self.devices else []
+        else:
+            raise ValueError(f"Unknown type_or_name: {type_or_name}")
+
+        if not devices:
+            raise ValueError(f"No such device of {type_or_name} {device_str}")
+
+        return [
+            {
+                "name": device.name,
+                # if device already held by this task, don't release with
+                # this request. Will be released by the older request.
+                "need_release": device.task_id != task_id,
+            }
+            for device in devices
+            if (
+                device.status == _IDLE
+                and device.pause_status == _RELEASED
+                and not self.is_held_for_others(device.name, task_id, priority)
+            )
+            or device.task_id == task_id
+        ]
+
+    def request_devices(
+        self,
+        task_id: ObjectId,
+        device_names_str: list[str] | None = None,
+        device_types_str: list[str] | None = None,
+        priority: int | None = None,
+    ) -> dict[str, dict[str, str | bool]] | None:
+        """
+        Find the devices for a request. Return None if any of the devices is not available now.
+        The ``priority`` of the request decides whether it can take the devices soft-held for other tasks.
+
+        Returns
+        -------
+            {"device_type_name": {"name": device_name, "need_release": need_release (bool)}} or None
+        """
+        device_names_str = device_names_str or []
+        device_types_str = device_types_str or []
+
+        if len(device_types_str) != len(set(device_types_str)):
+            raise ValueError(
+                "Currently we do not allow duplicated device types in one request."
+            )
+
+        idle_devices: dict[str, dict[str, str | bool]] = {}
+        for device_name in device_names_str:
+            result = self.get_available_devices(
+                device_str=device_name,
+                type_or_name="name",
+                task_id=task_id,
+                priority=priority,
+            )
+            if not result:
+                return None
+            idle_devices[device_name] = result[0]
+        for device_type in device_types_str:
+            result = self.get_available_devices(
+                device_str=device_type,
+                type_or_name="type",
+                task_id=task_id,
+                priority=priority,
+            )
+            if not result:
+                return None
+            same_task_devices = [
+                device_ for device_ in result if not device_["need_release"]
+            ]
+            if len(same_task_devices) > 0:
+                idle_devices[device_type] = same_task_devices[0]
+            else:
+                # if no device is held by the same task, pick the device soft-held for the task,
+                # otherwise the device with least samples
+                idle_devices[device_type] = min(
+                    result,
+                    key=lambda device_: (
+                        getattr(self.device_holds.get(device_["name"]), "task_id", None)
+                        != task_id,
+                        self.sample_count_on_device.get(device_["name"], 0),
+                    ),
+                )
+        return idle_devices
+
+    def get_available_sample_positions(
+        self, task_id: ObjectId, position_prefix: str
+    ) -> list[dict[str, str | bool]]:
+        """
+        Get the sample positions with the prefix that are neither occupied nor locked by other tasks.
+
+        The structure of returned list is ``{"name": str, "need_release": bool}``.
+        """
+        names = self.get_positions_with_prefix(position_prefix)
+        if not names:
+            raise ValueError(f"Cannot find device with prefix: {position_prefix}")
+
+        available_positions = []
+        for name in names:
+            position_task_id = self.sample_positions[name].task_id
+            if position_task_id is not None and position_task_id != task_id:
+                continue
+            if (
+                name in self.samples_at_position
+                and self.samples_at_position[name] != task_id
+            ):
+                continue
+            available_positions.append(
+                {"name": name, "need_release": position_task_id != task_id}
+            )
+        return available_positions
+
+    def request_sample_positions(
+        self,
+        task_id: ObjectId,
+        sample_positions: list[SamplePositionRequest],
+    ) -> dict[str, list[dict[str, Any]]] | None:
+        """Find the sample positions for a request. Return None if there are not enough available positions."""
+        if len(sample_positions) != len(
+            {sample_position.prefix for sample_position in sample_positions}
+        ):
+            raise ValueError("Duplicated sample_positions in one request.")
+
+        for sample_position in sample_positions:
+            count = len(self.get_positions_with_prefix(sample_position.prefix))
+            if count < sample_position.number:
+                raise ValueError(
+                    f"Position prefix `{sample_position.prefix}` can only "
+                    f"have {count} matches, but requests {sample_position.number}"
+                )
+
+        available_positions: dict[str, list[dict[str, Any]]] = {}
+        for sample_position in sample_positions:
+            result = self.get_available_sample_positions(
+                task_id=task_id, position_prefix=sample_position.prefix
+            )
+            if not result or len(result) < sample_position.number:
+                return None
+            # we try to choose the position that has already been locked by this task
+            available_positions[sample_position.prefix] = sorted(
+                result, key=lambda position: int(position["need_release"])
+            )[: sample_position.number]
+        return available_positions
+
+    def request_resources(
+        self,
+        task_id: ObjectId,
+        resource_request: list[dict[str, Any]],
+        priority: int | None = None,
+    ) -> tuple[
+        dict[str, dict[str, str | bool]] | None,
+        list[SamplePositionRequest] | None,
+        dict[str, list[dict[str, Any]]] | None,
+    ]:
+        """
+        Find the devices and sample positions for a resource request (as in the ``requests`` collection).
+        The ``priority`` of the request decides whether it can take the devices soft-held for other tasks.
+
+        Returns
+        -------
+            a tuple of (devices, parsed sample position request, sample positions). If the devices are not available,
+            all of them are None; if the sample positions are not available, only the sample positions are None.
+        """
+        devices = self.request_devices(
+            task_id=task_id,
+            device_names_str=[
+                entry["device"]["content"]
+                for entry in resource_request
+                if entry["device"]["identifier"] == "name"
+            ],
+            device_types_str=[
+                entry["device"]["content"]
+                for entry in resource_request
+                if entry["device"]["identifier"] == "type"
+            ],
+            priority=priority,
+        )
+        # some devices are not available now
+        # the request cannot be fulfilled
+        if devices is None:
+            return None, None, None
+
+        # replace device placeholder in sample position request
+        # and make it into a single list
+        parsed_sample_positions_request = []
+        for request in resource_request:
+            if request["device"]["identifier"] == _EXTRA_REQUEST:
+                device_prefix = ""
+            else:
+                device_name = devices[request["device"]["content"]]["name"]
+                device_prefix = f"{device_name}{SamplePosition.SEPARATOR}"
+
+            for pos in request["sample_positions"]:
+                prefix = pos["prefix"]
+                # if this is a nested resource request, lets not prepend the device name twice.
+                if not prefix.startswith(device_prefix):
+                    prefix = device_prefix + prefix
+                parsed_sample_positions_request.append(
+                    SamplePositionRequest(prefix=prefix, number=pos["number"])
+                )
+
+        sample_positions = self.request_sample_positions(
+            task_id=task_id, sample_positions=parsed_sample_positions_request
+        )
+        return devices, parsed_sample_positions_request, sample_positions
+
+    def occupy(
+        self,
+        task_id: ObjectId,
+        devices: dict[str, dict[str, Any]],
+        sample_positions: dict[str, list[dict[str, Any]]],
+    ):
+        """Mark the devices and sample positions as occupied by the task (after they are written to the database)."""
+        for device in devices.values():
+            device_state = self.devices[device["name"]]
+            device_state.status = DeviceTaskStatus.OCCUPIED.name
+            device_state.task_id = task_id
+        for sample_positions_ in sample_positions.values():
+            for sample_position in sample_positions_:
+                self.sample_positions[sample_position["name"]].task_id = task_id
+
+    def release(
+        self,
+        devices: dict[str, dict[str, Any]],
+        sample_positions: dict[str, list[dict[str, Any]]],
+    ):
+        """Mark the devices and sample positions as released (after they are written to the database)."""
+        for device in devices.values():
+            if not device["need_release"] or device["name"] not in self.devices:
+                continue
+            device_state = self.devices[device["name"]]
+            device_state.status = DeviceTaskStatus.IDLE.name
+            device_state.task_id = None
+            if device_state.pause_status == DevicePauseStatus.REQUESTED.name:
+                device_state.pause_status = DevicePauseStatus.PAUSED.name
+        for sample_positions_ in sample_positions.values():
+            for sample_position in sample_positions_:
+                if (
+                    sample_position["need_release"]
+                    and sample_position["name"] in self.sample_positions
+                ):
+                    self.sample_positions[sample_position["name"]].task_id = None
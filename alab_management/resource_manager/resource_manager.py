@@ -10,27 +10,45 @@ from datetime import datetime
 from traceback import format_exc
 from typing import Any, cast
 
-import dill
 from bson import ObjectId
 
-from alab_management.device_view.device_view import DeviceView
+from alab_management.config import AlabOSConfig
+from alab_management.device_view.device_view import (
+    DevicePauseStatus,
+    DeviceTaskStatus,
+    DeviceView,
+)
 from alab_management.logger import DBLogger
-from alab_management.resource_manager.enums import _EXTRA_REQUEST
+from alab_management.resource_manager.allocator import BatchAllocator
+from alab_management.resource_manager.resource_index import DeviceHold, ResourceIndex
 from alab_management.resource_manager.resource_requester import (
     RequestMixin,
     RequestStatus,
 )
-from alab_management.sample_view.sample import SamplePosition
 from alab_management.sample_view.sample_view import SamplePositionRequest, SampleView
 from alab_management.task_view import TaskView
+from alab_management.task_view.task import get_all_tasks
 from alab_management.task_view.task_enums import CancelingProgress, TaskStatus
-from alab_management.utils.data_objects import DocumentNotUpdatedError, get_collection
+from alab_management.utils.codec import CONTENT_TYPE_MSGPACK, get_codec
+from alab_management.utils.data_objects import (
+    DocumentNotUpdatedError,
+    get_collection,
+    get_db,
+)
+from alab_management.utils.db_watcher import CollectionWatcher
 from alab_management.utils.logger import set_up_rich_handler
 from alab_management.utils.module_ops import load_definition
 
 cli_logger = logging.getLogger(__name__)
 set_up_rich_handler(cli_logger)
 
+# the changes in these collections may make a pending request satisfiable (or need a release)
+_WATCHED_COLLECTIONS = ["requests", "devices", "sample_positions", "samples"]
+# even with change streams, we still check the database from time to time just in case
+_MAX_IDLE_SECONDS = 5.0
+# the codec of the errors stored in the request entries (exceptions are pickled inside the msgpack message)
+_ERROR_CODEC = get_codec(CONTENT_TYPE_MSGPACK)
+
 
 class ResourceManager(RequestMixin):
     """
@@ -46,11 +64,52 @@ class ResourceManager(RequestMixin):
         self.sample_view = SampleView()
         self.device_view = DeviceView()
         self._request_collection = get_collection("requests")
+        # the requests are evaluated against the in-memory index instead of querying
+        # the database for every candidate device and sample position
+        self._resource_index = ResourceIndex.from_database()
 
         self._pause_resource_assigning = False
 
+        # "greedy": try the requests one by one, by priority and submission time
+        # "batch": plan the allocation for the whole queue at once (see ``BatchAllocator``)
+        resource_manager_config = AlabOSConfig().get("resource_manager", {})
+        self._allocation = resource_manager_config.get("allocation", "greedy")
+        if self._allocation not in {"greedy", "batch"}:
+            raise ValueError(
+                f"Unknown allocation mode for the resource manager: {self._allocation}"
+            )
+        self._batch_allocator = BatchAllocator(
+            aging_rate=resource_manager_config.get("aging_rate", 1.0),
+            starvation_seconds=resource_manager_config.get("starvation_seconds", 600.0),
+        )
+        # soft-hold the devices declared in ``BaseTask.expected_devices`` for the tasks that are
+        # going to request them soon (see ``_update_device_holds``)
+        self._lookahead_holds = resource_manager_config.get("lookahead_holds", True)
+        self._hold_seconds = resource_manager_config.get("hold_seconds", 300.0)
+        self._task_types_with_expected_devices = [
+            name for name, task in get_all_tasks().items() if task.expected_devices
+        ]
+        # (task id, device name) -> the time when the device is held for the task for the first time
+        self._hold_started_at: dict[tuple[ObjectId, str], float] = {}
+        # the statistics of the last allocation
+        self.allocation_stats: dict[str, Any] = {}
+
         self.logger = DBLogger(task_id=None)
         super().__init__()
+
+        # with change streams, the loop is only woken up when something relevant changes in the database,
+        # otherwise, we poll the database every 0.5 s.
+        self._watcher: CollectionWatcher | None = None
+        if resource_manager_config.get("use_change_streams", False):
+            self._watcher = CollectionWatcher(
+                get_db(),
+                pipeline=[{"$match": {"ns.coll": {"$in": _WATCHED_COLLECTIONS}}}],
+            )
+            if not self._watcher.start():
+                cli_logger.warning(
+                    "Change streams are not supported by the MongoDB server (a replica set is required). "
+                    "ResourceManager will poll the database instead."
+                )
         time.sleep(1)  # allow some time for other modules to launch
 
     @contextmanager
@@ -67,7 +126,18 @@ class ResourceManager(RequestMixin):
     def run(self):
         """Start the loop."""
         while True:
+            generation = self._watcher.generation if self._watcher is not None else 0
             self._loop()
+            self._wait_for_changes(since=generation)
+
+    def _wait_for_changes(self, since: int):
+        """
+        Wait before the next loop. If the change stream is available, return as soon as
+        there is a change in the watched collections after the generation ``since``.
+        """
+        if self._watcher is not None and self._watcher.available:
+            self._watcher.wait(since=since, timeout=_MAX_IDLE_SECONDS)
+        else:
             time.sleep(0.5)
 
     def _loop(self):
@@ -82,6 +152,7 @@ class ResourceManager(RequestMixin):
             sample_positions = request["assigned_sample_positions"]
             self._release_devices(devices)
             self._release_sample_positions(sample_positions)
+            self._resource_index.release(devices, sample_positions)
             self.update_request_status(
                 request_id=request["_id"],
                 status=RequestStatus.RELEASED,
@@ -94,24 +165,68 @@ class ResourceManager(RequestMixin):
         try to assign the resources to it.
         """
         requests = list(self.get_requests_by_status(RequestStatus.PENDING))
+        if not requests:
+            return
         # prioritize the oldest requests at the highest priority value
         requests.sort(key=lambda x: x["submitted_at"])
         requests.sort(key=lambda x: x["priority"], reverse=True)
-        for request in requests:
-            self._handle_requested_resources(request)
 
-    def _handle_requested_resources(self, request_entry: dict[str, Any]):
-        try:
-            resource_request = request_entry["request"]
-            task_id = request_entry["task_id"]
+        start = time.perf_counter()
+        self._resource_index.refresh()
+        requests = self._cancel_requests_of_inactive_tasks(requests)
+        self._update_device_holds()
+        if self._allocation == "batch":
+            granted = self._allocate_in_batch(requests)
+        else:
+            granted = sum(
+                self._handle_requested_resources(request) for request in requests
+            )
+
+        self.allocation_stats = {
+            "allocation": self._allocation,
+            "pending": len(requests),
+            "granted": granted,
+            "solve_time": time.perf_counter() - start,
+        }
+        if granted:
+            cli_logger.debug(
+                f"Granted {granted}/{len(requests)} requests "
+                f"in {self.allocation_stats['solve_time']:.3f} s ({self._allocation})."
+            )
 
-            task_status = self.task_view.get_status(task_id=task_id)
-            if task_status != TaskStatus.REQUESTING_RESOURCES or task_id in {
-                task["task_id"]
-                for task in self.task_view.get_tasks_to_be_canceled(
-                    canceling_progress=CancelingProgress.WORKER_NOTIFIED
+    def _cancel_requests_of_inactive_tasks(
+        self, requests: list[dict[str, Any]]
+    ) -> list[dict[str, Any]]:
+        """
+        Cancel the requests whose tasks are not requesting resources anymore (or are being canceled),
+        and return the rest of the requests.
+        """
+        task_statuses = self.task_view.get_status_of_tasks(
+            [request["task_id"] for request in requests]
+        )
+        canceled_task_ids = {
+            task["task_id"]
+            for task in self.task_view.get_tasks_to_be_canceled(
+                canceling_progress=CancelingProgress.WORKER_NOTIFIED
+            )
+        }
+
+        active_requests = []
+        for request_entry in requests:
+            task_id = request_entry["task_id"]
+            try:
+                task_status = task_statuses.get(task_id) or self.task_view.get_status(
+                    task_id=task_id
                 )
-            }:
+            except Exception as error:  # pylint: disable=broad-except
+                error.args = (format_exc(),)
+                self._mark_request_as_error(request_entry, error)
+                continue
+
+            if (
+                task_status != TaskStatus.REQUESTING_RESOURCES
+                or task_id in canceled_task_ids
+            ):
                 # this implies the Task has been cancelled or errored somewhere else in the chain -- we should
                 # not allocate any resources to the broken Task.
                 self.update_request_status(
@@ -119,136 +234,266 @@ class ResourceManager(RequestMixin):
                     status=RequestStatus.CANCELED,
                     original_status=RequestStatus.PENDING,
                 )
-                return
-
-            devices = self.device_view.request_devices(
-                task_id=task_id,
-                device_names_str=[
-                    entry["device"]["content"]
-                    for entry in resource_request
-                    if entry["device"]["identifier"] == "name"
-                ],
-                device_types_str=[
-                    entry["device"]["content"]
-                    for entry in resource_request
-                    if entry["device"]["identifier"] == "type"
-                ],
-            )
-            # some devices are not available now
-            # the request cannot be fulfilled
-            if devices is None:
-                return
-
-            # replace device placeholder in sample position request
-            # and make it into a single list
-            parsed_sample_positions_request = []
-            for request in resource_request:
-                if request["device"]["identifier"] == _EXTRA_REQUEST:
-                    device_prefix = ""
-                else:
-                    device_name = devices[request["device"]["content"]]["name"]
-                    device_prefix = f"{device_name}{SamplePosition.SEPARATOR}"
-
-                for pos in request["sample_positions"]:
-                    prefix = pos["prefix"]
-                    # if this is a nested resource request, lets not prepend the device name twice.
-                    if not prefix.startswith(device_prefix):
-                        prefix = device_prefix + prefix
-                    parsed_sample_positions_request.append(
-                        SamplePositionRequest(prefix=prefix, number=pos["number"])
+                continue
+            active_requests.append(request_entry)
+        return active_requests
+
+    def _update_device_holds(self):
+        """
+        Soft-hold the expected devices (see ``BaseTask.expected_devices``) for the tasks that are going to
+        request resources soon, from the highest priority. The task gets the device used by its previous
+        task if any (e.g. the furnace with its samples), otherwise the idle device with least samples.
+
+        A device is held for at most one task. The hold expires after ``hold_seconds``, in case the task
+        never requests the device.
+        """
+        device_holds: dict[str, DeviceHold] = {}
+        hold_started_at: dict[tuple[ObjectId, str], float] = {}
+        if self._lookahead_holds and self._task_types_with_expected_devices:
+            now = time.time()
+            for task in self.task_view.get_imminent_tasks(
+                task_types=self._task_types_with_expected_devices
+            ):
+                for expected_device in task["type"].get_expected_devices():
+                    device_name = self._choose_device_to_hold(
+                        task, expected_device, device_holds
                     )
+                    if device_name is None:
+                        continue
+                    key = (task["task_id"], device_name)
+                    hold_started_at[key] = self._hold_started_at.get(key, now)
+                    if now - hold_started_at[key] < self._hold_seconds:
+                        device_holds[device_name] = DeviceHold(
+                            task_id=task["task_id"], priority=task["priority"]
+                        )
+        self._hold_started_at = hold_started_at
+        self._resource_index.set_device_holds(device_holds)
 
-            self._request_collection.update_one(
-                {"_id": request_entry["_id"]},
-                {
-                    "$set": {
-                        "parsed_sample_positions_request": [
-                            dict(spr) for spr in parsed_sample_positions_request
-                        ]
-                    }
-                },
+    def _choose_device_to_hold(
+        self,
+        task: dict[str, Any],
+        expected_device: dict[str, str],
+        device_holds: dict[str, DeviceHold],
+    ) -> str | None:
+        """Choose the device to hold for an expected device of a task. Return None if there is no need or no device."""
+        devices = self._resource_index.devices
+        if expected_device["identifier"] == "name":
+            candidates = (
+                [devices[expected_device["content"]]]
+                if expected_device["content"] in devices
+                else []
             )
-            sample_positions = self.sample_view.request_sample_positions(
-                task_id=task_id, sample_positions=parsed_sample_positions_request
+        else:
+            candidates = [
+                device
+                for device in devices.values()
+                if device.type == expected_device["content"]
+            ]
+        if any(device.task_id == task["task_id"] for device in candidates):
+            # the task has already got the device
+            return None
+        candidates = [
+            device for device in candidates if device.name not in device_holds
+        ]
+
+        for device in candidates:
+            if device.task_id is not None and device.task_id in task["prev_tasks"]:
+                return device.name
+        idle_devices = [
+            device
+            for device in candidates
+            if device.status == DeviceTaskStatus.IDLE.name
+            and device.pause_status == DevicePauseStatus.RELEASED.name
+        ]
+        if not idle_devices:
+            return None
+        return min(
+            idle_devices,
+            key=lambda device: self._resource_index.sample_count_on_device.get(
+                device.name, 0
+            ),
+        ).name
+
+    def _allocate_in_batch(self, requests: list[dict[str, Any]]) -> int:
+        """Plan the allocation for all the requests at once, and then grant the planned requests."""
+        granted = 0
+        for allocation in self._batch_allocator.solve(self._resource_index, requests):
+            if allocation.error is not None:
+                self._mark_request_as_error(allocation.request, allocation.error)
+                continue
+            if allocation.parsed_sample_positions_request is not None:
+                self._update_parsed_sample_positions_request(
+                    allocation.request, allocation.parsed_sample_positions_request
+                )
+            if allocation.granted:
+                granted += self._grant_request(
+                    allocation.request,
+                    devices=allocation.devices,  # type: ignore
+                    sample_positions=allocation.sample_positions,  # type: ignore
+                )
+        return granted
+
+    def _handle_requested_resources(self, request_entry: dict[str, Any]) -> bool:
+        """Try to assign the resources to a request. Return True if the request is fulfilled."""
+        try:
+            devices, parsed_sample_positions_request, sample_positions = (
+                self._resource_index.request_resources(
+                    task_id=request_entry["task_id"],
+                    resource_request=request_entry["request"],
+                    priority=request_entry["priority"],
+                )
             )
-            if sample_positions is None:
-                return
+            if parsed_sample_positions_request is not None:
+                self._update_parsed_sample_positions_request(
+                    request_entry, parsed_sample_positions_request
+                )
+            if devices is None or sample_positions is None:
+                return False
 
         # in case some errors happen, we will raise the error in the task process instead of the main process
         except Exception as error:  # pylint: disable=broad-except
-            # we will store the error in the database for easier debugging
             error.args = (format_exc(),)
-            returned_value = self._request_collection.update_one(
-                {"_id": request_entry["_id"], "status": RequestStatus.PENDING.name},
+            self._mark_request_as_error(request_entry, error)
+            return False
+
+        return self._grant_request(request_entry, devices, sample_positions)
+
+    def _update_parsed_sample_positions_request(
+        self,
+        request_entry: dict[str, Any],
+        parsed_sample_positions_request: list[SamplePositionRequest],
+    ):
+        parsed_sample_positions_request_entry = [
+            dict(spr) for spr in parsed_sample_positions_request
+        ]
+        # the request is evaluated in every loop until fulfilled, only write it when it changes
+        if (
+            request_entry.get("parsed_sample_positions_request")
+            != parsed_sample_positions_request_entry
+        ):
+            self._request_collection.update_one(
+                {"_id": request_entry["_id"]},
                 {
                     "$set": {
-                        "status": RequestStatus.ERROR.name,
-                        "error": dill.dumps(error),
-                        "assigned_devices": None,
-                        "assigned_sample_positions": None,
+                        "parsed_sample_positions_request": parsed_sample_positions_request_entry
                     }
                 },
             )
-            if returned_value.modified_count != 1:
-                raise DocumentNotUpdatedError(
-                    f"Error updating request {request_entry['_id']}: cannot update the request status from PENDING "
-                    f"to ERROR."
-                ) from error
-            return
 
+    def _mark_request_as_error(self, request_entry: dict[str, Any], error: Exception):
+        # we will store the error in the database for easier debugging
+        returned_value = self._request_collection.update_one(
+            {"_id": request_entry["_id"], "status": RequestStatus.PENDING.name},
+            {
+                "$set": {
+                    "status": RequestStatus.ERROR.name,
+                    "error": _ERROR_CODEC.encode(error),
+                    "error_content_type": _ERROR_CODEC.content_type,
+                    "assigned_devices": None,
+                    "assigned_sample_positions": None,
+                }
+            },
+        )
+        if returned_value.modified_count != 1:
+            raise DocumentNotUpdatedError(
+                f"Error updating request {request_entry['_id']}: cannot update the request status from PENDING "
+                f"to ERROR."
+            ) from error
+
+    def _grant_request(
+        self,
+        request_entry: dict[str, Any],
+        devices: dict[str, dict[str, Any]],
+        sample_positions: dict[str, list[dict[str, Any]]],
+    ) -> bool:
+        """Occupy the resources and mark the request as fulfilled. Return True if the request is fulfilled."""
+        task_id = request_entry["task_id"]
         # if both devices and sample positions can be satisfied
         request_entry = self._request_collection.find_one(
             {"_id": request_entry["_id"], "status": RequestStatus.PENDING.name}
         )
+        if request_entry is None:
+            return False
 
-        if request_entry is not None:
-            # label the resources as occupied
+        # label the resources as occupied. The updates are guarded (compare-and-swap), so if any resource
+        # has been taken by others since we read it, roll back what we have taken and retry in the next loop.
+        try:
             self._occupy_devices(devices=devices, task_id=task_id)
             self._occupy_sample_positions(
                 sample_positions=sample_positions, task_id=task_id
             )
-
-            returned_value = self._request_collection.update_one(
-                {"_id": request_entry["_id"], "status": RequestStatus.PENDING.name},
-                {
-                    "$set": {
-                        "assigned_devices": devices,
-                        "assigned_sample_positions": sample_positions,
-                        "status": RequestStatus.FULFILLED.name,
-                        "fulfilled_at": datetime.now(),
-                    }
-                },
+        except ValueError:
+            self._release_devices(devices, task_id=task_id)
+            self._release_sample_positions(sample_positions, task_id=task_id)
+            cli_logger.debug(
+                f"Resources for request {request_entry['_id']} were taken by others, will retry."
             )
+            # the index is out of date
+            self._resource_index.load()
+            return False
+        self._resource_index.occupy(
+            task_id=task_id, devices=devices, sample_positions=sample_positions
+        )
 
-            # if the request status cannot be updated (due to status change), release the resources
-            if returned_value.modified_count != 1:
-                self._release_devices(devices)
-                self._release_sample_positions(sample_positions)
+        returned_value = self._request_collection.update_one(
+            {"_id": request_entry["_id"], "status": RequestStatus.PENDING.name},
+            {
+                "$set": {
+                    "assigned_devices": devices,
+                    "assigned_sample_positions": sample_positions,
+                    "status": RequestStatus.FULFILLED.name,
+                    "fulfilled_at": datetime.now(),
+                }
+            },
+        )
+
+        # if the request status cannot be updated (due to status change), release the resources
+        if returned_value.modified_count != 1:
+            self._release_devices(devices, task_id=task_id)
+            self._release_sample_positions(sample_positions, task_id=task_id)
+            self._resource_index.release(devices, sample_positions)
+            return False
+        return True
 
     def _occupy_devices(self, devices: dict[str, dict[str, Any]], task_id: ObjectId):
-        for device in devices.values():
-            self.device_view.occupy_device(
-                device=cast(str, device["name"]), task_id=task_id
-            )
+        self.device_view.occupy_devices(
+            devices=[cast(str, device["name"]) for device in devices.values()],
+            task_id=task_id,
+        )
 
     def _occupy_sample_positions(
         self, sample_positions: dict[str, list[dict[str, Any]]], task_id: ObjectId
     ):
-        for sample_positions_ in sample_positions.values():
-            for sample_position_ in sample_positions_:
-                self.sample_view.lock_sample_position(
-                    task_id, cast(str, sample_position_["name"])
-                )
+        self.sample_view.lock_sample_positions(
+            task_id=task_id,
+            positions=[
+                cast(str, sample_position_["name"])
+                for sample_positions_ in sample_positions.values()
+                for sample_position_ in sample_positions_
+            ],
+        )
 
-    def _release_devices(self, devices: dict[str, dict[str, Any]]):
-        for device in devices.values():
-            if device["need_release"]:
-                self.device_view.release_device(device["name"])
+    def _release_devices(
+        self, devices: dict[str, dict[str, Any]], task_id: ObjectId | None = None
+    ):
+        self.device_view.release_devices(
+            device_names=[
+                device["name"] for device in devices.values() if device["need_release"]
+            ],
+            task_id=task_id,
+        )
 
     def _release_sample_positions(
-        self, sample_positions: dict[str, list[dict[str, Any]]]
+        self,
+        sample_positions: dict[str, list[dict[str, Any]]],
+        task_id: ObjectId | None = None,
     ):
-        for sample_positions_ in sample_positions.values():
-            for sample_position in sample_positions_:
-                if sample_position["need_release"]:
-                    self.sample_view.release_sample_position(sample_position["name"])
+        self.sample_view.release_sample_positions(
+            positions=[
+                sample_position["name"]
+                for sample_positions_ in sample_positions.values()
+                for sample_position in sample_positions_
+                if sample_position["need_release"]
+            ],
+            task_id=task_id,
+        )
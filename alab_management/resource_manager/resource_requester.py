@@ -7,22 +7,24 @@ import concurrent
 import time
 from concurrent.futures import Future
 from datetime import datetime
-from threading import Thread
+from threading import Lock, Thread
 from traceback import print_exc
 from typing import Any, cast
 
-import dill
 from bson import ObjectId
 from pydantic import BaseModel, model_validator
 from pydantic.root_model import RootModel
 
+from alab_management.config import AlabOSConfig
 from alab_management.device_view.device import BaseDevice
 from alab_management.device_view.device_view import DeviceView
 from alab_management.resource_manager.enums import _EXTRA_REQUEST, RequestStatus
 from alab_management.sample_view.sample import SamplePosition
 from alab_management.sample_view.sample_view import SamplePositionRequest
 from alab_management.task_view import TaskPriority
+from alab_management.utils.codec import get_codec
 from alab_management.utils.data_objects import DocumentNotUpdatedError, get_collection
+from alab_management.utils.db_watcher import CollectionWatcher
 
 _SampleRequestDict = dict[str, int]
 _ResourceRequestDict = dict[
@@ -30,6 +32,43 @@ _ResourceRequestDict = dict[
 ]  # the raw request sent by task process
 
 
+# even with change streams, we still check the database from time to time just in case
+_MAX_IDLE_SECONDS = 5.0
+
+_request_watcher: CollectionWatcher | None = None
+_request_watcher_lock = Lock()
+
+
+def _get_request_watcher() -> CollectionWatcher:
+    """
+    Get the watcher over the status updates in the requests collection. It is shared by
+    all the requesters in the same process, so that there is only one change stream per process.
+    """
+    global _request_watcher
+    with _request_watcher_lock:
+        if _request_watcher is None:
+            _request_watcher = CollectionWatcher(
+                get_collection("requests"),
+                pipeline=[
+                    {
+                        "$match": {
+                            "operationType": "update",
+                            "updateDescription.updatedFields.status": {
+                                "$in": [
+                                    RequestStatus.FULFILLED.name,
+                                    RequestStatus.RELEASED.name,
+                                    RequestStatus.CANCELED.name,
+                                    RequestStatus.ERROR.name,
+                                ]
+                            },
+                        }
+                    }
+                ],
+            )
+            _request_watcher.start()
+        return _request_watcher
+
+
 class RequestCanceledError(Exception):
     """Request Canceled Error."""
 
@@ -119,6 +158,57 @@ class ResourcesRequest(RootModel):
         return new_values
 
 
+def format_resource_request(
+    resource_request: _ResourceRequestDict,
+) -> tuple[list[dict[str, Any]], dict[str, type[BaseDevice] | str | None]]:
+    """
+    Convert the resource request of a task (``{device: {position: number, ...}, ...}``) to the format
+    stored in the ``requests`` collection.
+
+    Returns
+    -------
+        a tuple of (the formatted request, a dict from the device string in the formatted request
+        to the device in the original request)
+    """
+    formatted_resource_request = []
+
+    device_str_to_request = {}
+    for device, position_dict in resource_request.items():
+        if device is None:
+            identifier = _EXTRA_REQUEST
+            content = _EXTRA_REQUEST
+        elif isinstance(device, str):
+            identifier = "name"
+            content = device
+        elif issubclass(device, BaseDevice):
+            identifier = "type"
+            content = device.__name__
+        else:
+            raise ValueError(
+                "device must be a name of a specific device, a class of type BaseDevice, or None"
+            )
+        device_str_to_request[content] = device
+
+        positions = [
+            dict(SamplePositionRequest(prefix=prefix, number=number))
+            for prefix, number in position_dict.items()
+        ]  # immediate dict conversion - SamplePositionRequest is only used to check request format.
+        formatted_resource_request.append(
+            {
+                "device": {
+                    "identifier": identifier,
+                    "content": content,
+                },
+                "sample_positions": positions,
+            }
+        )
+
+    return (
+        ResourcesRequest(root=formatted_resource_request).model_dump(mode="json"),  # type: ignore
+        device_str_to_request,
+    )
+
+
 class RequestMixin:
     """Simple wrapper for the request collection."""
 
@@ -195,6 +285,13 @@ class ResourceRequester(RequestMixin):
         )  # will usually be overwritten by BaseTask instantiation.
 
         super().__init__()
+        self._watcher: CollectionWatcher | None = (
+            _get_request_watcher()
+            if AlabOSConfig()
+            .get("resource_manager", {})
+            .get("use_change_streams", False)
+            else None
+        )
         self._stop = False
         self._thread = Thread(
             target=self._check_request_status_loop, name="CheckRequestStatus"
@@ -205,6 +302,8 @@ class ResourceRequester(RequestMixin):
     def __close__(self):
         """Close the thread."""
         self._stop = True
+        if self._watcher is not None:
+            self._watcher.wake()
         self._thread.join()
 
     __del__ = __close__
@@ -225,43 +324,8 @@ class ResourceRequester(RequestMixin):
         if priority is None:
             priority = self.priority
 
-        formatted_resource_request = []
-
-        device_str_to_request = {}
-        for device, position_dict in resource_request.items():
-            if device is None:
-                identifier = _EXTRA_REQUEST
-                content = _EXTRA_REQUEST
-            elif isinstance(device, str):
-                identifier = "name"
-                content = device
-            elif issubclass(device, BaseDevice):
-                identifier = "type"
-                content = device.__name__
-            else:
-                raise ValueError(
-                    "device must be a name of a specific device, a class of type BaseDevice, or None"
-                )
-            device_str_to_request[content] = device
-
-            positions = [
-                dict(SamplePositionRequest(prefix=prefix, number=number))
-                for prefix, number in position_dict.items()
-            ]  # immediate dict conversion - SamplePositionRequest is only used to check request format.
-            formatted_resource_request.append(
-                {
-                    "device": {
-                        "identifier": identifier,
-                        "content": content,
-                    },
-                    "sample_positions": positions,
-                }
-            )
-
-        if not isinstance(formatted_resource_request, ResourcesRequest):
-            formatted_resource_request = ResourcesRequest(root=formatted_resource_request)  # type: ignore
-        formatted_resource_request = formatted_resource_request.model_dump(  # pylint: disable=assignment-from-no-return
-            mode="json"
+        formatted_resource_request, device_str_to_request = format_resource_request(
+            resource_request
         )
 
         result = self._request_collection.insert_one(
@@ -275,6 +339,9 @@ class ResourceRequester(RequestMixin):
         )  # DB_ACCESS_OUTSIDE_VIEW
         _id: ObjectId = cast(ObjectId, result.inserted_id)
         self._waiting[_id] = {"f": f, "device_str_to_request": device_str_to_request}
+        if self._watcher is not None:
+            # the request may have been handled before it is added to the waiting list
+            self._watcher.wake()
         try:
             result = self.get_concurrent_result(f, timeout=timeout)
         except concurrent.futures.TimeoutError as e:
@@ -339,12 +406,15 @@ class ResourceRequester(RequestMixin):
             )
 
         # wait for the request to be released or canceled or errored during the release
-        while self.get_request(request_id, projection=["status"])["status"] not in [
-            RequestStatus.RELEASED.name,
-            RequestStatus.CANCELED.name,
-            RequestStatus.ERROR.name,
-        ]:
-            time.sleep(0.5)
+        while True:
+            generation = self._watcher.generation if self._watcher is not None else 0
+            if self.get_request(request_id, projection=["status"])["status"] in [
+                RequestStatus.RELEASED.name,
+                RequestStatus.CANCELED.name,
+                RequestStatus.ERROR.name,
+            ]:
+                break
+            self._wait_for_request_updates(since=generation)
 
     def release_all_resources(self):
         """
@@ -411,21 +481,36 @@ class ResourceRequester(RequestMixin):
         ):
             time.sleep(0.5)
 
+    def _wait_for_request_updates(self, since: int):
+        """
+        Wait before checking the requests again. If the change stream is available, return as soon
+        as any request status is updated after the generation ``since``.
+        """
+        if self._watcher is not None and self._watcher.available:
+            self._watcher.wait(since=since, timeout=_MAX_IDLE_SECONDS)
+        else:
+            time.sleep(0.5)
+
     def _check_request_status_loop(self):
         while not self._stop:
+            generation = self._watcher.generation if self._watcher is not None else 0
             try:
-                for request_id in self._waiting.copy():
-                    status = self.get_request(request_id=request_id, projection=["status"])["status"]  # type: ignore
-                    if status == RequestStatus.FULFILLED.name:
-                        self._handle_fulfilled_request(request_id=request_id)
-                    elif status == RequestStatus.ERROR.name:
-                        self._handle_error_request(request_id=request_id)
-                    elif status == RequestStatus.CANCELED.name:
-                        self._handle_canceled_request(request_id=request_id)
+                waiting_request_ids = list(self._waiting)
+                if waiting_request_ids:
+                    for entry in self._request_collection.find(
+                        {"_id": {"$in": waiting_request_ids}}, projection=["status"]
+                    ):
+                        request_id, status = entry["_id"], entry["status"]
+                        if status == RequestStatus.FULFILLED.name:
+                            self._handle_fulfilled_request(request_id=request_id)
+                        elif status == RequestStatus.ERROR.name:
+                            self._handle_error_request(request_id=request_id)
+                        elif status == RequestStatus.CANCELED.name:
+                            self._handle_canceled_request(request_id=request_id)
             except Exception:
                 print_exc()  # for debugging in the test
                 raise
-            time.sleep(0.5)
+            self._wait_for_request_updates(since=generation)
 
     def _handle_fulfilled_request(self, request_id: ObjectId):
         entry = self.get_request(request_id)
@@ -464,7 +549,10 @@ class ResourceRequester(RequestMixin):
         if entry["status"] != RequestStatus.ERROR.name:  # type: ignore
             return
 
-        error: Exception = dill.loads(entry["error"])  # type: ignore
+        # the errors stored before the codecs were introduced have no content type (dill)
+        error: Exception = get_codec(entry.get("error_content_type")).decode(  # type: ignore
+            entry["error"]  # type: ignore
+        )
         request: dict[str, Any] = self._waiting.pop(request_id)
         f: Future = request["f"]
         f.set_exception(error)
@@ -0,0 +1,347 @@
+"""
+A discrete-event simulator that estimates how long a campaign (a batch of experiments) takes in the lab.
+
+The experiments are played in virtual time on the devices and sample positions defined in the lab
+(the same as ``setup_lab`` writes to the database), with the allocation policy of the
+:py:class:`ResourceManager <alab_management.resource_manager.resource_manager.ResourceManager>`.
+Nothing is written to the database, and no device, RabbitMQ or worker is needed.
+
+The tasks are not actually run. Every task makes one resource request as soon as all of its previous
+tasks are completed, keeps the resources for its duration (given by a duration model), and then
+releases them.
+"""
+
+import heapq
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+from bson import ObjectId
+
+from alab_management.builders.experimentbuilder import ExperimentBuilder
+from alab_management.config import AlabOSConfig
+from alab_management.resource_manager.allocator import Allocation, BatchAllocator
+from alab_management.resource_manager.resource_index import ResourceIndex
+from alab_management.resource_manager.resource_requester import (
+    _ResourceRequestDict,
+    format_resource_request,
+)
+from alab_management.task_view.task import get_task_by_name
+from alab_management.task_view.task_view import TaskView
+
+# the duration of a task in seconds, or a function of the task parameters that returns the duration
+DurationModel = float | Callable[[dict[str, Any]], float]
+
+
+@dataclass
+class SimulatedTask:
+    """The timeline of a task in the simulation, in seconds since the start of the campaign."""
+
+    task_id: ObjectId
+    task_type: str
+    experiment: str
+    priority: int
+    parameters: dict[str, Any] = field(default_factory=dict, repr=False)
+    ready_at: float | None = None
+    started_at: float | None = None
+    completed_at: float | None = None
+    devices: list[str] = field(default_factory=list)
+
+    @property
+    def queueing_delay(self) -> float:
+        """The time between the task is ready and it gets all the resources."""
+        if self.ready_at is None or self.started_at is None:
+            raise ValueError(f"Task {self.task_id} has not started.")
+        return self.started_at - self.ready_at
+
+
+@dataclass
+class SimulationResult:
+    """The result of a simulated campaign."""
+
+    makespan: float
+    device_utilization: dict[str, float]
+    tasks: list[SimulatedTask]
+    # the real time used by the simulation
+    wall_time: float
+
+    @property
+    def mean_queueing_delay(self) -> float:
+        """The average time that a task waits for its resources."""
+        if not self.tasks:
+            return 0.0
+        return sum(task.queueing_delay for task in self.tasks) / len(self.tasks)
+
+    @property
+    def max_queueing_delay(self) -> float:
+        """The longest time that a task waits for its resources."""
+        return max((task.queueing_delay for task in self.tasks), default=0.0)
+
+    def get_queueing_delay_by_task_type(self) -> dict[str, float]:
+        """The average time that a task waits for its resources, by task type."""
+        delays: dict[str, list[float]] = defaultdict(list)
+        for task in self.tasks:
+            delays[task.task_type].append(task.queueing_delay)
+        return {
+            task_type: sum(delays_) / len(delays_)
+            for task_type, delays_ in delays.items()
+        }
+
+
+class CampaignSimulator:
+    """
+    Simulate a campaign in virtual time and report the makespan, the device utilization and
+    the queueing delay of the tasks.
+
+    The resources that a task requests are given by ``resource_requests`` (in the same format as
+    :py:meth:`LabView.request_resources <alab_management.lab_view.LabView.request_resources>`),
+    or by the ``expected_devices`` of the task class if the task type is not in ``resource_requests``.
+
+    To see how the device counts affect the throughput, define more (or fewer) devices in the lab
+    and run the simulation again. For example,
+
+    .. code-block:: python
+
+      simulator = CampaignSimulator(
+          duration_models={"Heating": lambda parameters: parameters["duration"], "Moving": 60},
+          resource_requests={"Heating": {Furnace: {"inside": 1}}, "Moving": {"robot_arm": {}}},
+      )
+      result = simulator.run(experiments)
+      print(result.makespan, result.device_utilization, result.mean_queueing_delay)
+    """
+
+    def __init__(
+        self,
+        duration_models: dict[str, DurationModel],
+        resource_requests: dict[str, _ResourceRequestDict] | None = None,
+        allocation: str | None = None,
+        aging_rate: float | None = None,
+        starvation_seconds: float | None = None,
+        resource_index: ResourceIndex | None = None,
+    ):
+        """
+        Create a simulator.
+
+        Args:
+            duration_models: the duration model of every task type
+            resource_requests: the resource request of the task types (if not given by ``expected_devices``)
+            allocation: "greedy" or "batch", the same as the ``[resource_manager]`` config by default
+            aging_rate: the aging rate of the batch allocation, the same as the config by default
+            starvation_seconds: the starvation time of the batch allocation, the same as the config by default
+            resource_index: the layout of the lab. By default, it is the lab defined in the working directory.
+        """
+        resource_manager_config = AlabOSConfig().get("resource_manager", {})
+        self._allocation = allocation or resource_manager_config.get(
+            "allocation", "greedy"
+        )
+        if self._allocation not in {"greedy", "batch"}:
+            raise ValueError(f"Unknown allocation mode: {self._allocation}")
+        self._batch_allocator = BatchAllocator(
+            aging_rate=(
+                aging_rate
+                if aging_rate is not None
+                else resource_manager_config.get("aging_rate", 1.0)
+            ),
+            starvation_seconds=(
+                starvation_seconds
+                if starvation_seconds is not None
+                else resource_manager_config.get("starvation_seconds", 600.0)
+            ),
+        )
+        self._duration_models = duration_models
+        self._resource_requests = resource_requests or {}
+        self._formatted_requests: dict[str, list[dict[str, Any]]] = {}
+        self.resource_index = resource_index or ResourceIndex.from_definitions()
+
+    def run(
+        self, experiments: Iterable[ExperimentBuilder | dict[str, Any]]
+    ) -> SimulationResult:
+        """
+        Simulate a campaign.
+
+        Args:
+            experiments: the experiments in the campaign, as ``ExperimentBuilder`` or its ``to_dict()``.
+              All of them are submitted at the start of the campaign.
+        """
+        wall_start = time.perf_counter()
+        tasks, next_tasks, remaining_prev_tasks = self._build_tasks(experiments)
+        index = self.resource_index.snapshot()
+        start_time = datetime.now()
+
+        now = 0.0
+        # task index -> the pending request of the task
+        pending_requests: dict[int, dict[str, Any]] = {}
+        # task index -> the granted allocation of the task
+        allocations: dict[int, Allocation] = {}
+        # (completion time, task index)
+        completions: list[tuple[float, int]] = []
+        busy_time: dict[str, float] = defaultdict(float)
+
+        def submit_request(i: int):
+            tasks[i].ready_at = now
+            pending_requests[i] = {
+                "_id": i,
+                "task_id": tasks[i].task_id,
+                "task_type": tasks[i].task_type,
+                "request": self._get_formatted_request(tasks[i].task_type),
+                "priority": tasks[i].priority,
+                "submitted_at": start_time + timedelta(seconds=now),
+            }
+
+        for i, remaining in enumerate(remaining_prev_tasks):
+            if remaining == 0:
+                submit_request(i)
+
+        while pending_requests or completions:
+            for allocation in self._allocate(
+                index,
+                list(pending_requests.values()),
+                start_time + timedelta(seconds=now),
+            ):
+                i = allocation.request["_id"]
+                del pending_requests[i]
+                allocations[i] = allocation
+                tasks[i].started_at = now
+                tasks[i].devices = [
+                    device["name"] for device in allocation.devices.values()  # type: ignore
+                ]
+                heapq.heappush(completions, (now + self._get_duration(tasks[i]), i))
+
+            if not completions:
+                raise RuntimeError(
+                    f"{len(pending_requests)} tasks can never get their resources, e.g. "
+                    f"{tasks[next(iter(pending_requests))].task_type}."
+                )
+            # complete all the tasks at this moment before the next allocation
+            now, i = heapq.heappop(completions)
+            completed = [i]
+            while completions and completions[0][0] == now:
+                completed.append(heapq.heappop(completions)[1])
+            for i in completed:
+                allocation = allocations.pop(i)
+                index.release(allocation.devices, allocation.sample_positions)  # type: ignore
+                for device_name in tasks[i].devices:
+                    busy_time[device_name] += now - tasks[i].started_at  # type: ignore
+                tasks[i].completed_at = now
+                for next_task in next_tasks[i]:
+                    remaining_prev_tasks[next_task] -= 1
+                    if remaining_prev_tasks[next_task] == 0:
+                        submit_request(next_task)
+
+        makespan = max((task.completed_at for task in tasks), default=0.0)  # type: ignore
+        return SimulationResult(
+            makespan=makespan,
+            device_utilization={
+                device_name: busy_time[device_name] / makespan if makespan else 0.0
+                for device_name in index.devices
+            },
+            tasks=tasks,
+            wall_time=time.perf_counter() - wall_start,
+        )
+
+    def _build_tasks(
+        self, experiments: Iterable[ExperimentBuilder | dict[str, Any]]
+    ) -> tuple[list[SimulatedTask], list[list[int]], list[int]]:
+        """Get the tasks of all the experiments, the next tasks and the number of previous tasks of every task."""
+        tasks: list[SimulatedTask] = []
+        next_tasks: list[list[int]] = []
+        remaining_prev_tasks: list[int] = []
+        for experiment_ in experiments:
+            experiment = (
+                experiment_.to_dict()
+                if isinstance(experiment_, ExperimentBuilder)
+                else experiment_
+            )
+            # the previous tasks are given by their indices in the experiment
+            offset = len(tasks)
+            for task in experiment["tasks"]:
+                if task["type"] not in self._duration_models:
+                    raise ValueError(f"No duration model for task type {task['type']}")
+                tasks.append(
+                    SimulatedTask(
+                        task_id=ObjectId(),
+                        task_type=task["type"],
+                        experiment=experiment["name"],
+                        priority=TaskView._get_priority(task["parameters"]),
+                        parameters=task["parameters"],
+                    )
+                )
+                next_tasks.append([])
+                remaining_prev_tasks.append(len(task["prev_tasks"]))
+            for i, task in enumerate(experiment["tasks"]):
+                for prev_task in task["prev_tasks"]:
+                    next_tasks[offset + prev_task].append(offset + i)
+        return tasks, next_tasks, remaining_prev_tasks
+
+    def _get_formatted_request(self, task_type: str) -> list[dict[str, Any]]:
+        """Get the resource request of a task type in the format of the ``requests`` collection."""
+        if task_type not in self._formatted_requests:
+            resource_request = self._resource_requests.get(task_type)
+            if resource_request is None:
+                resource_request = {
+                    device: {}
+                    for device in get_task_by_name(task_type).expected_devices
+                }
+            self._formatted_requests[task_type] = format_resource_request(
+                resource_request
+            )[0]
+        return self._formatted_requests[task_type]
+
+    def _get_duration(self, task: SimulatedTask) -> float:
+        duration_model = self._duration_models[task.task_type]
+        if callable(duration_model):
+            return float(duration_model(task.parameters))
+        return float(duration_model)
+
+    def _allocate(
+        self, index: ResourceIndex, requests: list[dict[str, Any]], now: datetime
+    ) -> list[Allocation]:
+        """
+        Allocate the resources to the pending requests in the same way as the resource manager,
+        occupy them in the index and return the granted allocations.
+        """
+        if self._allocation == "batch":
+            granted = []
+            for allocation in self._batch_allocator.solve(index, requests, now=now):
+                if allocation.error is not None:
+                    raise allocation.error
+                if allocation.granted:
+                    index.occupy(
+                        allocation.request["task_id"],
+                        allocation.devices,  # type: ignore
+                        allocation.sample_positions,  # type: ignore
+                    )
+                    granted.append(allocation)
+            return granted
+
+        requests.sort(key=lambda x: x["submitted_at"])
+        requests.sort(key=lambda x: x["priority"], reverse=True)
+        granted = []
+        # the tasks of the same type make the same request, so if one of them cannot be fulfilled,
+        # the others (with the same priority) cannot be fulfilled either until some resources are released
+        blocked_requests: set[tuple[str, int]] = set()
+        for request in requests:
+            if (request["task_type"], request["priority"]) in blocked_requests:
+                continue
+            devices, parsed_sample_positions_request, sample_positions = (
+                index.request_resources(
+                    task_id=request["task_id"],
+                    resource_request=request["request"],
+                    priority=request["priority"],
+                )
+            )
+            allocation = Allocation(
+                request=request,
+                devices=devices,
+                parsed_sample_positions_request=parsed_sample_positions_request,
+                sample_positions=sample_positions,
+            )
+            if not allocation.granted:
+                blocked_requests.add((request["task_type"], request["priority"]))
+                continue
+            index.occupy(request["task_id"], devices, sample_positions)  # type: ignore
+            granted.append(allocation)
+        return granted
@@ -0,0 +1,62 @@
+"""
+An ordered in-memory index of the sample position names, which resolves a position prefix
+(e.g. ``furnace_1/tray``) to all the matched sample positions without scanning the database.
+"""
+
+from bisect import bisect_left, insort
+from collections.abc import Iterable
+from typing import Any
+
+
+class SamplePositionIndex:
+    """
+    Ordered index of sample position names.
+
+    The names are kept sorted, so that all the names with a given prefix are next to each
+    other. A prefix lookup is a binary search plus a walk over the matched names, i.e.
+    O(log n + k) where k is the number of matched positions. The matched names are returned
+    in the order they were added (the same order as in the database).
+    """
+
+    def __init__(self, sample_position_entries: Iterable[dict[str, Any]] = ()):
+        """
+        Args:
+            sample_position_entries: the entries in the ``sample_positions`` collection,
+              which should contain at least the ``name`` field.
+        """
+        self._order: dict[str, int] = {}
+        self._parent_devices: dict[str, str | None] = {}
+        for entry in sample_position_entries:
+            if entry["name"] not in self._order:
+                self._order[entry["name"]] = len(self._order)
+                self._parent_devices[entry["name"]] = entry.get("parent_device")
+        self._sorted_names: list[str] = sorted(self._order)
+
+    def __len__(self) -> int:
+        """The number of sample positions in the index."""
+        return len(self._order)
+
+    def __contains__(self, name: str) -> bool:
+        """Whether a sample position is in the index."""
+        return name in self._order
+
+    def add(self, name: str, parent_device: str | None = None):
+        """Add a sample position to the index."""
+        if name in self._order:
+            return
+        self._order[name] = len(self._order)
+        self._parent_devices[name] = parent_device
+        insort(self._sorted_names, name)
+
+    def get_names_with_prefix(self, prefix: str) -> list[str]:
+        """Get the names of all the sample positions that start with ``prefix``, in the order they were added."""
+        names = []
+        i = bisect_left(self._sorted_names, prefix)
+        while i < len(self._sorted_names) and self._sorted_names[i].startswith(prefix):
+            names.append(self._sorted_names[i])
+            i += 1
+        return sorted(names, key=self._order.__getitem__)
+
+    def get_parent_device(self, name: str) -> str | None:
+        """Get the parent device of a sample position."""
+        return self._parent_devices[name]
@@ -54,6 +54,23 @@ class SamplePosition:
                 f"must be >= 0."
             )
 
+    def get_names(self, parent_device_name: str | None = None) -> list[str]:
+        """
+        Get the names of the sample positions as they are stored in the database.
+
+        We use ``<name><SEPARATOR><number>`` format to create multiple sample positions. If there is only one
+        sample position (``number == 1``), the name is directly used. The positions in a device are prefixed
+        with the device name.
+        """
+        names = (
+            [f"{self.name}{self.SEPARATOR}{i + 1}" for i in range(self.number)]
+            if self.number != 1
+            else [self.name]
+        )
+        if parent_device_name:
+            names = [f"{parent_device_name}{self.SEPARATOR}{name}" for name in names]
+        return names
+
 
 _standalone_sample_position_registry: dict[str, SamplePosition] = {}
 
@@ -1,6 +1,7 @@
 """A wrapper over the ``samples`` and ``sample_positions`` collections."""
 
 import re
+import threading
 import time
 from datetime import datetime
 from enum import Enum, auto
@@ -9,11 +10,20 @@ from typing import Any, cast
 import pymongo  # type: ignore
 from bson import ObjectId  # type: ignore
 from pydantic import BaseModel, ConfigDict, conint
+from pymongo import UpdateOne, WriteConcern
+from pymongo.client_session import ClientSession
 
-from alab_management.utils.data_objects import get_collection, get_lock
+from alab_management.utils.data_objects import get_collection
 
+from .position_index import SamplePositionIndex
 from .sample import Sample, SamplePosition
 
+# The sample positions are only added in ``setup_lab``, so each process caches an index of the
+# position names (keyed by the full name of the collection) for prefix lookups. The index is
+# rebuilt if a prefix cannot be found in it, in case the positions are added by another process.
+_position_indexes: dict[str, SamplePositionIndex] = {}
+_position_indexes_lock = threading.Lock()
+
 
 class SamplePositionRequest(BaseModel):
     """
@@ -62,15 +72,15 @@ class SampleView:
     def __init__(self):
         self._sample_collection = get_collection("samples")
         self._sample_positions_collection = get_collection("sample_positions")
-        self._sample_positions_collection.create_index(
-            [
-                (
-                    "name",
-                    pymongo.HASHED,
-                )
-            ]
+        # ascending indexes can serve both the exact match and the prefix match (anchored regex)
+        self._sample_positions_collection.create_index([("name", pymongo.ASCENDING)])
+        self._sample_collection.create_index([("position", pymongo.ASCENDING)])
+        # the locks of sample positions are confirmed by the write concern instead of re-reading
+        self._sample_positions_collection_majority = (
+            self._sample_positions_collection.with_options(
+                write_concern=WriteConcern(w="majority")
+            )
         )
-        self._lock = get_lock(self._sample_positions_collection.name)
 
     def add_sample_positions_to_db(
         self,
@@ -88,18 +98,7 @@ class SampleView:
             parent_device_name: name of the parent device to these sample_positions.
         """
         for sample_pos in sample_positions:
-            for i in range(sample_pos.number):
-                # we use <name><SEPARATOR><number> format to create multiple sample positions
-                # if there is only one sample position (sample_position.number == 1)
-                # the name of sample position will be directly used as the sample position's name in the database
-                name = (
-                    f"{sample_pos.name}{SamplePosition.SEPARATOR}{i+1}"  # index from 1
-                    if sample_pos.number != 1
-                    else sample_pos.name
-                )
-                if parent_device_name:
-                    name = f"{parent_device_name}{SamplePosition.SEPARATOR}{name}"
-
+            for name in sample_pos.get_names(parent_device_name):
                 if re.search(r"[$.]", name) is not None:
                     raise ValueError(
                         f"Unsupported sample position name: {name}. "
@@ -117,10 +116,42 @@ class SampleView:
                     if parent_device_name:
                         new_entry["parent_device"] = parent_device_name
                     self._sample_positions_collection.insert_one(new_entry)
+                    with _position_indexes_lock:
+                        position_index = _position_indexes.get(
+                            self._sample_positions_collection.full_name
+                        )
+                        if position_index is not None:
+                            position_index.add(name, parent_device_name)
 
     def clean_up_sample_position_collection(self):
         """Drop the sample position collection."""
         self._sample_positions_collection.drop()
+        with _position_indexes_lock:
+            _position_indexes.pop(self._sample_positions_collection.full_name, None)
+
+    def get_position_index(self, reload: bool = False) -> SamplePositionIndex:
+        """
+        Get the cached index of the sample position names, which is built from the database on first use.
+
+        Args:
+            reload: rebuild the index from the database
+        """
+        key = self._sample_positions_collection.full_name
+        with _position_indexes_lock:
+            if reload or key not in _position_indexes:
+                _position_indexes[key] = SamplePositionIndex(
+                    self._sample_positions_collection.find(
+                        {}, projection=["name", "parent_device"]
+                    )
+                )
+            return _position_indexes[key]
+
+    def get_sample_positions_with_prefix(self, prefix: str) -> list[str]:
+        """Get the names of all the sample positions that start with the prefix."""
+        names = self.get_position_index().get_names_with_prefix(prefix)
+        if not names:
+            names = self.get_position_index(reload=True).get_names_with_prefix(prefix)
+        return names
 
     def request_sample_positions(
         self,
@@ -130,6 +161,9 @@ class SampleView:
         """
         Request a list of sample positions, this function will return until all the sample positions are available.
 
+        This method only reads the database. The positions are not reserved until they are locked with
+        ``lock_sample_positions``, which only succeeds if they are still available.
+
         Args:
             task_id: the task id that requests these resources
             sample_positions: the list of sample positions, which is requested by their names.
@@ -152,28 +186,25 @@ class SampleView:
 
         # check if there are enough positions
         for sample_position in sample_positions_request:
-            count = self._sample_positions_collection.count_documents(
-                {"name": {"$regex": f"^{re.escape(sample_position.prefix)}"}}
-            )
+            count = len(self.get_sample_positions_with_prefix(sample_position.prefix))
             if count < sample_position.number:
                 raise ValueError(
                     f"Position prefix `{sample_position.prefix}` can only "
                     f"have {count} matches, but requests {sample_position.number}"
                 )
 
-        with self._lock():  # pylint: disable=not-callable
-            available_positions: dict[str, list[dict[str, str | bool]]] = {}
-            for sample_position in sample_positions_request:
-                result = self.get_available_sample_position(
-                    task_id, position_prefix=sample_position.prefix
-                )
-                if not result or len(result) < sample_position.number:
-                    return None
-                # we try to choose the position that has already been locked by this task
-                available_positions[sample_position.prefix] = sorted(
-                    result, key=lambda task: int(task["need_release"])
-                )[: sample_position.number]
-            return available_positions
+        available_positions: dict[str, list[dict[str, str | bool]]] = {}
+        for sample_position in sample_positions_request:
+            result = self.get_available_sample_position(
+                task_id, position_prefix=sample_position.prefix
+            )
+            if not result or len(result) < sample_position.number:
+                return None
+            # we try to choose the position that has already been locked by this task
+            available_positions[sample_position.prefix] = sorted(
+                result, key=lambda task: int(task["need_release"])
+            )[: sample_position.number]
+        return available_positions
 
     def get_sample_position(self, position: str) -> dict[str, Any] | None:
         """
@@ -224,10 +255,11 @@ class SampleView:
         for position="furnace_1/tray" will properly return "furnace_1" even if "furnace_1/tray/1" and
         "furnace_1/tray/2" are in the database _as long as "furnace_1" is the parent device of both!_).
         """
-        sample_positions = self._sample_positions_collection.find(
-            {"name": {"$regex": f"^{position}"}}
+        names = self.get_sample_positions_with_prefix(position)
+        position_index = self.get_position_index()
+        parent_devices = list(
+            {position_index.get_parent_device(name) for name in names}
         )
-        parent_devices = list({sp.get("parent_device") for sp in sample_positions})
         if len(parent_devices) == 0:
             raise ValueError(f"No sample position(s) beginning with: {position}")
         elif len(parent_devices) > 1:
@@ -261,17 +293,13 @@ class SampleView:
         The entry need_release indicates whether a sample position needs to be released
         when __exit__ method is called in the ``SamplePositionsLock``.
         """
-        if (
-            self._sample_positions_collection.find_one(
-                {"name": {"$regex": f"^{re.escape(position_prefix)}"}}
-            )
-            is None
-        ):
+        names = self.get_sample_positions_with_prefix(position_prefix)
+        if not names:
             raise ValueError(f"Cannot find device with prefix: {position_prefix}")
 
         available_sample_positions = self._sample_positions_collection.find(
             {
-                "name": {"$regex": f"^{re.escape(position_prefix)}"},
+                "name": {"$in": names},
                 "$or": [
                     {
                         "task_id": None,
@@ -298,44 +326,81 @@ class SampleView:
 
     def lock_sample_position(self, task_id: ObjectId, position: str):
         """Lock a sample position."""
-        sample_status, current_task_id = self.get_sample_position_status(position)
+        self.lock_sample_positions(task_id=task_id, positions=[position])
 
-        if current_task_id != task_id:
-            if sample_status is SamplePositionStatus.OCCUPIED:
-                raise ValueError(f"Position ({position}) is currently occupied")
-            if sample_status is SamplePositionStatus.LOCKED:
-                raise ValueError(
-                    f"Position is currently locked by task: {current_task_id}"
-                )
+    def lock_sample_positions(self, task_id: ObjectId, positions: list[str]):
+        """
+        Lock a list of sample positions with one ``bulk_write``.
 
-        self._sample_positions_collection.update_one(
-            {"name": position},
-            {
-                "$set": {
-                    "task_id": task_id,
-                }
-            },
+        A position can only be locked if it is not locked by another task and there is no sample
+        of another task in it. The write is acknowledged by the majority of the replica set, so
+        there is no need to wait for the change to be visible.
+        """
+        if not positions:
+            return
+        sample = self._sample_collection.find_one(
+            {"position": {"$in": positions}, "task_id": {"$ne": task_id}},
+            projection=["position"],
         )
-        # Wait until the position is locked successfully
-        while not self.is_locked_position(position):
-            time.sleep(0.5)
+        if sample is not None:
+            raise ValueError(f"Position ({sample['position']}) is currently occupied")
+
+        result = self._sample_positions_collection_majority.bulk_write(
+            [
+                UpdateOne(
+                    {"name": position, "task_id": {"$in": [None, task_id]}},
+                    {"$set": {"task_id": task_id}},
+                )
+                for position in positions
+            ],
+            ordered=False,
+        )
+        if result.matched_count != len(positions):
+            self._raise_for_unchanged_positions(positions=positions, task_id=task_id)
 
     def release_sample_position(self, position: str):
         """Unlock a sample position."""
-        if self.get_sample_position(position) is None:
-            raise ValueError(f"Invalid sample position: {position}")
+        self.release_sample_positions(positions=[position])
 
-        self._sample_positions_collection.update_one(
-            {"name": position},
-            {
-                "$set": {
-                    "task_id": None,
-                }
-            },
+    def release_sample_positions(
+        self, positions: list[str], task_id: ObjectId | None = None
+    ):
+        """
+        Unlock a list of sample positions with one update.
+
+        Args:
+            positions: the names of the sample positions to unlock
+            task_id: if provided, only unlock the positions that are locked by this task (used to roll back
+              a failed lock), and the other positions are skipped without error.
+        """
+        if not positions:
+            return
+        task_filter = {} if task_id is None else {"task_id": task_id}
+        result = self._sample_positions_collection_majority.update_many(
+            {"name": {"$in": positions}, **task_filter},
+            {"$set": {"task_id": None}},
         )
-        # Wait until the position is released successfully
-        while self.is_locked_position(position):
-            time.sleep(0.5)
+        if task_id is None and result.matched_count != len(set(positions)):
+            self._raise_for_unchanged_positions(positions=positions, task_id=None)
+
+    def _raise_for_unchanged_positions(
+        self, positions: list[str], task_id: ObjectId | None
+    ):
+        """Find out why some of the positions are not updated and raise a ``ValueError``."""
+        position_entries = {
+            entry["name"]: entry
+            for entry in self._sample_positions_collection.find(
+                {"name": {"$in": positions}}, projection=["name", "task_id"]
+            )
+        }
+        for position in positions:
+            if position not in position_entries:
+                raise ValueError(f"Invalid sample position: {position}")
+            current_task_id = position_entries[position]["task_id"]
+            if current_task_id is not None and current_task_id != task_id:
+                raise ValueError(
+                    f"Position is currently locked by task: {current_task_id}"
+                )
 
     def get_sample_positions_by_task(self, task_id: ObjectId | None) -> list[str]:
         """Get the list of sample positions that is locked by a task (given task id)."""
@@ -400,6 +465,67 @@ class SampleView:
             time.sleep(0.5)
         return cast(ObjectId, result.inserted_id)
 
+    def create_samples(
+        self, samples: list[dict[str, Any]], session: ClientSession | None = None
+    ) -> list[ObjectId]:
+        """
+        Create many samples with one ``insert_many`` and return their uids in the same order.
+
+        Args:
+            samples: the samples to create, each of them is a dict with the arguments of
+              :py:meth:`create_sample` (``name`` and optionally ``position``, ``sample_id``, ``tags``, ``metadata``)
+            session: the session of the transaction (if any) to write the samples in
+        """
+        if not samples:
+            return []
+        positions = [sample["position"] for sample in samples if sample.get("position")]
+        if len(positions) != len(set(positions)):
+            raise ValueError("Cannot create more than one sample at the same position.")
+        if positions:
+            existing_positions = self._sample_positions_collection.distinct(
+                "name", {"name": {"$in": positions}}
+            )
+            if len(existing_positions) != len(positions):
+                raise ValueError(
+                    f"Invalid sample positions: {set(positions) - set(existing_positions)}"
+                )
+            occupied_positions = self._sample_collection.distinct(
+                "position", {"position": {"$in": positions}}
+            )
+            if occupied_positions:
+                raise ValueError(
+                    f"Requested positions ({occupied_positions}) are not EMPTY."
+                )
+
+        entries = []
+        for sample in samples:
+            name = sample["name"]
+            if re.search(r"[.$]", name) is not None:
+                raise ValueError(
+                    f"Unsupported sample name: {name}. "
+                    f"Sample name should not contain '.' or '$'"
+                )
+            sample_id = sample.get("sample_id")
+            if sample_id is not None and not isinstance(sample_id, ObjectId):
+                raise ValueError(
+                    f"User provided {sample_id} as the sample_id -- this is not a valid ObjectId, so this sample "
+                    f"cannot be created in the database!"
+                )
+            entries.append(
+                {
+                    "_id": sample_id or ObjectId(),
+                    "name": name,
+                    "tags": sample.get("tags") or [],
+                    "metadata": sample.get("metadata") or {},
+                    "position": sample.get("position"),
+                    "task_id": None,
+                    "created_at": datetime.now(),
+                    "last_updated": datetime.now(),
+                }
+            )
+        self._sample_collection.insert_many(entries, session=session)
+        return [entry["_id"] for entry in entries]
+
     def get_sample(self, sample_id: ObjectId) -> Sample:
         """Get a sample by its id.
 
@@ -488,7 +614,11 @@ class SampleView:
     def get_samples_on_device(self, device_name: str) -> dict[str, list[ObjectId]]:
         """Get all the samples on a device."""
         samples = self._sample_collection.find(
-            {"position": {"$regex": f"^{device_name}{SamplePosition.SEPARATOR}"}}
+            {
+                "position": {
+                    "$regex": f"^{re.escape(device_name + SamplePosition.SEPARATOR)}"
+                }
+            }
         )
 
         all_samples = {}
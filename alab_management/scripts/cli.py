@@ -134,3 +134,29 @@ def launch_summary_dashboard(host, port):
     from alab_management.dashboard.plotly import launch
 
     launch(host=host, port=port)
+
+
+@cli.command(
+    "profile_db",
+    short_help="Dump the profile of the database operations (requires [db_profiler] enabled in the config file).",
+)
+@click.option(
+    "-s", "--seconds", default=3600.0, type=float, help="The length of the time window."
+)
+@click.option(
+    "-o", "--output", default="db_profile.json", help="The path of the json file."
+)
+@click.option(
+    "-n", "--top", default=20, type=int, help="The number of call sites to print."
+)
+def profile_db_cli(seconds, output, top):
+    """Dump the profile of the database operations in the last SECONDS to a json file and print the slowest call sites."""
+    from alab_management.utils.db_profiler import dump_profile
+
+    profile = dump_profile(output, seconds=seconds)
+    for entry in profile[:top]:
+        click.echo(
+            f"{entry['total_ms']:>10.1f} ms {entry['count']:>8d} calls {entry['mean_ms']:>8.2f} ms/call  "
+            f"{entry['command']} {entry['collection']}  {entry['call_site']}"
+        )
+    click.echo(f"The profile of {len(profile)} call sites is written to {output}.")
@@ -249,3 +249,9 @@ def run_task(task_id_str: str):
                 task_id=None, sample_id=sample["sample_id"]
             )
         task_view.update_status(task_id=task_id, status=task_status)
+        # the logs of the task are written before the next task starts in this worker. A failure here
+        # must not hide the exception of the task.
+        try:
+            logger.flush()
+        except Exception:
+            cli_logger.exception(f"Failed to write the logs of task {task_id}.")
@@ -9,6 +9,7 @@ from contextlib import contextmanager
 
 from dramatiq_abort import abort, abort_requested
 
+from alab_management.config import AlabOSConfig
 from alab_management.lab_view import LabView
 from alab_management.logger import DBLogger
 from alab_management.task_view import TaskView
@@ -19,6 +20,14 @@ from alab_management.utils.module_ops import load_definition
 cli_logger = logging.getLogger(__name__)
 set_up_rich_handler(cli_logger)
 
+# the tasks that have been sent to the task actors and hold a worker thread
+_IN_FLIGHT_STATUSES = [
+    TaskStatus.INITIATED,
+    TaskStatus.REQUESTING_RESOURCES,
+    TaskStatus.RUNNING,
+    TaskStatus.FINISHING,
+]
+
 
 class TaskManager:
     """
@@ -34,6 +43,15 @@ class TaskManager:
 
         self.logger = DBLogger(task_id=None)
         self._pause_new_task_launching = False
+
+        # the max number of in-flight tasks (in total and per task type), None for no limit
+        task_manager_config = AlabOSConfig().get("task_manager", {})
+        self._max_in_flight_tasks: int | None = task_manager_config.get(
+            "max_in_flight_tasks", None
+        )
+        self._max_in_flight_tasks_per_type: dict[str, int] = dict(
+            task_manager_config.get("max_in_flight_tasks_per_type", {})
+        )
         super().__init__()
         time.sleep(1)  # allow some time for other modules to launch
 
@@ -50,8 +68,7 @@ class TaskManager:
 
     def check_number_of_running_tasks(self) -> int:
         """Check the number of running tasks."""
-        running_tasks = self.task_view.get_tasks_by_status(TaskStatus.RUNNING)
-        return len(running_tasks)
+        return self.task_view.count_tasks_by_status(TaskStatus.RUNNING)
 
     def refresh_tasks(self):
         """Refresh the tasks in the task view."""
@@ -84,12 +101,14 @@ class TaskManager:
         ]
         tasks_to_cancel = []
         for status in statuses_to_cancel:
-            tasks_to_cancel += self.task_view.get_tasks_by_status(status)
+            tasks_to_cancel += self.task_view.get_tasks_by_status(status, projection=[])
 
         statuses_to_restart = [TaskStatus.INITIATED]
         tasks_to_restart = []
         for status in statuses_to_restart:
-            tasks_to_restart += self.task_view.get_tasks_by_status(status)
+            tasks_to_restart += self.task_view.get_tasks_by_status(
+                status, projection=[]
+            )
 
         for task in tasks_to_restart:
             self.task_view.update_status(
@@ -138,8 +157,28 @@ class TaskManager:
         """
         from alab_management.task_actor import run_task
 
-        ready_task_entries = self.task_view.get_ready_tasks()
-        for task_entry in ready_task_entries:
+        in_flight_tasks = self.task_view.count_tasks_by_type(_IN_FLIGHT_STATUSES)
+        number_of_in_flight_tasks = sum(in_flight_tasks.values())
+
+        # claim the ready tasks one by one (by priority), so that a task is never submitted twice
+        # even if there are multiple task managers
+        while (
+            self._max_in_flight_tasks is None
+            or number_of_in_flight_tasks < self._max_in_flight_tasks
+        ):
+            task_entry = self.task_view.claim_ready_task(
+                exclude_types=[
+                    task_type
+                    for task_type, limit in self._max_in_flight_tasks_per_type.items()
+                    if in_flight_tasks.get(task_type, 0) >= limit
+                ]
+            )
+            if task_entry is None:
+                break
+            task_type = task_entry["type"].__name__
+            in_flight_tasks[task_type] = in_flight_tasks.get(task_type, 0) + 1
+            number_of_in_flight_tasks += 1
+
             self.logger.system_log(
                 level="DEBUG",
                 log_data={
@@ -148,9 +187,6 @@ class TaskManager:
                     "task_id": task_entry["task_id"],
                 },
             )
-            self.task_view.update_status(
-                task_id=task_entry["task_id"], status=TaskStatus.INITIATED
-            )
             result = run_task.send_with_options(
                 kwargs={"task_id_str": str(task_entry["task_id"])}
             )
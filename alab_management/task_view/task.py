@@ -6,7 +6,7 @@ import time
 from abc import ABC, abstractmethod
 from inspect import getfullargspec
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Optional
+from typing import TYPE_CHECKING, Any, ClassVar, Optional
 
 import gridfs
 from bson.objectid import ObjectId
@@ -163,8 +163,20 @@ class BaseTask(ABC, metaclass=MetaClassWithImportLock):
     The abstract class of task.
 
     All the tasks should inherit from this class.
+
+    A task can declare the devices it is expected to request in ``expected_devices``
+    (device classes for any device of the type, or device names). The resource manager then
+    soft-holds these devices for the task when its previous tasks are about to finish,
+    so that the device is not taken by another experiment in between. For example,
+
+    .. code-block:: python
+
+      class Heating(BaseTask):
+          expected_devices = [Furnace]
     """
 
+    expected_devices: ClassVar[list[type["BaseDevice"] | str]] = []
+
     def __init__(
         self,
         samples: list[str | ObjectId] | None = None,
@@ -226,6 +238,21 @@ class BaseTask(ABC, metaclass=MetaClassWithImportLock):
             self.priority = priority
             self.lab_view.priority = priority
 
+    @classmethod
+    def get_expected_devices(cls) -> list[dict[str, str]]:
+        """
+        Get the expected devices of the task in the same format as the device in the resource requests,
+        i.e. ``{"identifier": "type" | "name", "content": str}``.
+        """
+        return [
+            (
+                {"identifier": "name", "content": device}
+                if isinstance(device, str)
+                else {"identifier": "type", "content": device.__name__}
+            )
+            for device in cls.expected_devices
+        ]
+
     @property
     def is_offline(self) -> bool:
         """Returns True if this task is in offline, False if it is a live task."""
@@ -6,11 +6,18 @@ provides some convenience methods to query and manipulate the tasks collection.
 from datetime import datetime
 from typing import Any, cast
 
+import pymongo
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.client_session import ClientSession
 
 from alab_management.task_view import CompletedTaskView
 from alab_management.task_view.task import BaseTask, get_all_tasks
-from alab_management.task_view.task_enums import CancelingProgress, TaskStatus
+from alab_management.task_view.task_enums import (
+    CancelingProgress,
+    TaskPriority,
+    TaskStatus,
+)
 from alab_management.utils.data_objects import get_collection, make_bsonable
 
 
@@ -19,6 +26,14 @@ class TaskView:
 
     def __init__(self):
         self._task_collection = get_collection("tasks")
+        # the task queue: the tasks of one status, ordered by priority and creation time
+        self._task_collection.create_index(
+            [
+                ("status", pymongo.ASCENDING),
+                ("priority", pymongo.DESCENDING),
+                ("created_at", pymongo.ASCENDING),
+            ]
+        )
         self._tasks_definition: dict[str, type[BaseTask]] = get_all_tasks()
         self.completed_task_view = CompletedTaskView()
 
@@ -67,6 +82,8 @@ class TaskView:
             "parameters": parameters,
             "prev_tasks": prev_tasks,
             "next_tasks": next_tasks,
+            "remaining_prev_tasks": self._count_unfinished_tasks(prev_tasks),
+            "priority": self._get_priority(parameters),
             "created_at": datetime.now(),
             "last_updated": datetime.now(),
             "message": "",
@@ -77,34 +94,103 @@ class TaskView:
 
         return cast(ObjectId, result.inserted_id)
 
+    def create_tasks(
+        self, tasks: list[dict[str, Any]], session: ClientSession | None = None
+    ) -> list[ObjectId]:
+        """
+        Create many tasks with one ``insert_many`` and return their ids in the same order.
+
+        The prev/next tasks can refer to the tasks in the same batch (by their ``task_id``)
+        or to the existing tasks. The tasks without unfinished prev tasks are created as ``READY``.
+
+        Args:
+            tasks: the tasks to create, each of them is a dict with the arguments of
+              :py:meth:`create_task` (``task_type``, ``samples``, ``parameters`` and optionally
+              ``prev_tasks``, ``next_tasks``, ``task_id``)
+            session: the session of the transaction (if any) to write the tasks in
+        """
+        entries = []
+        for task in tasks:
+            if task["task_type"] not in self._tasks_definition:
+                raise ValueError(f"Unsupported task type: {task['task_type']}")
+            prev_tasks = task.get("prev_tasks") or []
+            next_tasks = task.get("next_tasks") or []
+            entries.append(
+                {
+                    "_id": task.get("task_id") or ObjectId(),
+                    "type": task["task_type"],
+                    "status": TaskStatus.WAITING.name,
+                    "samples": task["samples"],
+                    "parameters": task["parameters"],
+                    "prev_tasks": (
+                        prev_tasks if isinstance(prev_tasks, list) else [prev_tasks]
+                    ),
+                    "next_tasks": (
+                        next_tasks if isinstance(next_tasks, list) else [next_tasks]
+                    ),
+                    "priority": self._get_priority(task["parameters"]),
+                    "created_at": datetime.now(),
+                    "last_updated": datetime.now(),
+                    "message": "",
+                }
+            )
+        if not entries:
+            return []
+
+        new_task_ids = {entry["_id"] for entry in entries}
+        existing_task_ids = {
+            related_task_id
+            for entry in entries
+            for related_task_id in entry["prev_tasks"] + entry["next_tasks"]
+            if related_task_id not in new_task_ids
+        }
+        existing_statuses = self.get_status_of_tasks(list(existing_task_ids))
+        for task_id in existing_task_ids - set(existing_statuses):
+            self.get_task(task_id=task_id)  # will raise error if not found
+
+        # the tasks in the batch are all unfinished
+        for entry in entries:
+            entry["remaining_prev_tasks"] = len(
+                {
+                    prev_task
+                    for prev_task in entry["prev_tasks"]
+                    if prev_task in new_task_ids
+                    or existing_statuses.get(prev_task, TaskStatus.COMPLETED)
+                    is not TaskStatus.COMPLETED
+                }
+            )
+            if entry["remaining_prev_tasks"] == 0:
+                entry["status"] = TaskStatus.READY.name
+
+        self._task_collection.insert_many(entries, session=session)
+        return [entry["_id"] for entry in entries]
+
     def create_subtask(
         self, task_id, subtask_type, samples: list[str], parameters: dict
     ):
         """Create a subtask entry for a task."""
-        task = self.get_task(task_id=task_id)
         subtask_id = ObjectId()
-
-        subtasks = task.get("subtasks", [])
-        subtasks.append(
-            {
-                "subtask_id": subtask_id,
-                "type": subtask_type,
-                "samples": samples,
-                "status": TaskStatus.INITIATED.name,
-                "parameters": parameters,
-                "created_at": datetime.now(),
-                "last_updated": datetime.now(),
-            }
-        )
-        self._task_collection.update_one(
+        returned_value = self._task_collection.update_one(
             {"_id": task_id},
             {
+                "$push": {
+                    "subtasks": {
+                        "subtask_id": subtask_id,
+                        "type": subtask_type,
+                        "samples": samples,
+                        "status": TaskStatus.INITIATED.name,
+                        "parameters": parameters,
+                        "created_at": datetime.now(),
+                        "last_updated": datetime.now(),
+                    }
+                },
                 "$set": {
-                    "subtasks": subtasks,
                     "last_updated": datetime.now(),
-                }
+                },
             },
         )
+        if returned_value.matched_count == 0:
+            raise ValueError(f"No task exists with provided task id: {task_id}")
         return subtask_id
 
     def get_task(self, task_id: ObjectId, encode: bool = False) -> dict[str, Any]:
@@ -151,6 +237,22 @@ class TaskView:
         task = self.get_task(task_id=task_id)
         return TaskStatus[task["status"]]
 
+    def get_status_of_tasks(
+        self, task_ids: list[ObjectId]
+    ) -> dict[ObjectId, TaskStatus]:
+        """
+        Get the status of many tasks with one query.
+
+        The tasks that cannot be found in the (working) task collection are not included
+        in the returned dict.
+        """
+        return {
+            task["_id"]: TaskStatus[task["status"]]
+            for task in self._task_collection.find(
+                {"_id": {"$in": list(set(task_ids))}}, projection=["status"]
+            )
+        }
+
     def update_status(self, task_id: ObjectId, status: TaskStatus):
         """
         Update the status of one task.
@@ -173,86 +275,153 @@ class TaskView:
         elif status == TaskStatus.COMPLETED:
             update_dict["completed_at"] = datetime.now()
 
+        if status is TaskStatus.COMPLETED:
+            # only the first transition to COMPLETED counts down the next tasks
+            returned_value = self._task_collection.update_one(
+                {"_id": task_id, "status": {"$ne": TaskStatus.COMPLETED.name}},
+                {"$set": update_dict},
+            )
+            if returned_value.modified_count == 1:
+                self._on_prev_task_completed(task_id, task["next_tasks"])
+            return
+
         self._task_collection.update_one(
             {"_id": task_id},
             {"$set": update_dict},
         )
 
-        if status is TaskStatus.COMPLETED:
-            # try to figure out tasks that is READY
-            for next_task_id in task["next_tasks"]:
-                self.try_to_mark_task_ready(task_id=next_task_id)
-
         if status in [TaskStatus.CANCELLED, TaskStatus.ERROR]:
-            # any downstream tasks should be:
-            # 1. cancelled if they depend _only on this task_
-            # 2. made independent of this task. This includes removing affected samples from the downstream task
-            samples_in_this_task = [s["sample_id"] for s in task["samples"]]
-            for next_task_id in task["next_tasks"]:
-                next_task = self.get_task(task_id=next_task_id, encode=False)
+            self._cancel_downstream_tasks(task)
+
+    def _on_prev_task_completed(self, task_id: ObjectId, next_task_ids: list[ObjectId]):
+        """Count down the remaining prev tasks of the next tasks and mark the ones with none left as READY."""
+        if not next_task_ids:
+            return
+        self._task_collection.update_many(
+            {
+                "_id": {"$in": next_task_ids},
+                "prev_tasks": task_id,
+                "remaining_prev_tasks": {"$exists": True},
+            },
+            {"$inc": {"remaining_prev_tasks": -1}},
+        )
+        self._mark_tasks_ready(next_task_ids)
+
+    def _mark_tasks_ready(self, task_ids: list[ObjectId]):
+        """Mark the WAITING tasks with no remaining prev tasks as READY."""
+        self._task_collection.update_many(
+            {
+                "_id": {"$in": task_ids},
+                "status": TaskStatus.WAITING.name,
+                "remaining_prev_tasks": {"$lte": 0},
+            },
+            {
+                "$set": {
+                    "status": TaskStatus.READY.name,
+                    "last_updated": datetime.now(),
+                }
+            },
+        )
+        # the tasks created before the counter was introduced
+        for legacy_task in self._task_collection.find(
+            {"_id": {"$in": task_ids}, "remaining_prev_tasks": {"$exists": False}},
+            projection=["_id"],
+        ):
+            self.try_to_mark_task_ready(legacy_task["_id"])
+
+    def _cancel_downstream_tasks(self, task: dict[str, Any]):
+        """
+        Handle the downstream tasks of a cancelled (or errored) task.
+
+        Any downstream tasks should be:
+        1. cancelled if they depend _only on this task_ (which is applied recursively)
+        2. made independent of this task. This includes removing affected samples from the downstream task
+        """
+        message = (
+            "Cancelled due to an upstream task being cancelled or throwing an error."
+        )
+        # the cancelled tasks whose downstream tasks are to be handled
+        cancelled_tasks = [task]
+        while cancelled_tasks:
+            cancelled_task = cancelled_tasks.pop()
+            if not cancelled_task["next_tasks"]:
+                continue
+            samples_in_this_task = [s["sample_id"] for s in cancelled_task["samples"]]
+            # the next tasks are still waiting for the cancelled task if it was not completed
+            still_counted = cancelled_task["status"] != TaskStatus.COMPLETED.name
+
+            to_cancel: list[dict[str, Any]] = []
+            operations = []
+            updated_task_ids = []
+            for next_task in self._task_collection.find(
+                {"_id": {"$in": cancelled_task["next_tasks"]}}
+            ):
                 if len(next_task["prev_tasks"]) == 1:
-                    self.update_status(
-                        task_id=next_task_id, status=TaskStatus.CANCELLED
-                    )
-                    self.set_message(
-                        task_id=next_task_id,
-                        message="Cancelled due to an upstream task being cancelled or throwing an error.",
-                    )
-                else:
-                    # drop any samples that were lost in the cancelled task
-                    samples_to_remain_in_downstream_task = [
-                        entry
-                        for entry in next_task["samples"]
-                        if entry["sample_id"] not in samples_in_this_task
-                    ]
-                    if len(samples_to_remain_in_downstream_task) == 0:
-                        # This is probably impossible (if we have 0 samples remaining,this task should exclusive
-                        # depends on the cancelled task and have been caught above), but just in case...
-                        self.update_status(
-                            task_id=next_task_id, status=TaskStatus.CANCELLED
-                        )
-                    else:
-                        self._task_collection.update_one(
-                            {"_id": next_task_id},
-                            {
-                                "$pull": {
-                                    "prev_tasks": task_id,
-                                },
-                                "$set": {
-                                    "samples": samples_to_remain_in_downstream_task,
-                                    "last_updated": datetime.now(),
-                                },
-                            },
-                        )
-                        self.try_to_mark_task_ready(
-                            task_id=next_task_id
-                        )  # in case it was only waiting on task we just cancelled
+                    to_cancel.append(next_task)
+                    continue
+                # drop any samples that were lost in the cancelled task
+                samples_to_remain_in_downstream_task = [
+                    entry
+                    for entry in next_task["samples"]
+                    if entry["sample_id"] not in samples_in_this_task
+                ]
+                if len(samples_to_remain_in_downstream_task) == 0:
+                    # This is probably impossible (if we have 0 samples remaining,this task should exclusive
+                    # depends on the cancelled task and have been caught above), but just in case...
+                    to_cancel.append(next_task)
+                    continue
+                update: dict[str, Any] = {
+                    "$pull": {
+                        "prev_tasks": cancelled_task["_id"],
+                    },
+                    "$set": {
+                        "samples": samples_to_remain_in_downstream_task,
+                        "last_updated": datetime.now(),
+                    },
+                }
+                if (
+                    still_counted
+                    and "remaining_prev_tasks" in next_task
+                    and cancelled_task["_id"] in next_task["prev_tasks"]
+                ):
+                    update["$inc"] = {"remaining_prev_tasks": -1}
+                operations.append(UpdateOne({"_id": next_task["_id"]}, update))
+                updated_task_ids.append(next_task["_id"])
+
+            if operations:
+                self._task_collection.bulk_write(operations, ordered=False)
+                # in case they were only waiting on the task we just cancelled
+                self._mark_tasks_ready(updated_task_ids)
+            if to_cancel:
+                self._task_collection.update_many(
+                    {"_id": {"$in": [next_task["_id"] for next_task in to_cancel]}},
+                    {
+                        "$set": {
+                            "status": TaskStatus.CANCELLED.name,
+                            "message": message,
+                            "last_updated": datetime.now(),
+                        }
+                    },
+                )
+                cancelled_tasks.extend(to_cancel)
 
     def update_subtask_status(
         self, task_id: ObjectId, subtask_id: ObjectId, status: TaskStatus
     ):
         """Update the status of a subtask."""
-        task = self.get_task(task_id=task_id, encode=False)
-        subtasks = task.get("subtasks", [])
-        found = False
-        for subtask in subtasks:
-            if subtask["subtask_id"] == subtask_id:
-                found = True
-                subtask["status"] = status.name
-                subtask["last_updated"] = datetime.now()
-                if status == TaskStatus.RUNNING and "started_at" not in subtask:
-                    subtask["started_at"] = datetime.now()
-                elif status == TaskStatus.COMPLETED:
-                    subtask["completed_at"] = datetime.now()
-                break
-        if not found:
-            raise ValueError(
-                f"No subtask found with id: {subtask_id} within task: {task_id}"
-            )
-        self._task_collection.update_one(
-            {"_id": task_id},
-            {"$set": {"subtasks": subtasks, "last_updated": datetime.now()}},
-        )
+        update: dict[str, Any] = {
+            "$set": {
+                "subtasks.$.status": status.name,
+                "subtasks.$.last_updated": datetime.now(),
+                "last_updated": datetime.now(),
+            }
+        }
+        if status == TaskStatus.RUNNING:
+            # only set when the subtask starts running for the first time
+            update["$min"] = {"subtasks.$.started_at": datetime.now()}
+        elif status == TaskStatus.COMPLETED:
+            update["$set"]["subtasks.$.completed_at"] = datetime.now()
+        self._update_subtask(task_id=task_id, subtask_id=subtask_id, update=update)
 
     def update_result(
         self, task_id: ObjectId, name: str | None = None, value: Any = None
@@ -294,44 +463,80 @@ class TaskView:
             subtask_id: the id of subtask within task to be updated
             result: the result returned by the task (which can be dumped into MongoDB)
         """
-        task = self.get_task(task_id=task_id)
-        subtasks = task.get("subtasks", [])
-
-        found = False
-        for subtask in subtasks:
-            if subtask["subtask_id"] == subtask_id:
-                found = True
-                subtask["result"] = result
-                subtask["last_updated"] = datetime.now()
-                break
-        if not found:
-            raise ValueError(
-                f"No subtask found with id: {subtask_id} within task: {task_id}"
-            )
-        self._task_collection.update_one(
-            {"_id": task_id},
-            {
+        self._update_subtask(
+            task_id=task_id,
+            subtask_id=subtask_id,
+            update={
                 "$set": {
-                    "subtasks": subtasks,
+                    "subtasks.$.result": result,
+                    "subtasks.$.last_updated": datetime.now(),
                     "last_updated": datetime.now(),
                 }
             },
         )
 
+    def _update_subtask(
+        self, task_id: ObjectId, subtask_id: ObjectId, update: dict[str, Any]
+    ):
+        """Update one subtask in place, the ``$`` in the update refers to the subtask."""
+        returned_value = self._task_collection.update_one(
+            {"_id": task_id, "subtasks.subtask_id": subtask_id}, update
+        )
+        if returned_value.matched_count == 0:
+            if not self.exists(task_id):
+                raise ValueError(f"No task exists with provided task id: {task_id}")
+            raise ValueError(
+                f"No subtask found with id: {subtask_id} within task: {task_id}"
+            )
+
     def try_to_mark_task_ready(self, task_id: ObjectId):
         """
         Check if one task's parent tasks are all completed,
         if so, mark it as READY.
         """
+        if (
+            self._task_collection.update_one(
+                {
+                    "_id": task_id,
+                    "status": TaskStatus.WAITING.name,
+                    "remaining_prev_tasks": {"$lte": 0},
+                },
+                {
+                    "$set": {
+                        "status": TaskStatus.READY.name,
+                        "last_updated": datetime.now(),
+                    }
+                },
+            ).matched_count
+            == 1
+        ):
+            return
+
         task = self.get_task(task_id)
+        if "remaining_prev_tasks" in task:
+            return
 
-        prev_task_ids = task["prev_tasks"]
-        if task["status"] == TaskStatus.WAITING.name and all(
-            self.get_status(task_id=task_id_) is TaskStatus.COMPLETED
-            for task_id_ in prev_task_ids
+        # the tasks created before the counter was introduced
+        if task["status"] == TaskStatus.WAITING.name and (
+            self._count_unfinished_tasks(task["prev_tasks"]) == 0
         ):
             self.update_status(task_id, TaskStatus.READY)
 
+    def _count_unfinished_tasks(self, task_ids: list[ObjectId]) -> int:
+        """
+        Count the tasks that are not COMPLETED. The tasks that are not in the working
+        task collection have been moved to the completed database.
+        """
+        statuses = self.get_status_of_tasks(task_ids)
+        return len(
+            {
+                task_id
+                for task_id in task_ids
+                if statuses.get(task_id, TaskStatus.COMPLETED)
+                is not TaskStatus.COMPLETED
+            }
+        )
+
     def get_ready_tasks(self) -> list[dict[str, Any]]:
         """
         Return a list of ready tasks.
@@ -343,22 +548,162 @@ class TaskView:
         """
         return self.get_tasks_by_status(status=TaskStatus.READY)
 
-    def get_tasks_by_status(self, status: TaskStatus) -> list[dict[str, Any]]:
+    def get_tasks_by_status(
+        self, status: TaskStatus, projection: list[str] | None = None
+    ) -> list[dict[str, Any]]:
         """
         Return a list of tasks with given status.
 
+        Args:
+            status: the status of the tasks
+            projection: the fields to return (``task_id`` and ``type`` are always returned).
+              If None, return the whole task entries.
+
         Returns
         -------
             List of task entry: {"task_id": ``ObjectId``,
             "type": :py:class:`BaseTask <alab_management.task_view.task.BaseTask>`}
         """
-        result = self._task_collection.find({"status": status.name})
+        if projection is not None:
+            projection = list({"_id", "type", *projection})
+        result = self._task_collection.find(
+            {"status": status.name}, projection=projection
+        )
 
         tasks: list[dict[str, Any]] = []
         for task_entry in result:
             tasks.append(self.encode_task(task_entry))
         return tasks
 
+    def count_tasks_by_status(self, status: TaskStatus) -> int:
+        """Count the tasks with given status."""
+        return self._task_collection.count_documents({"status": status.name})
+
+    def count_tasks_by_type(self, statuses: list[TaskStatus]) -> dict[str, int]:
+        """Count the tasks with any of the given statuses, grouped by task type."""
+        return {
+            group["_id"]: group["count"]
+            for group in self._task_collection.aggregate(
+                [
+                    {"$match": {"status": {"$in": [s.name for s in statuses]}}},
+                    {"$group": {"_id": "$type", "count": {"$sum": 1}}},
+                ]
+            )
+        }
+
+    def get_imminent_tasks(
+        self, task_types: list[str] | None = None
+    ) -> list[dict[str, Any]]:
+        """
+        Get the tasks that are going to request resources soon, i.e. the tasks that are READY,
+        INITIATED or REQUESTING_RESOURCES, and the WAITING tasks whose only unfinished previous
+        task is already running.
+
+        Args:
+            task_types: only return the tasks of these types. If None, the tasks of all types are returned.
+
+        Returns
+        -------
+            List of task entries with ``task_id``, ``type``, ``status``, ``priority``, ``created_at``
+            and ``prev_tasks``, the highest priority (and then the oldest) first.
+        """
+        query: dict[str, Any] = {
+            "$or": [
+                {
+                    "status": {
+                        "$in": [
+                            TaskStatus.READY.name,
+                            TaskStatus.INITIATED.name,
+                            TaskStatus.REQUESTING_RESOURCES.name,
+                        ]
+                    }
+                },
+                {
+                    "status": TaskStatus.WAITING.name,
+                    "remaining_prev_tasks": {"$lte": 1},
+                },
+            ]
+        }
+        if task_types is not None:
+            query["type"] = {"$in": list(task_types)}
+        tasks = [
+            self.encode_task(task_entry)
+            for task_entry in self._task_collection.find(
+                query,
+                projection=["type", "status", "priority", "created_at", "prev_tasks"],
+            )
+        ]
+
+        prev_task_statuses = self.get_status_of_tasks(
+            [
+                prev_task
+                for task in tasks
+                if task["status"] == TaskStatus.WAITING.name
+                for prev_task in task.get("prev_tasks", [])
+            ]
+        )
+        imminent_tasks = []
+        for task in tasks:
+            task["priority"] = task.get("priority", int(TaskPriority.NORMAL))
+            task["prev_tasks"] = task.get("prev_tasks", [])
+            if task["status"] == TaskStatus.WAITING.name and not all(
+                prev_task_statuses.get(prev_task)
+                in {
+                    TaskStatus.COMPLETED,
+                    TaskStatus.REQUESTING_RESOURCES,
+                    TaskStatus.RUNNING,
+                    TaskStatus.FINISHING,
+                }
+                for prev_task in task["prev_tasks"]
+            ):
+                continue
+            imminent_tasks.append(task)
+        imminent_tasks.sort(key=lambda task: (-task["priority"], task["created_at"]))
+        return imminent_tasks
+
+    def claim_ready_task(
+        self, exclude_types: list[str] | None = None
+    ) -> dict[str, Any] | None:
+        """
+        Atomically mark the READY task with the highest priority (the oldest first) as INITIATED,
+        so that no other task manager can submit it again.
+
+        Args:
+            exclude_types: the task types that should not be claimed (e.g. they have reached their limit)
+
+        Returns
+        -------
+            The task entry with ``task_id``, ``type`` and ``priority``,
+            or None if there is no READY task.
+        """
+        query: dict[str, Any] = {"status": TaskStatus.READY.name}
+        if exclude_types:
+            query["type"] = {"$nin": exclude_types}
+        task_entry = self._task_collection.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": TaskStatus.INITIATED.name,
+                    "last_updated": datetime.now(),
+                }
+            },
+            sort=[("priority", pymongo.DESCENDING), ("created_at", pymongo.ASCENDING)],
+            projection=["_id", "type", "priority"],
+        )
+        if task_entry is None:
+            return None
+        return self.encode_task(task_entry)
+
+    @staticmethod
+    def _get_priority(parameters: dict[str, Any]) -> int:
+        """The priority of a task, which can be set in its parameters (see ``BaseTask``)."""
+        priority = parameters.get("priority")
+        if priority is None:
+            return int(TaskPriority.NORMAL)
+        if isinstance(priority, str):
+            return int(TaskPriority[priority.upper()])
+        return int(priority)
+
     def encode_task(self, task_entry: dict[str, Any]) -> dict[str, Any]:
         """
         Rename _id to task_id
@@ -388,7 +733,7 @@ class TaskView:
             prev_tasks: one or a list of ids of ``prev_tasks``
             next_tasks: one or a list of ids of ``next_tasks``
         """
-        self.get_task(task_id=task_id, encode=False)
+        task = self.get_task(task_id=task_id, encode=False)
 
         prev_tasks = prev_tasks if prev_tasks is not None else []
         prev_tasks = prev_tasks if isinstance(prev_tasks, list) else [prev_tasks]
@@ -402,18 +747,28 @@ class TaskView:
         for next_task in next_tasks:
             if self.get_task(task_id=next_task) is None:
                 raise ValueError(f"Non-exist task id: {next_task}")
-        self._task_collection.update_one(
-            {"_id": task_id},
-            {
-                "$push": {
-                    "next_tasks": {"$each": next_tasks},
-                    "prev_tasks": {"$each": prev_tasks},
-                },
-                "$set": {
-                    "last_updated": datetime.now(),
-                },
+
+        update: dict[str, Any] = {
+            "$push": {
+                "next_tasks": {"$each": next_tasks},
+                "prev_tasks": {"$each": prev_tasks},
             },
-        )
+            "$set": {
+                "last_updated": datetime.now(),
+            },
+        }
+        if "remaining_prev_tasks" in task:
+            new_prev_tasks = list(
+                dict.fromkeys(
+                    prev_task
+                    for prev_task in prev_tasks
+                    if prev_task not in task["prev_tasks"]
+                )
+            )
+            update["$inc"] = {
+                "remaining_prev_tasks": self._count_unfinished_tasks(new_prev_tasks)
+            }
+        self._task_collection.update_one({"_id": task_id}, update)
 
     def set_message(self, task_id: ObjectId, message: str):
         """Set message for one task. This is displayed on the dashboard."""
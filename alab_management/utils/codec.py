@@ -0,0 +1,260 @@
+"""
+The codecs to serialize the messages (e.g. device RPC calls and their results). The codec of a message
+is identified by its content type, so that the receiver can always decode it with the right codec.
+
+The default codec is based on msgpack, with native support for numpy arrays, ``ObjectId``, ``datetime``,
+tuples, sets and exceptions. The objects that msgpack cannot handle (e.g. custom classes) fall back to
+dill inside the msgpack message, as the RPC messages of alabos have always been pickled. As unpickling
+can run arbitrary code, dill can be disabled in the config if the message broker is not trusted:
+
+.. code-block:: toml
+
+  [codec]
+  allow_dill_decode = false
+
+Then the objects that msgpack cannot handle are rejected with a ``TypeError`` by the sender, instead of
+being refused by the receiver.
+"""
+
+import struct
+import sys
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any
+
+import dill
+import msgpack
+import numpy as np
+from bson import ObjectId
+
+from alab_management.config import AlabOSConfig
+
+CONTENT_TYPE_DILL = "application/python-dill"
+CONTENT_TYPE_MSGPACK = "application/msgpack"
+
+# the extension types used in the msgpack codec
+_EXT_NDARRAY = 1
+_EXT_OBJECT_ID = 2
+_EXT_DATETIME = 3
+_EXT_TUPLE = 4
+_EXT_SET = 5
+_EXT_NUMPY_SCALAR = 6
+_EXT_EXCEPTION = 7
+_EXT_DILL = 99
+
+# the header of an ndarray: the length of the dtype string, then the dtype string, the number of
+# dimensions and the shape (int64). It is padded so that the raw buffer after it is 8-byte aligned.
+_NDARRAY_HEADER = struct.Struct("<B")
+_NDARRAY_ALIGNMENT = 8
+
+
+class Codec(ABC):
+    """A codec that serializes python objects to bytes and back."""
+
+    content_type: str
+
+    @abstractmethod
+    def encode(self, obj: Any) -> bytes:
+        """Serialize an object to bytes."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Any:
+        """Deserialize bytes to an object."""
+        raise NotImplementedError
+
+
+class DillCodec(Codec):
+    """Serialize everything with dill (the legacy format)."""
+
+    content_type = CONTENT_TYPE_DILL
+
+    def encode(self, obj: Any) -> bytes:
+        """Serialize an object to bytes."""
+        return dill.dumps(obj)
+
+    def decode(self, data: bytes) -> Any:
+        """Deserialize bytes to an object."""
+        return dill.loads(data)
+
+
+class MsgpackCodec(Codec):
+    """
+    Serialize the objects with msgpack.
+
+    Numpy arrays are stored as a fixed header (dtype, shape) followed by their raw buffer. By default,
+    they are decoded as **read-only** views over the received message without copying the data; pass
+    ``writable_arrays=True`` to get (copied) writable arrays instead.
+    """
+
+    content_type = CONTENT_TYPE_MSGPACK
+
+    def __init__(
+        self,
+        allow_dill_fallback: bool = True,
+        allow_dill_decode: bool | None = None,
+        writable_arrays: bool = False,
+    ):
+        """
+        Create a msgpack codec.
+
+        Args:
+            allow_dill_fallback: whether to serialize the objects that msgpack cannot handle with dill.
+              If False (or if dill decoding is not allowed), a ``TypeError`` is raised when encoding such objects.
+            allow_dill_decode: whether to decode the dill data in the messages. If False, a ``ValueError``
+              is raised when decoding a message that contains dill data. If None, it is read from
+              ``[codec] allow_dill_decode`` in the config (default True).
+            writable_arrays: whether to copy the decoded numpy arrays so that they are writable. Otherwise,
+              they are read-only views over the message.
+        """
+        self._allow_dill_fallback = allow_dill_fallback
+        self._allow_dill_decode = allow_dill_decode
+        self._writable_arrays = writable_arrays
+
+    def encode(self, obj: Any) -> bytes:
+        """Serialize an object to bytes."""
+        # strict_types: tuples, subclasses of dict/list/int etc. are passed to ``_default``,
+        # so that they are not silently converted to their base types
+        return msgpack.packb(obj, default=self._default, strict_types=True)
+
+    def decode(self, data: bytes) -> Any:
+        """Deserialize bytes to an object."""
+        return msgpack.unpackb(
+            data, ext_hook=self._ext_hook, raw=False, strict_map_key=False
+        )
+
+    def _default(self, obj: Any) -> msgpack.ExtType:
+        if isinstance(obj, np.ndarray) and obj.dtype.kind not in "OV":
+            obj = np.ascontiguousarray(obj)
+            # the buffer protocol does not support datetime64/timedelta64, their int64 values are sent
+            # instead (the dtype in the header keeps the unit)
+            buffer = obj.view(np.int64) if obj.dtype.kind in "Mm" else obj
+            return msgpack.ExtType(
+                _EXT_NDARRAY, _pack_ndarray_header(obj) + memoryview(buffer).cast("B")
+            )
+        if isinstance(obj, np.generic) and obj.dtype.kind not in "OV":
+            return msgpack.ExtType(
+                _EXT_NUMPY_SCALAR, msgpack.packb([obj.dtype.str, obj.tobytes()])
+            )
+        if isinstance(obj, ObjectId):
+            return msgpack.ExtType(_EXT_OBJECT_ID, obj.binary)
+        if isinstance(obj, datetime):
+            return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode())
+        if type(obj) is tuple:
+            return msgpack.ExtType(_EXT_TUPLE, self.encode(list(obj)))
+        if type(obj) in (set, frozenset):
+            return msgpack.ExtType(_EXT_SET, self.encode(list(obj)))
+        if isinstance(obj, BaseException):
+            cls = type(obj)
+            return msgpack.ExtType(
+                _EXT_EXCEPTION,
+                self.encode([cls.__module__, cls.__qualname__, list(obj.args)]),
+            )
+        if not self._allow_dill_fallback:
+            raise TypeError(
+                f"Cannot serialize object of type {type(obj)} with msgpack."
+            )
+        if not self._is_dill_decode_allowed():
+            # the receivers share the config, so they would refuse the dill data
+            raise TypeError(
+                f"Cannot serialize object of type {type(obj)} with msgpack, and dill is disabled by "
+                "`allow_dill_decode = false` in the [codec] section of the config."
+            )
+        return msgpack.ExtType(_EXT_DILL, dill.dumps(obj))
+
+    def _is_dill_decode_allowed(self) -> bool:
+        if self._allow_dill_decode is not None:
+            return self._allow_dill_decode
+        return AlabOSConfig().get("codec", {}).get("allow_dill_decode", True)
+
+    def _ext_hook(self, code: int, data: bytes) -> Any:
+        if code == _EXT_NDARRAY:
+            dtype, shape, offset = _unpack_ndarray_header(data)
+            array = np.frombuffer(memoryview(data)[offset:], dtype=dtype).reshape(shape)
+            return array.copy() if self._writable_arrays else array
+        if code == _EXT_NUMPY_SCALAR:
+            dtype, buffer = msgpack.unpackb(data)
+            return np.frombuffer(buffer, dtype=np.dtype(dtype))[0]
+        if code == _EXT_OBJECT_ID:
+            return ObjectId(data)
+        if code == _EXT_DATETIME:
+            return datetime.fromisoformat(data.decode())
+        if code == _EXT_TUPLE:
+            return tuple(self.decode(data))
+        if code == _EXT_SET:
+            return set(self.decode(data))
+        if code == _EXT_EXCEPTION:
+            module, qualname, args = self.decode(data)
+            return _build_exception(module, qualname, args)
+        if code == _EXT_DILL:
+            if not self._is_dill_decode_allowed():
+                raise ValueError(
+                    "The message contains dill data, which is not allowed. Set `allow_dill_decode = true` "
+                    "in the [codec] section of the config if the senders are trusted."
+                )
+            return dill.loads(data)
+        return msgpack.ExtType(code, data)
+
+
+def _pack_ndarray_header(array: np.ndarray) -> bytes:
+    dtype = array.dtype.str.encode()
+    header = (
+        _NDARRAY_HEADER.pack(len(dtype))
+        + dtype
+        + _NDARRAY_HEADER.pack(array.ndim)
+        + struct.pack(f"<{array.ndim}q", *array.shape)
+    )
+    return header + b"\x00" * (-len(header) % _NDARRAY_ALIGNMENT)
+
+
+def _unpack_ndarray_header(data: bytes) -> tuple[np.dtype, tuple[int, ...], int]:
+    """Get the dtype, the shape and the offset of the raw buffer of an ndarray."""
+    (dtype_length,) = _NDARRAY_HEADER.unpack_from(data, 0)
+    offset = _NDARRAY_HEADER.size
+    dtype = np.dtype(bytes(data[offset : offset + dtype_length]).decode())
+    offset += dtype_length
+    (ndim,) = _NDARRAY_HEADER.unpack_from(data, offset)
+    offset += _NDARRAY_HEADER.size
+    shape = struct.unpack_from(f"<{ndim}q", data, offset)
+    offset += 8 * ndim
+    return dtype, shape, offset + (-offset % _NDARRAY_ALIGNMENT)
+
+
+def _build_exception(module: str, qualname: str, args: list[Any]) -> BaseException:
+    """
+    Rebuild an exception from its class and args. Only the classes of the modules that are already
+    imported are used (nothing is imported while decoding); otherwise, or if the class cannot be built
+    from its args, a ``RuntimeError`` with the original class name is returned.
+    """
+    cls: Any = sys.modules.get(module)
+    for name in qualname.split("."):
+        cls = getattr(cls, name, None)
+    if isinstance(cls, type) and issubclass(cls, BaseException):
+        try:
+            return cls(*args)
+        except Exception:  # pylint: disable=broad-except
+            pass
+    return RuntimeError(f"{module}.{qualname}: {', '.join(map(str, args))}")
+
+
+_CODECS: dict[str, Codec] = {
+    CONTENT_TYPE_MSGPACK: MsgpackCodec(),
+    CONTENT_TYPE_DILL: DillCodec(),
+}
+
+
+def get_codec(content_type: str | None) -> Codec:
+    """
+    Get the codec of a content type. The messages without content type are decoded with dill,
+    which is the format used before the codecs were introduced.
+    """
+    if content_type is None:
+        return _CODECS[CONTENT_TYPE_DILL]
+    if content_type not in _CODECS:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    return _CODECS[content_type]
+
+
+def register_codec(codec: Codec):
+    """Register a codec, which can then be selected by its content type."""
+    _CODECS[codec.content_type] = codec
@@ -16,12 +16,19 @@ from pymongo import collection, database
 
 from alab_management.config import AlabOSConfig
 from alab_management.utils.db_lock import MongoLock
+from alab_management.utils.db_profiler import get_db_profiler, start_db_profiler
+
+
+def _get_event_listeners() -> list:
+    """Get the command listeners of the MongoClient, i.e. the database profiler if it is enabled."""
+    profiler = get_db_profiler()
+    return [] if profiler is None else [profiler]
 
 
 class _BaseGetMongoCollection(ABC):
     client: pymongo.MongoClient | None = None
     db: database.Database | None = None
-    db_lock: MongoLock | None = None
+    db_locks: dict[str, MongoLock] | None = None
 
     @classmethod
     @abstractmethod
@@ -42,11 +49,44 @@ class _BaseGetMongoCollection(ABC):
             cls.init()
         return cls.db
 
+    @classmethod
+    @contextlib.contextmanager
+    def start_transaction(cls):
+        """
+        Start a transaction and yield its session, which should be passed to the writes.
+
+        Transactions are only supported by replica sets and sharded clusters. For a standalone
+        MongoDB server, None is yielded and the writes are not atomic.
+        """
+        if cls.db is None:
+            cls.init()
+        # the topology type is Unknown until a server is selected, so make sure the client is
+        # connected before reading it
+        try:
+            cls.client.admin.command("ping")
+        except Exception:  # pylint: disable=broad-except
+            yield None
+            return
+        topology = getattr(cls.client, "topology_description", None)
+        if topology is None or topology.topology_type_name not in (
+            "ReplicaSetWithPrimary",
+            "Sharded",
+        ):
+            yield None
+            return
+        with cls.client.start_session() as session, session.start_transaction():
+            yield session
+
     @classmethod
     def get_lock(cls, name: str) -> MongoLock:
-        if cls.db_lock is None:
-            cls.db_lock = MongoLock(collection=cls.get_collection("_lock"), name=name)
-        return cls.db_lock
+        # one lock object per name (and per subclass, as the dict is created on ``cls``)
+        if cls.db_locks is None:
+            cls.db_locks = {}
+        if name not in cls.db_locks:
+            cls.db_locks[name] = MongoLock(
+                collection=cls.get_collection("_lock"), name=name
+            )
+        return cls.db_locks[name]
 
 
 class _GetMongoCollection(_BaseGetMongoCollection):
@@ -58,12 +98,14 @@ class _GetMongoCollection(_BaseGetMongoCollection):
             port=db_config.get("port", None),
             username=db_config.get("username", ""),
             password=db_config.get("password", ""),
+            event_listeners=_get_event_listeners(),
         )
         sim_mode_flag = AlabOSConfig().is_sim_mode()
         # force to enable sim mode, just in case
         cls.db = cls.client[
             AlabOSConfig()["general"]["name"] + ("_sim" * sim_mode_flag)
         ]
+        start_db_profiler(cls.db)
 
 
 class _GetCompletedMongoCollection(_BaseGetMongoCollection):
@@ -81,6 +123,7 @@ class _GetCompletedMongoCollection(_BaseGetMongoCollection):
             port=db_config.get("port", None),
             username=db_config.get("username", ""),
             password=db_config.get("password", ""),
+            event_listeners=_get_event_listeners(),
         )
         sim_mode_flag = AlabOSConfig().is_sim_mode()
         if sim_mode_flag:
@@ -185,6 +228,7 @@ def make_jsonable(obj):
 get_collection = _GetMongoCollection.get_collection
 get_lock = _GetMongoCollection.get_lock
 get_db = _GetMongoCollection.get_db
+start_transaction = _GetMongoCollection.start_transaction
 
 get_completed_collection = _GetCompletedMongoCollection.get_collection
 get_completed_lock = _GetCompletedMongoCollection.get_lock
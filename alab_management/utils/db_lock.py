@@ -1,8 +1,13 @@
 """This file defines the database lock class, which can block other processes to access the database."""
 
+import random
+import threading
 import time
 from contextlib import contextmanager
+from datetime import datetime, timedelta
+from uuid import uuid4
 
+from pymongo import ReturnDocument
 from pymongo.collection import Collection
 from pymongo.errors import DuplicateKeyError
 
@@ -16,44 +21,155 @@ class MongoLockReleaseError(Exception):
 
 
 class MongoLock:
-    """Use a distributed lock to lock a collection or something else."""
+    """
+    Use a distributed lock to lock a collection or something else.
 
-    def __init__(self, name: str, collection: Collection):
+    The lock is a lease: it expires after ``lease_seconds`` unless it is renewed, so a crashed
+    holder cannot block the lab forever. When the lock is used as a context manager, the lease is
+    renewed in a background thread until the context is finished; if :py:meth:`acquire` is called
+    directly, the holder must call :py:meth:`renew` within every ``lease_seconds``. A holder that
+    cannot renew its lease (e.g. it cannot reach the database) loses the lock.
+
+    Every acquisition returns a token, which increases for the same lock name (the lock document
+    is kept after release to keep it increasing). No write in alabos checks it: the devices and
+    sample positions are granted with guarded updates, not under this lock.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        collection: Collection,
+        lease_seconds: float = 30.0,
+        max_backoff_seconds: float = 1.0,
+    ):
         self._lock_collection = collection
         self._name = name
-        self._locked: bool = self._lock_collection.find_one({"_id": name}) is not None
+        self._lease_seconds = lease_seconds
+        self._max_backoff_seconds = max_backoff_seconds
+        # the lock object may be shared by multiple threads, each of them holds its own acquisition
+        self._holder = threading.local()
 
     @property
     def name(self) -> str:
         """Get the name of the lock."""
         return self._name
 
+    @property
+    def token(self) -> int | None:
+        """The fencing token of the current acquisition in this thread, None if not acquired."""
+        return getattr(self._holder, "token", None)
+
     @contextmanager
     def __call__(self, timeout: float | None = None):
-        """Acquire the lock and release it after the context is finished."""
-        yield self.acquire(timeout=timeout)
-        self.release()
+        """Acquire the lock, renew its lease while the context runs, and release it after the context is finished."""
+        token = self.acquire(timeout=timeout)
+        stop_renewing = threading.Event()
+        renewer = threading.Thread(
+            target=self._renew_loop,
+            args=(self._holder.owner, stop_renewing),
+            daemon=True,
+            name=f"MongoLockRenew-{self._name}",
+        )
+        renewer.start()
+        try:
+            yield token
+        finally:
+            stop_renewing.set()
+            renewer.join()
+            self.release()
 
-    def acquire(self, timeout: float | None = None):
-        """Acquire the lock."""
-        start_time = time.time()
-        while timeout is None or time.time() - start_time <= timeout:
+    def _renew_loop(self, owner: str, stop: threading.Event):
+        while not stop.wait(self._lease_seconds / 3):
             try:
-                self._lock_collection.insert_one({"_id": self._name})
-            except DuplicateKeyError:
-                time.sleep(0.5)
+                renewed = self._renew(owner)
+            except Exception:  # pylint: disable=broad-except
+                # try again before the lease expires
                 continue
-            else:
-                self._locked = True
+            if not renewed:
                 return
-        raise MongoLockAcquireError("Acquire lock timeout")
+
+    def acquire(self, timeout: float | None = None) -> int:
+        """
+        Acquire the lock. Retry with exponential backoff (with jitter) if it is held by others.
+
+        Returns
+        -------
+            the fencing token of this acquisition
+        """
+        start_time = time.time()
+        backoff = 0.01
+        while True:
+            owner = uuid4().hex
+            now = datetime.now()
+            try:
+                lock_entry = self._lock_collection.find_one_and_update(
+                    {
+                        "_id": self._name,
+                        # free if released (or created by the old version without lease), or expired
+                        "$or": [
+                            {"expires_at": None},
+                            {"expires_at": {"$lte": now}},
+                        ],
+                    },
+                    {
+                        "$set": {
+                            "owner": owner,
+                            "acquired_at": now,
+                            "expires_at": now + timedelta(seconds=self._lease_seconds),
+                        },
+                        "$inc": {"token": 1},
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                # the lock is held by others
+                lock_entry = None
+
+            if lock_entry is not None:
+                self._holder.owner = owner
+                self._holder.token = lock_entry["token"]
+                return lock_entry["token"]
+
+            if timeout is not None and time.time() - start_time > timeout:
+                raise MongoLockAcquireError("Acquire lock timeout")
+            time.sleep(random.uniform(0, backoff))
+            backoff = min(backoff * 2, self._max_backoff_seconds)
+
+    def renew(self) -> bool:
+        """Extend the lease of the current acquisition. Return False if the lease has been lost."""
+        owner = getattr(self._holder, "owner", None)
+        if owner is None:
+            return False
+        return self._renew(owner)
+
+    def _renew(self, owner: str) -> bool:
+        result = self._lock_collection.update_one(
+            {"_id": self._name, "owner": owner},
+            {
+                "$set": {
+                    "expires_at": datetime.now()
+                    + timedelta(seconds=self._lease_seconds)
+                }
+            },
+        )
+        return result.matched_count == 1
 
     def release(self):
         """Release the lock."""
-        result = self._lock_collection.delete_one({"_id": self._name})
-        if result.deleted_count != 1:
+        owner = getattr(self._holder, "owner", None)
+        self._holder.owner = None
+        self._holder.token = None
+        if owner is None:
+            raise MongoLockReleaseError(
+                f"Fail to release a lock (name={self._name}). The lock is not acquired by this thread."
+            )
+        result = self._lock_collection.update_one(
+            {"_id": self._name, "owner": owner},
+            {"$set": {"owner": None, "expires_at": None}},
+        )
+        if result.matched_count != 1:
             raise MongoLockReleaseError(
                 f"Fail to release a lock (name={self._name}). "
-                f"Are you sure if the key is right?"
+                f"The lock is not held by this thread or the lease has expired."
             )
-        self._locked = False
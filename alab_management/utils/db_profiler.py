@@ -0,0 +1,299 @@
+"""
+An opt-in profiler of the database operations, based on pymongo command monitoring.
+
+Every command sent to MongoDB is attributed to its call site, i.e. the first frame outside of pymongo and
+the database wrappers (e.g. ``alab_management.task_view.task_view:get_status:230``). For every call site,
+command and collection, the profiler records the number of calls, the failures, a latency histogram and
+the sizes of the commands and replies.
+
+The statistics are aggregated in time buckets of ``bucket_seconds`` in every process, and the finished
+buckets are written to the ``_db_profile`` collection by a background thread, so that the profile of all
+the alabos processes over a time window can be read with :py:func:`get_profile` (e.g. in the dashboard).
+
+The profiler is enabled in the config file:
+
+.. code-block:: toml
+
+  [db_profiler]
+  enabled = true
+  bucket_seconds = 60
+  retention_hours = 24
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import bson
+import pymongo
+from pymongo import monitoring
+
+from alab_management.config import AlabOSConfig
+
+# the upper bounds (in ms) of the latency histogram, the last bin is for everything slower
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_PROFILE_COLLECTION = "_db_profile"
+# the frames in these files are never reported as call sites
+_SKIPPED_PATHS = (
+    os.path.dirname(pymongo.__file__),
+    os.path.dirname(bson.__file__),
+    __file__,
+    os.path.join(os.path.dirname(__file__), "data_objects.py"),
+    threading.__file__,
+)
+
+
+def _empty_stats() -> dict[str, Any]:
+    return {
+        "count": 0,
+        "failures": 0,
+        "total_ms": 0.0,
+        "max_ms": 0.0,
+        "request_bytes": 0,
+        "reply_bytes": 0,
+        "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+    }
+
+
+def _merge_stats(stats: dict[str, Any], other: dict[str, Any]):
+    for key in ("count", "failures", "total_ms", "request_bytes", "reply_bytes"):
+        stats[key] += other[key]
+    stats["max_ms"] = max(stats["max_ms"], other["max_ms"])
+    stats["histogram"] = [
+        a + b for a, b in zip(stats["histogram"], other["histogram"], strict=True)
+    ]
+
+
+def _get_call_site() -> str:
+    """Get the first frame outside of pymongo and the database wrappers, as ``module:function:lineno``."""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.startswith(_SKIPPED_PATHS):
+        frame = frame.f_back  # type: ignore
+    if frame is None:
+        return "<unknown>"
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}:{frame.f_lineno}"
+
+
+class DBProfiler(monitoring.CommandListener):
+    """
+    Collect the statistics of the database commands, by call site, command and collection.
+
+    It is registered as an event listener of the MongoClient (see ``get_db_profiler``).
+    """
+
+    def __init__(self, bucket_seconds: float = 60.0):
+        """
+        Create a profiler.
+
+        Args:
+            bucket_seconds: the length of the time buckets that the statistics are aggregated in
+        """
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        # bucket start time -> (call site, command, collection) -> stats
+        self._buckets: dict[float, dict[tuple[str, str, str], dict[str, Any]]] = {}
+        # the commands that are sent but not finished yet
+        self._inflight: dict[tuple[int, Any], tuple[tuple[str, str, str], int]] = {}
+        self._local = threading.local()
+        self._collection = None
+        self._flush_thread: threading.Thread | None = None
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        """Attribute a command to its call site when it is sent."""
+        if getattr(self._local, "flushing", False):
+            return
+        collection = event.command.get(event.command_name)
+        key = (
+            _get_call_site(),
+            event.command_name,
+            collection if isinstance(collection, str) else "",
+        )
+        with self._lock:
+            self._inflight[(event.request_id, event.connection_id)] = (
+                key,
+                len(bson.encode(event.command)),
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        """Record a finished command."""
+        self._record(event, reply_bytes=len(bson.encode(event.reply)), failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        """Record a failed command."""
+        self._record(event, reply_bytes=0, failed=True)
+
+    def _record(self, event, reply_bytes: int, failed: bool):
+        latency_ms = event.duration_micros / 1000
+        with self._lock:
+            inflight = self._inflight.pop((event.request_id, event.connection_id), None)
+            if inflight is None:
+                return
+            key, request_bytes = inflight
+            bucket = time.time() // self.bucket_seconds * self.bucket_seconds
+            stats = self._buckets.setdefault(bucket, {}).get(key)
+            if stats is None:
+                stats = self._buckets[bucket][key] = _empty_stats()
+            stats["count"] += 1
+            stats["failures"] += int(failed)
+            stats["total_ms"] += latency_ms
+            stats["max_ms"] = max(stats["max_ms"], latency_ms)
+            stats["request_bytes"] += request_bytes
+            stats["reply_bytes"] += reply_bytes
+            stats["histogram"][self._get_histogram_bin(latency_ms)] += 1
+
+    @staticmethod
+    def _get_histogram_bin(latency_ms: float) -> int:
+        for i, upper_bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= upper_bound:
+                return i
+        return len(LATENCY_BUCKETS_MS)
+
+    def get_profile(self, seconds: float | None = None) -> list[dict[str, Any]]:
+        """
+        Get the statistics of this process in the last ``seconds`` (all the recorded statistics if None),
+        which have not been written to the database yet.
+        """
+        since = 0.0 if seconds is None else time.time() - seconds
+        with self._lock:
+            buckets = [
+                stats_by_key
+                for bucket, stats_by_key in self._buckets.items()
+                if bucket + self.bucket_seconds > since
+            ]
+            return _aggregate(
+                {"call_site": key[0], "command": key[1], "collection": key[2], **stats}
+                for stats_by_key in buckets
+                for key, stats in stats_by_key.items()
+            )
+
+    def start_flushing(self, collection):
+        """Write the finished buckets to the collection in a background thread."""
+        self._collection = collection
+        if self._flush_thread is None:
+            self._flush_thread = threading.Thread(
+                target=self._flush_loop, daemon=True, name="DBProfilerFlush"
+            )
+            self._flush_thread.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.bucket_seconds)
+            # the profile is best-effort, it should never break the lab
+            with contextlib.suppress(Exception):
+                self.flush()
+
+    def flush(self, all_buckets: bool = False):
+        """Write the finished buckets (or all of them) to the database and remove them from memory."""
+        if self._collection is None:
+            return
+        current_bucket = time.time() // self.bucket_seconds * self.bucket_seconds
+        with self._lock:
+            buckets = {
+                bucket: self._buckets.pop(bucket)
+                for bucket in list(self._buckets)
+                if all_buckets or bucket < current_bucket
+            }
+        entries = [
+            {
+                "bucket": datetime.fromtimestamp(bucket),
+                "bucket_seconds": self.bucket_seconds,
+                "process": f"{os.uname().nodename}:{os.getpid()}",
+                "call_site": key[0],
+                "command": key[1],
+                "collection": key[2],
+                **stats,
+            }
+            for bucket, stats_by_key in buckets.items()
+            for key, stats in stats_by_key.items()
+        ]
+        if not entries:
+            return
+        self._local.flushing = True
+        try:
+            self._collection.insert_many(entries, ordered=False)
+        finally:
+            self._local.flushing = False
+
+
+def _aggregate(entries) -> list[dict[str, Any]]:
+    """Merge the statistics with the same call site, command and collection. The slowest in total come first."""
+    profile: dict[tuple[str, str, str], dict[str, Any]] = {}
+    for entry in entries:
+        key = (entry["call_site"], entry["command"], entry["collection"])
+        if key not in profile:
+            profile[key] = {
+                "call_site": key[0],
+                "command": key[1],
+                "collection": key[2],
+                **_empty_stats(),
+            }
+        _merge_stats(profile[key], entry)
+    for stats in profile.values():
+        stats["mean_ms"] = stats["total_ms"] / stats["count"] if stats["count"] else 0.0
+    return sorted(profile.values(), key=lambda stats: stats["total_ms"], reverse=True)
+
+
+_profiler: DBProfiler | None = None
+_profiler_lock = threading.Lock()
+
+
+def get_db_profiler() -> DBProfiler | None:
+    """Get the profiler of this process, or None if it is not enabled in the config."""
+    global _profiler
+    config = AlabOSConfig().get("db_profiler", {})
+    if not config.get("enabled", False):
+        return None
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = DBProfiler(bucket_seconds=config.get("bucket_seconds", 60.0))
+    return _profiler
+
+
+def start_db_profiler(db):
+    """Start writing the profile of this process to the database, if the profiler is enabled."""
+    profiler = get_db_profiler()
+    if profiler is None:
+        return
+    collection = db[_PROFILE_COLLECTION]
+    retention_hours = AlabOSConfig().get("db_profiler", {}).get("retention_hours", 24)
+    collection.create_index("bucket", expireAfterSeconds=int(retention_hours * 3600))
+    profiler.start_flushing(collection)
+
+
+def get_profile(seconds: float = 3600.0) -> list[dict[str, Any]]:
+    """
+    Get the profile of all the processes in the last ``seconds``, from the ``_db_profile`` collection.
+    The statistics of the current time bucket are not written to the database yet.
+    """
+    from alab_management.utils.data_objects import get_collection
+
+    return _aggregate(
+        get_collection(_PROFILE_COLLECTION).find(
+            {"bucket": {"$gte": datetime.now() - timedelta(seconds=seconds)}},
+            projection={"_id": False},
+        )
+    )
+
+
+def dump_profile(path: str | Path, seconds: float = 3600.0) -> list[dict[str, Any]]:
+    """Write the profile of the last ``seconds`` to a json file, and return it."""
+    profile = get_profile(seconds)
+    Path(path).write_text(
+        json.dumps(
+            {
+                "generated_at": datetime.now().isoformat(),
+                "seconds": seconds,
+                "latency_buckets_ms": LATENCY_BUCKETS_MS,
+                "profile": profile,
+            },
+            indent=2,
+        )
+    )
+    return profile
@@ -0,0 +1,181 @@
+"""
+This file defines the database watcher, which uses MongoDB change streams to wake up
+threads that are waiting for a collection (or a whole database) to change.
+"""
+
+import threading
+import time
+from collections.abc import Callable
+from traceback import print_exc
+from typing import Any
+
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import PyMongoError
+
+
+class CollectionWatcher:
+    """
+    Watch a collection or a database with a MongoDB change stream and notify the waiting threads
+    when a matching change arrives.
+
+    Change streams are only supported by replica sets and sharded clusters. If the change stream
+    cannot be opened (e.g. on a standalone ``mongod``), ``available`` will be False and the callers
+    are expected to fall back to polling.
+
+    The waiters use a generation counter to avoid losing notifications: read ``generation``
+    before checking the database, and then pass it to ``wait``, which will return immediately if
+    anything has changed in between.
+    """
+
+    def __init__(
+        self,
+        target: Collection | Database,
+        pipeline: list[dict[str, Any]] | None = None,
+        full_document: str | None = None,
+        on_change: Callable[[dict[str, Any]], None] | None = None,
+        max_await_time_ms: int = 500,
+    ):
+        """
+        Args:
+            target: the collection or the database to watch
+            pipeline: the aggregation pipeline to filter the change events
+            full_document: passed to ``watch``, e.g. "updateLookup" to get the full document of updates
+            on_change: a callback that is called with every change event (in the watcher thread)
+            max_await_time_ms: the max time that the watcher thread waits for a new event before
+              checking if it should stop.
+        """
+        self._target = target
+        self._pipeline = pipeline or []
+        self._full_document = full_document
+        self._on_change = on_change
+        self._max_await_time_ms = max_await_time_ms
+
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._reopened = 0
+        self._available = False
+        self._stop = False
+        self._resume_token = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def available(self) -> bool:
+        """Whether the change stream is currently open."""
+        return self._available
+
+    @property
+    def generation(self) -> int:
+        """A counter that increases every time a change is received."""
+        return self._generation
+
+    @property
+    def reopened(self) -> int:
+        """
+        A counter that increases every time the change stream is reopened after being lost.
+        Some changes may have been missed in between, so the callers that keep a copy of the
+        data should reload it when this counter changes.
+        """
+        return self._reopened
+
+    def start(self) -> bool:
+        """
+        Open the change stream and start the watcher thread.
+
+        Returns
+        -------
+            True if the change stream is opened, False if change streams are not supported.
+        """
+        if self._thread is not None:
+            return self._available
+        try:
+            stream = self._open()
+        except (PyMongoError, NotImplementedError):
+            self._available = False
+            return False
+        self._available = True
+        self._thread = threading.Thread(
+            target=self._run, args=(stream,), name="CollectionWatcher", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Stop the watcher thread and wake up all the waiters."""
+        self._stop = True
+        self.wake()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._available = False
+
+    def wake(self):
+        """Wake up all the waiters, as if a change has been received."""
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def wait(self, since: int, timeout: float | None = None) -> int:
+        """
+        Block until a change is received after the generation ``since``, or until timeout.
+
+        Args:
+            since: the generation read before the caller last checked the database
+            timeout: the max time to wait in seconds
+
+        Returns
+        -------
+            the current generation
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._generation != since or self._stop, timeout=timeout
+            )
+            return self._generation
+
+    def _open(self):
+        kwargs: dict[str, Any] = {"max_await_time_ms": self._max_await_time_ms}
+        if self._full_document is not None:
+            kwargs["full_document"] = self._full_document
+        if self._resume_token is not None:
+            kwargs["resume_after"] = self._resume_token
+        return self._target.watch(self._pipeline, **kwargs)
+
+    def _run(self, stream):
+        while not self._stop:
+            try:
+                with stream:
+                    while not self._stop and stream.alive:
+                        change = stream.try_next()
+                        self._resume_token = stream.resume_token
+                        if change is None:
+                            continue
+                        if self._on_change is not None:
+                            try:
+                                self._on_change(change)
+                            except Exception:  # pylint: disable=broad-except
+                                print_exc()
+                        self.wake()
+            except PyMongoError:
+                pass
+
+            if self._stop:
+                break
+
+            # the stream is lost (pymongo has already tried to resume it once), let the waiters
+            # poll the database until we can reopen it.
+            self._available = False
+            self.wake()
+            while not self._stop:
+                time.sleep(1)
+                try:
+                    stream = self._open()
+                except PyMongoError:
+                    # the resume token may be too old, start from now
+                    self._resume_token = None
+                    continue
+                self._reopened += 1
+                self._available = True
+                # we may have missed some changes in between
+                self.wake()
+                break
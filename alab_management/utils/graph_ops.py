@@ -16,46 +16,66 @@ class Graph:
             raise ValueError("Duplicated value in vertices.")
         self.vertices = vertices
         self.edges = edges
+        # the reversed adjacent table, parents are sorted by their indices
+        self._parents: dict[int, list[int]] = {i: [] for i in range(len(vertices))}
+        for i in sorted(edges):
+            for child in edges[i]:
+                if child in self._parents:
+                    self._parents[child].append(i)
+
+    @property
+    def vertices(self) -> list[Any]:
+        """The values of the vertices."""
+        return self._vertices
+
+    @vertices.setter
+    def vertices(self, vertices: list[Any]):
+        self._vertices = vertices
+        self._indices = {vertex: i for i, vertex in enumerate(vertices)}
 
     def has_cycle(self) -> bool:
         """Use DFS algorithm to detect cycle in a graph."""
         visited = [False] * len(self.vertices)
         rec_stack = [False] * len(self.vertices)
 
-        def _is_cyclic(v):
-            visited[v] = True
-            rec_stack[v] = True
-
-            # Recur for all neighbours
-            # if any neighbour is visited and in
-            # recStack then graph is cyclic
-            for child in self.edges[v]:
-                if not visited[child] and _is_cyclic(child):
-                    return True
-                if rec_stack[child]:
-                    return True
-
-            # The vertex needs to be popped from
-            # recursion stack before function ends
-            rec_stack[v] = False
-            return False
-
-        return any(
-            not visited[vertex] and _is_cyclic(vertex)
-            for vertex in range(len(self.vertices))
-        )
+        # use an explicit stack instead of recursion, so that long chains of tasks
+        # do not hit the recursion limit
+        for root in range(len(self.vertices)):
+            if visited[root]:
+                continue
+            visited[root] = True
+            rec_stack[root] = True
+            stack = [(root, iter(self.edges[root]))]
+            while stack:
+                v, children = stack[-1]
+                for child in children:
+                    # if any neighbour is visited and in
+                    # recStack then graph is cyclic
+                    if rec_stack[child]:
+                        return True
+                    if not visited[child]:
+                        visited[child] = True
+                        rec_stack[child] = True
+                        stack.append((child, iter(self.edges[child])))
+                        break
+                else:
+                    # The vertex needs to be popped from
+                    # recursion stack when all its children are visited
+                    rec_stack[v] = False
+                    stack.pop()
+        return False
+
+    def _index(self, v: Any) -> int:
+        if v not in self._indices:
+            raise ValueError(f"{v} is not in the graph.")
+        return self._indices[v]
 
     def get_parents(self, v: Any) -> list[Any]:
         """Provide the value of vertex, return the value of its parents vertices."""
-        index = self.vertices.index(v)
-        return [
-            self.vertices[i]
-            for i, children in self.edges.items()
-            for child in children
-            if child == index
-        ]
+        index = self._index(v)
+        return [self.vertices[i] for i in self._parents[index]]
 
     def get_children(self, v: Any) -> list[Any]:
         """Provide the index of vertex, return the value of its children vertices."""
-        index = self.vertices.index(v)
+        index = self._index(v)
         return [self.vertices[i] for i in self.edges[index]]
@@ -0,0 +1,99 @@
+"""
+This file defines an executor that runs the jobs with the same key (e.g. the same device)
+one by one, while the jobs with different keys share a bounded thread pool.
+"""
+
+import threading
+from collections import deque
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+
+class KeyedExecutor:
+    """
+    A bounded thread pool with one queue per key.
+
+    At most ``max_concurrency_per_key`` jobs with the same key run at the same time, the rest
+    of them wait in the queue of the key (in the order they are submitted). The jobs with
+    different keys run in parallel, up to ``max_workers`` in total.
+    """
+
+    def __init__(self, max_workers: int, max_concurrency_per_key: int = 1):
+        """
+        Create a keyed executor.
+
+        Args:
+            max_workers: the max number of threads in the pool
+            max_concurrency_per_key: the max number of running jobs with the same key
+        """
+        if max_concurrency_per_key < 1:
+            raise ValueError("max_concurrency_per_key should be at least 1.")
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="KeyedExecutor"
+        )
+        self._max_concurrency_per_key = max_concurrency_per_key
+        self._lock = threading.Lock()
+        self._queues: dict[Hashable, deque[tuple[Future, Callable, tuple, dict]]] = {}
+        self._running: dict[Hashable, int] = {}
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs) -> Future:
+        """Submit a job with a key. Return a future of the result of the job."""
+        future: Future = Future()
+        with self._lock:
+            self._queues.setdefault(key, deque()).append((future, fn, args, kwargs))
+            self._schedule(key)
+        return future
+
+    def queue_depths(self) -> dict[Hashable, dict[str, int]]:
+        """Get the number of waiting and running jobs of every key."""
+        with self._lock:
+            return {
+                key: {
+                    "waiting": len(self._queues.get(key, ())),
+                    "running": self._running.get(key, 0),
+                }
+                for key in set(self._queues) | set(self._running)
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting new jobs. The queued jobs are canceled."""
+        with self._lock:
+            for queue in self._queues.values():
+                for future, *_ in queue:
+                    future.cancel()
+            self._queues.clear()
+        self._pool.shutdown(wait=wait)
+
+    def _schedule(self, key: Hashable):
+        """Start the next jobs of the key if there are free slots. Must be called with the lock held."""
+        queue = self._queues.get(key)
+        while queue and self._running.get(key, 0) < self._max_concurrency_per_key:
+            future, fn, args, kwargs = queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._running[key] = self._running.get(key, 0) + 1
+            self._pool.submit(self._run, key, future, fn, args, kwargs)
+        if not queue:
+            self._queues.pop(key, None)
+
+    def _run(
+        self,
+        key: Hashable,
+        future: Future,
+        fn: Callable,
+        args: tuple,
+        kwargs: dict[str, Any],
+    ):
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exception:  # pylint: disable=broad-except
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._running[key] -= 1
+                if self._running[key] == 0:
+                    del self._running[key]
+                self._schedule(key)
@@ -0,0 +1,127 @@
+"""
+Benchmark of reading the device signals: ``DeviceSignalStore.get_signal`` (one decoded document per reading)
+against ``DeviceSignalStore.get_signal_array`` (the readings are packed into columns by the database), and
+the downsampled ``get_signal_array(max_points=...)``.
+
+The benchmark writes ``--readings`` readings of one signal (one per second) into the ``device_signals``
+collection and reports the latency of reading all of them back.
+
+Usage::
+
+    python benchmarks/device_signals.py --readings 100000 --iterations 5
+
+It needs a MongoDB server (>= 5.0 for the time-series collection) at ``--host``/``--port``. The database
+``alabos_benchmark_signals`` is dropped at the end.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+_DATABASE_NAME = "alabos_benchmark_signals"
+
+_CONFIG_TEMPLATE = """
+[general]
+working_dir = "."
+name = "{name}"
+
+[mongodb]
+host = "{host}"
+port = {port}
+username = ""
+password = ""
+
+[mongodb_completed]
+host = "{host}"
+port = {port}
+username = ""
+password = ""
+
+[logger]
+buffered = false
+"""
+
+
+def _measure(function, iterations: int) -> dict[str, float]:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"mean_ms": statistics.mean(latencies), "min_ms": min(latencies)}
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--readings", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--max-points", type=int, default=1000)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    args = parser.parse_args()
+
+    project = Path(tempfile.mkdtemp(prefix="alabos_benchmark_"))
+    (project / "config.toml").write_text(
+        _CONFIG_TEMPLATE.format(name=_DATABASE_NAME, host=args.host, port=args.port)
+    )
+    os.environ["ALABOS_CONFIG_PATH"] = str(project / "config.toml")
+    os.environ["SIM_MODE_FLAG"] = "True"
+
+    from alab_management.device_signals import DeviceSignalStore
+    from alab_management.utils.data_objects import get_db
+
+    store = DeviceSignalStore()
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(seconds=args.readings - 1)
+    store._signal_collection.insert_many(
+        {
+            "meta": {"device_name": "furnace_1", "signal_name": "Temperature"},
+            "timestamp": start + timedelta(seconds=i),
+            "value": 20.0 + (i % 1000) / 10,
+        }
+        for i in range(args.readings)
+    )
+
+    within = datetime.now() - start
+    results = {
+        "get_signal": _measure(
+            lambda: store.get_signal("furnace_1", "Temperature", within=within),
+            args.iterations,
+        ),
+        "get_signal_array": _measure(
+            lambda: store.get_signal_array(
+                "furnace_1", "Temperature", start=start, end=end
+            ),
+            args.iterations,
+        ),
+        f"get_signal_array({args.max_points})": _measure(
+            lambda: store.get_signal_array(
+                "furnace_1",
+                "Temperature",
+                start=start,
+                end=end,
+                max_points=args.max_points,
+            ),
+            args.iterations,
+        ),
+    }
+    get_db().client.drop_database(f"{_DATABASE_NAME}_sim")
+
+    baseline = results["get_signal"]["mean_ms"]
+    print(f"{args.readings} readings, {args.iterations} iterations")
+    print(f"{'method':<28}{'mean ms':>10}{'min ms':>10}{'speedup':>9}")
+    for method, result in results.items():
+        print(
+            f"{method:<28}{result['mean_ms']:>10.1f}{result['min_ms']:>10.1f}"
+            f"{baseline / result['mean_ms']:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,520 @@
+"""
+Benchmarks of the scheduler core loops.
+
+Every benchmark sets up a synthetic lab of the given size (devices, device types and sample positions)
+in a temporary project, fills the database with the pending work (resource requests, ready tasks or
+pending experiments), and then reports the latency of every loop iteration and the number of database
+commands that an iteration sends.
+
+- ``resource_manager``: ``ResourceManager._loop`` with ``--requests`` pending requests
+- ``task_manager``: ``TaskManager._loop`` with ``--tasks`` READY tasks
+- ``experiment_manager``: ``ExperimentManager._loop`` with ``--experiments`` pending experiments
+- ``sample_positions``: ``SampleView.request_sample_positions`` with half of the positions occupied
+
+For every loop, the ``first`` iteration handles the whole backlog (e.g. grants the requests that can be
+fulfilled), and the ``steady`` iterations show the cost of a loop when nothing can change, which is
+what the lab pays every 0.5-1 s while it is busy.
+
+Usage::
+
+    python benchmarks/scheduler_loops.py --devices 50 --requests 500 --tasks 1000 --experiments 100
+    python benchmarks/scheduler_loops.py --only resource_manager --json results.json
+    python benchmarks/scheduler_loops.py --mongomock
+
+The benchmarks use the MongoDB server at ``--host``/``--port`` (database ``alabos_benchmark_sim``,
+which is dropped at the end). With ``--mongomock`` (``pip install mongomock``, included in the ``dev``
+extra), no server is needed, but the latency is not representative of a real server, and the operations
+that mongomock does not support (e.g. some aggregation stages) may fail. mongomock has no change streams
+and no transactions either, so ``CollectionWatcher`` is unavailable (the callers poll the database) and
+``start_transaction`` yields no session: the ``resource_manager`` and ``experiment_manager`` numbers do
+not reflect the change-stream and transaction code paths that a replica set would run.
+The tasks are sent to a dramatiq ``StubBroker``, so RabbitMQ is not needed either.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from bson import ObjectId
+from pymongo import monitoring
+
+_DATABASE_NAME = "alabos_benchmark"
+
+_CONFIG_TEMPLATE = """
+[general]
+working_dir = "."
+name = "{name}"
+
+[mongodb]
+host = "{host}"
+port = {port}
+username = ""
+password = ""
+
+[mongodb_completed]
+host = "{host}"
+port = {port}
+username = ""
+password = ""
+
+[rabbitmq]
+host = "localhost"
+port = 5672
+
+[alarm]
+email_receivers = []
+email_sender = " "
+email_password = " "
+slack_bot_token = " "
+slack_channel_id = " "
+
+[large_result_storage]
+default_storage_type = "gridfs"
+"""
+
+# the definition of the synthetic lab, which is imported by ``load_definition``
+_LAB_TEMPLATE = '''
+from typing import ClassVar
+
+from alab_management.device_view import BaseDevice, add_device
+from alab_management.sample_view import SamplePosition, add_standalone_sample_position
+from alab_management.task_view import BaseTask, add_task
+
+N_DEVICES = {n_devices}
+N_DEVICE_TYPES = {n_device_types}
+N_POSITIONS = {n_positions}
+
+
+class BenchmarkDevice(BaseDevice):
+    """A device that does nothing."""
+
+    description: ClassVar[str] = "Benchmark device"
+
+    @property
+    def sample_positions(self):
+        return [SamplePosition("slot", number=N_POSITIONS)]
+
+    def emergent_stop(self):
+        pass
+
+    def is_running(self) -> bool:
+        return False
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+class BenchmarkTask(BaseTask):
+    """A task that does nothing."""
+
+    def __init__(self, samples, *args, **kwargs):
+        super().__init__(samples=samples, *args, **kwargs)
+
+    def run(self):
+        return self.task_id
+
+
+device_types = [
+    type(f"BenchmarkDevice{{i}}", (BenchmarkDevice,), {{}}) for i in range(N_DEVICE_TYPES)
+]
+for i in range(N_DEVICES):
+    add_device(device_types[i % N_DEVICE_TYPES](name=f"device_{{i}}"))
+add_standalone_sample_position(SamplePosition("storage", number=N_POSITIONS * N_DEVICES))
+add_task(BenchmarkTask)
+'''
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Count the commands sent to the MongoDB server, by command name."""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+
+    def started(self, event):
+        """Count a command when it is sent."""
+        self.counts[event.command_name] += 1
+
+    def succeeded(self, event):
+        """Ignore the successful replies."""
+
+    def failed(self, event):
+        """Ignore the failed replies."""
+
+
+class MongomockCounter:
+    """
+    Count the collection operations with mongomock, which does not support command monitoring.
+    Only the outermost operation is counted (e.g. ``find_one`` calls ``find`` in mongomock).
+    """
+
+    _OPERATIONS = (
+        "aggregate",
+        "bulk_write",
+        "count_documents",
+        "delete_many",
+        "delete_one",
+        "distinct",
+        "find",
+        "find_one",
+        "find_one_and_update",
+        "insert_many",
+        "insert_one",
+        "replace_one",
+        "update_many",
+        "update_one",
+    )
+
+    def __init__(self):
+        import mongomock
+
+        self.counts: Counter = Counter()
+        self._local = threading.local()
+        for operation in self._OPERATIONS:
+            method = getattr(mongomock.collection.Collection, operation)
+            setattr(
+                mongomock.collection.Collection,
+                operation,
+                self._wrap(operation, method),
+            )
+
+    def _wrap(self, operation: str, method: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            depth = getattr(self._local, "depth", 0)
+            if depth == 0:
+                self.counts[operation] += 1
+            self._local.depth = depth + 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._local.depth = depth
+
+        return wrapper
+
+
+def measure(
+    name: str, phase: str, fn: Callable[[], Any], iterations: int, counter
+) -> dict[str, Any]:
+    """Run ``fn`` for some iterations and report the latency and the database commands per iteration."""
+    latencies = []
+    counter.counts.clear()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    commands = dict(counter.counts)
+    latencies.sort()
+    return {
+        "benchmark": name,
+        "phase": phase,
+        "iterations": iterations,
+        "mean_ms": statistics.fmean(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "max_ms": latencies[-1],
+        "db_commands_per_iteration": sum(commands.values()) / iterations,
+        "db_commands": {
+            command: count / iterations for command, count in sorted(commands.items())
+        },
+    }
+
+
+def reset_lab():
+    """Drop the benchmark database and set up the synthetic lab again."""
+    from alab_management.scripts.cleanup_lab import cleanup_lab
+    from alab_management.scripts.setup_lab import setup_lab
+
+    cleanup_lab(
+        all_collections=True,
+        _force_i_know_its_dangerous=True,
+        sim_mode=True,
+        database_name=f"{_DATABASE_NAME}_sim",
+        user_confirmation="y",
+    )
+    setup_lab()
+
+
+def insert_tasks(n_tasks: int, status: str) -> list[ObjectId]:
+    """Insert tasks with one sample each, and set their status."""
+    from alab_management.task_view import TaskView
+    from alab_management.utils.data_objects import get_collection
+
+    task_ids = TaskView().create_tasks(
+        [
+            {
+                "task_type": "BenchmarkTask",
+                "samples": [{"name": f"sample_{i}", "sample_id": ObjectId()}],
+                "parameters": {"priority": random.randint(0, 40)},
+            }
+            for i in range(n_tasks)
+        ]
+    )
+    get_collection("tasks").update_many(
+        {"_id": {"$in": task_ids}}, {"$set": {"status": status}}
+    )
+    return task_ids
+
+
+def bench_resource_manager(args, counter) -> list[dict[str, Any]]:
+    """Benchmark ``ResourceManager._loop`` with many pending requests."""
+    from alab_management.resource_manager.resource_manager import ResourceManager
+    from alab_management.utils.data_objects import get_collection
+
+    reset_lab()
+    task_ids = insert_tasks(args.requests, "REQUESTING_RESOURCES")
+    get_collection("requests").insert_many(
+        [
+            {
+                "request": [
+                    {
+                        "device": {
+                            "identifier": "type",
+                            "content": f"BenchmarkDevice{i % args.device_types}",
+                        },
+                        "sample_positions": [{"prefix": "slot", "number": 1}],
+                    },
+                    {
+                        "device": {"identifier": "__nodevice", "content": "__nodevice"},
+                        "sample_positions": [{"prefix": "storage", "number": 1}],
+                    },
+                ],
+                "status": "PENDING",
+                "task_id": task_id,
+                "priority": random.randint(0, 40),
+                "submitted_at": datetime.now(),
+            }
+            for i, task_id in enumerate(task_ids)
+        ]
+    )
+    resource_manager = ResourceManager()
+    return [
+        measure("resource_manager", "first", resource_manager._loop, 1, counter),
+        measure(
+            "resource_manager",
+            "steady",
+            resource_manager._loop,
+            args.iterations,
+            counter,
+        ),
+    ]
+
+
+def bench_task_manager(args, counter) -> list[dict[str, Any]]:
+    """Benchmark ``TaskManager._loop`` with many ready tasks."""
+    import dramatiq
+    from dramatiq.brokers.stub import StubBroker
+
+    from alab_management.task_actor import run_task
+    from alab_management.task_manager.task_manager import TaskManager
+
+    reset_lab()
+    # send the tasks to a stub broker instead of RabbitMQ
+    broker = StubBroker()
+    dramatiq.set_broker(broker)
+    broker.declare_actor(run_task)
+    run_task.broker = broker
+
+    insert_tasks(args.tasks, "READY")
+    task_manager = TaskManager()
+    return [
+        measure("task_manager", "first", task_manager._loop, 1, counter),
+        measure("task_manager", "steady", task_manager._loop, args.iterations, counter),
+    ]
+
+
+def bench_experiment_manager(args, counter) -> list[dict[str, Any]]:
+    """Benchmark ``ExperimentManager._loop`` with many pending experiments."""
+    from alab_management.experiment_manager import ExperimentManager
+    from alab_management.experiment_view import InputExperiment
+
+    reset_lab()
+    experiment_manager = ExperimentManager()
+    for i in range(args.experiments):
+        experiment_manager.experiment_view.create_experiment(
+            InputExperiment(
+                name=f"experiment_{i}",
+                tags=[],
+                metadata={},
+                samples=[
+                    {"name": f"experiment_{i}_sample", "metadata": {}, "tags": []}
+                ],
+                tasks=[
+                    {
+                        "type": "BenchmarkTask",
+                        "prev_tasks": [j - 1] if j > 0 else [],
+                        "parameters": {},
+                        "samples": [f"experiment_{i}_sample"],
+                    }
+                    for j in range(args.tasks_per_experiment)
+                ],
+            )
+        )
+    return [
+        measure("experiment_manager", "first", experiment_manager._loop, 1, counter),
+        measure(
+            "experiment_manager",
+            "steady",
+            experiment_manager._loop,
+            args.iterations,
+            counter,
+        ),
+    ]
+
+
+def bench_sample_positions(args, counter) -> list[dict[str, Any]]:
+    """Benchmark ``SampleView.request_sample_positions`` with half of the positions occupied."""
+    from alab_management.sample_view import SampleView
+    from alab_management.sample_view.sample_view import SamplePositionRequest
+    from alab_management.utils.data_objects import get_collection
+
+    reset_lab()
+    positions = [
+        position["name"]
+        for position in get_collection("sample_positions").find({}, ["name"])
+    ]
+    get_collection("samples").insert_many(
+        [
+            {"name": f"sample_{i}", "position": position, "task_id": None}
+            for i, position in enumerate(random.sample(positions, len(positions) // 2))
+        ]
+    )
+    sample_view = SampleView()
+    task_id = ObjectId()
+
+    def request_sample_positions():
+        sample_view.request_sample_positions(
+            task_id,
+            [
+                SamplePositionRequest(
+                    prefix=f"device_{random.randrange(args.devices)}/slot", number=1
+                ),
+                SamplePositionRequest(prefix="storage", number=2),
+            ],
+        )
+
+    return [
+        measure(
+            "sample_positions",
+            "steady",
+            request_sample_positions,
+            args.iterations,
+            counter,
+        )
+    ]
+
+
+_BENCHMARKS = {
+    "resource_manager": bench_resource_manager,
+    "task_manager": bench_task_manager,
+    "experiment_manager": bench_experiment_manager,
+    "sample_positions": bench_sample_positions,
+}
+
+
+def create_project(args) -> Path:
+    """Create a temporary project with the config and the definition of the synthetic lab."""
+    project = Path(tempfile.mkdtemp(prefix="alabos_benchmark_"))
+    (project / "config.toml").write_text(
+        _CONFIG_TEMPLATE.format(name=_DATABASE_NAME, host=args.host, port=args.port)
+    )
+    (project / "__init__.py").write_text(
+        _LAB_TEMPLATE.format(
+            n_devices=args.devices,
+            n_device_types=args.device_types,
+            n_positions=args.positions,
+        )
+    )
+    return project
+
+
+def print_results(results: list[dict[str, Any]]):
+    """Print the results as a table."""
+    header = f"{'benchmark':<20}{'phase':<8}{'iters':>6}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}{'db ops':>9}  top db ops"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        top_commands = sorted(
+            result["db_commands"].items(), key=lambda item: item[1], reverse=True
+        )[:3]
+        print(
+            f"{result['benchmark']:<20}{result['phase']:<8}{result['iterations']:>6}"
+            f"{result['mean_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['max_ms']:>10.2f}"
+            f"{result['db_commands_per_iteration']:>9.1f}  "
+            + ", ".join(f"{command}={count:g}" for command, count in top_commands)
+        )
+
+
+def main():
+    """Run the benchmarks and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--device-types", type=int, default=4)
+    parser.add_argument("--positions", type=int, default=8, help="per device")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--experiments", type=int, default=50)
+    parser.add_argument("--tasks-per-experiment", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--only", choices=list(_BENCHMARKS), action="append")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--mongomock", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="write the results to a json file")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    project = create_project(args)
+    os.environ["ALABOS_CONFIG_PATH"] = str(project / "config.toml")
+    os.environ["SIM_MODE_FLAG"] = "True"
+
+    # the listener and the client must be set up before the first connection
+    if args.mongomock:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit(
+                "--mongomock requires mongomock: `pip install mongomock` "
+                "(or `pip install -e .[dev]`)."
+            )
+        import pymongo
+
+        # alabos creates a client for every connection, which must share the same in-memory server
+        import alab_management.utils.data_objects  # noqa: F401
+
+        client = mongomock.MongoClient()
+        pymongo.MongoClient = lambda *_args, **_kwargs: client
+        counter = MongomockCounter()
+    else:
+        counter = CommandCounter()
+        monitoring.register(counter)
+
+    results = []
+    for name in args.only or list(_BENCHMARKS):
+        results += _BENCHMARKS[name](args, counter)
+
+    from alab_management.utils.data_objects import get_db
+
+    get_db().client.drop_database(f"{_DATABASE_NAME}_sim")
+
+    print_results(results)
+    if args.json is not None:
+        args.json.write_text(
+            json.dumps({"arguments": vars(args), "results": results}, default=str)
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from bson import ObjectId
+
+from alab_management.resource_manager.allocator import BatchAllocator
+from alab_management.resource_manager.enums import _EXTRA_REQUEST
+from alab_management.resource_manager.resource_index import ResourceIndex
+
+
+def make_request(device_type, number, priority, submitted_at):
+    return {
+        "_id": ObjectId(),
+        "task_id": ObjectId(),
+        "priority": priority,
+        "submitted_at": submitted_at,
+        "request": [
+            {
+                "device": {"identifier": "type", "content": device_type},
+                "sample_positions": [],
+            },
+            {
+                "device": {"identifier": _EXTRA_REQUEST, "content": None},
+                "sample_positions": [{"prefix": "tray", "number": number}],
+            },
+        ],
+    }
+
+
+class TestBatchAllocator(TestCase):
+    def setUp(self) -> None:
+        self.resource_index = ResourceIndex()
+        self.resource_index.set_devices(
+            {
+                "name": f"furnace_{i}",
+                "type": "Furnace",
+                "status": "IDLE",
+                "pause_status": "RELEASED",
+                "task_id": None,
+            }
+            for i in range(2)
+        )
+        self.resource_index.set_sample_positions(
+            {"name": f"tray/{i}", "task_id": None} for i in range(1, 5)
+        )
+        self.now = datetime.now()
+
+    def test_solve(self):
+        low = make_request("Furnace", 1, 10, self.now - timedelta(seconds=30))
+        high = make_request("Furnace", 3, 20, self.now)
+        large = make_request("Furnace", 2, 10, self.now)
+        allocations = BatchAllocator().solve(
+            self.resource_index, [low, high, large], now=self.now
+        )
+
+        self.assertEqual([high, low, large], [a.request for a in allocations])
+        self.assertEqual([True, True, False], [a.granted for a in allocations])
+        self.assertNotEqual(
+            allocations[0].devices["Furnace"]["name"],
+            allocations[1].devices["Furnace"]["name"],
+        )
+        # the index itself is not modified
+        self.assertTrue(
+            all(
+                device.task_id is None
+                for device in self.resource_index.devices.values()
+            )
+        )
+
+    def test_aging(self):
+        old = make_request("Furnace", 3, 10, self.now - timedelta(minutes=20))
+        new = make_request("Furnace", 3, 20, self.now)
+        allocations = BatchAllocator(aging_rate=1.0).solve(
+            self.resource_index, [new, old], now=self.now
+        )
+        self.assertEqual([old, new], [a.request for a in allocations])
+        self.assertEqual([True, False], [a.granted for a in allocations])
+
+        allocations = BatchAllocator(aging_rate=0.0).solve(
+            self.resource_index, [new, old], now=self.now
+        )
+        self.assertEqual([new, old], [a.request for a in allocations])
+
+    def test_starvation(self):
+        self.resource_index.sample_positions["tray/1"].task_id = ObjectId()
+        starving = make_request("Furnace", 4, 20, self.now - timedelta(hours=1))
+        small = make_request("Furnace", 1, 10, self.now)
+
+        allocations = BatchAllocator(starvation_seconds=600).solve(
+            self.resource_index, [starving, small], now=self.now
+        )
+        self.assertEqual([False, False], [a.granted for a in allocations])
+
+        allocations = BatchAllocator(starvation_seconds=7200).solve(
+            self.resource_index, [starving, small], now=self.now
+        )
+        self.assertEqual([False, True], [a.granted for a in allocations])
+
+    def test_starvation_holds_granted_resources(self):
+        self.resource_index.set_devices(
+            [
+                *(
+                    {
+                        "name": f"furnace_{i}",
+                        "type": "Furnace",
+                        "status": "IDLE",
+                        "pause_status": "RELEASED",
+                        "task_id": None,
+                    }
+                    for i in range(2)
+                ),
+                {
+                    "name": "robot",
+                    "type": "Robot",
+                    "status": "OCCUPIED",
+                    "pause_status": "RELEASED",
+                    "task_id": ObjectId(),
+                },
+            ]
+        )
+        # the starving request waits for the robot, it holds one furnace and two positions only
+        starving = make_request("Furnace", 2, 20, self.now - timedelta(hours=1))
+        starving["request"].append(
+            {
+                "device": {"identifier": "name", "content": "robot"},
+                "sample_positions": [],
+            }
+        )
+        small = make_request("Furnace", 2, 10, self.now)
+
+        allocations = BatchAllocator(starvation_seconds=600).solve(
+            self.resource_index, [starving, small], now=self.now
+        )
+        self.assertEqual([False, True], [a.granted for a in allocations])
+        self.assertEqual(
+            2,
+            sum(
+                len(positions) for positions in allocations[1].sample_positions.values()
+            ),
+        )
+
+    def test_error(self):
+        request = make_request("NotExist", 1, 10, self.now)
+        (allocation,) = BatchAllocator().solve(
+            self.resource_index, [request], now=self.now
+        )
+        self.assertFalse(allocation.granted)
+        self.assertIsInstance(allocation.error, ValueError)
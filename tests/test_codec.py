@@ -0,0 +1,110 @@
+from datetime import datetime
+from unittest import TestCase
+
+import numpy as np
+from bson import ObjectId
+
+from alab_management.utils.codec import (
+    CONTENT_TYPE_DILL,
+    CONTENT_TYPE_MSGPACK,
+    MsgpackCodec,
+    get_codec,
+)
+
+
+class TestCodec(TestCase):
+    def setUp(self) -> None:
+        self.codec = get_codec(CONTENT_TYPE_MSGPACK)
+
+    def test_round_trip(self):
+        task_id = ObjectId()
+        now = datetime.now()
+        body = {
+            "device": "furnace_1",
+            "method": "run_program",
+            "args": ((1, 2), [3, 4], {5, 6}),
+            "kwargs": {"task_id": task_id, "time": now, "temperature": np.float64(1.5)},
+            "none": None,
+            "bytes": b"\x00\x01",
+        }
+        decoded = self.codec.decode(self.codec.encode(body))
+        self.assertEqual(decoded, body)
+        self.assertIsInstance(decoded["args"][0], tuple)
+        self.assertIsInstance(decoded["kwargs"]["task_id"], ObjectId)
+        self.assertIsInstance(decoded["kwargs"]["temperature"], np.float64)
+
+    def test_ndarray(self):
+        array = np.arange(24, dtype=np.float32).reshape(2, 3, 4)
+        for value in (array, array[:, ::2], np.array([], dtype=np.int64)):
+            decoded = self.codec.decode(self.codec.encode({"result": value}))["result"]
+            self.assertEqual(decoded.dtype, value.dtype)
+            self.assertEqual(decoded.shape, value.shape)
+            np.testing.assert_array_equal(decoded, value)
+            # decoded without copying the buffer
+            self.assertFalse(decoded.flags.writeable)
+
+    def test_datetime64(self):
+        for value in (
+            np.arange(5).astype("datetime64[ms]"),
+            np.array([1, -2, 3], dtype="timedelta64[s]").reshape(3, 1),
+            np.array(["2024-01-01", "NaT"], dtype="datetime64[D]"),
+        ):
+            decoded = self.codec.decode(self.codec.encode({"result": value}))["result"]
+            self.assertEqual(decoded.dtype, value.dtype)
+            self.assertEqual(decoded.shape, value.shape)
+            np.testing.assert_array_equal(decoded, value)
+        for value in (np.datetime64("2024-01-01T12:00", "ms"), np.timedelta64(5, "s")):
+            decoded = self.codec.decode(self.codec.encode(value))
+            self.assertEqual(decoded, value)
+            self.assertEqual(decoded.dtype, value.dtype)
+
+    def test_writable_ndarray(self):
+        array = np.arange(10, dtype=np.int16)
+        codec = MsgpackCodec(writable_arrays=True)
+        decoded = codec.decode(codec.encode(array))
+        np.testing.assert_array_equal(decoded, array)
+        self.assertTrue(decoded.flags.writeable)
+
+    def test_exception(self):
+        response = {"status": "failure", "result": ValueError("wrong value", 1)}
+        decoded = self.codec.decode(self.codec.encode(response))
+        self.assertIsInstance(decoded["result"], ValueError)
+        self.assertEqual(decoded["result"].args, ("wrong value", 1))
+
+        # the exceptions are not sent as dill data
+        strict_codec = MsgpackCodec(allow_dill_fallback=False)
+        decoded = strict_codec.decode(strict_codec.encode(response))
+        self.assertIsInstance(decoded["result"], ValueError)
+
+        # the classes that are not imported are not imported while decoding
+        error_class = type("RemoteError", (Exception,), {"__module__": "not_imported"})
+        decoded = self.codec.decode(self.codec.encode(error_class("failed")))
+        self.assertIsInstance(decoded, RuntimeError)
+        self.assertIn("not_imported.RemoteError: failed", str(decoded))
+
+    def test_dill(self):
+        response = {"status": "success", "result": _Custom(1)}
+        data = self.codec.encode(response)
+        self.assertEqual(self.codec.decode(data)["result"].value, 1)
+
+        # if dill is disabled, the receiver refuses it and the sender does not send it
+        strict_codec = MsgpackCodec(allow_dill_decode=False)
+        with self.assertRaises(ValueError):
+            strict_codec.decode(data)
+        with self.assertRaisesRegex(TypeError, "allow_dill_decode"):
+            strict_codec.encode(response)
+        with self.assertRaises(TypeError):
+            MsgpackCodec(allow_dill_fallback=False).encode(response)
+
+    def test_get_codec(self):
+        self.assertEqual(get_codec(None).content_type, CONTENT_TYPE_DILL)
+        self.assertEqual(get_codec(CONTENT_TYPE_DILL).content_type, CONTENT_TYPE_DILL)
+        dill_codec = get_codec(CONTENT_TYPE_DILL)
+        self.assertEqual(dill_codec.decode(dill_codec.encode((1, "a"))), (1, "a"))
+        with self.assertRaises(ValueError):
+            get_codec("application/unknown")
+
+
+class _Custom:
+    def __init__(self, value):
+        self.value = value
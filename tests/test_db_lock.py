@@ -0,0 +1,82 @@
+import time
+from threading import Thread
+from unittest import TestCase
+
+from alab_management.utils.data_objects import get_collection, get_lock
+from alab_management.utils.db_lock import (
+    MongoLock,
+    MongoLockAcquireError,
+    MongoLockReleaseError,
+)
+
+
+class TestMongoLock(TestCase):
+    def setUp(self) -> None:
+        self.collection = get_collection("_test_lock")
+        self.collection.drop()
+
+    def tearDown(self) -> None:
+        self.collection.drop()
+
+    def test_get_lock(self):
+        self.assertIs(get_lock("a"), get_lock("a"))
+        self.assertIsNot(get_lock("a"), get_lock("b"))
+        self.assertEqual("b", get_lock("b").name)
+
+    def test_acquire_release(self):
+        lock = MongoLock("test", self.collection)
+        with lock() as token:
+            self.assertEqual(token, lock.token)
+            other = MongoLock("test", self.collection)
+            with self.assertRaises(MongoLockAcquireError):
+                other.acquire(timeout=0.1)
+        self.assertIsNone(lock.token)
+
+        # the fencing token increases with every acquisition
+        with lock() as token_2:
+            self.assertGreater(token_2, token)
+
+        with self.assertRaises(MongoLockReleaseError):
+            lock.release()
+
+    def test_lease_expiry(self):
+        lock = MongoLock("test", self.collection, lease_seconds=0.2)
+        token = lock.acquire()
+        self.assertTrue(lock.renew())
+
+        # a crashed holder does not block others after its lease expires
+        time.sleep(0.3)
+        other = MongoLock("test", self.collection)
+        self.assertGreater(other.acquire(timeout=1), token)
+        self.assertFalse(lock.renew())
+        with self.assertRaises(MongoLockReleaseError):
+            lock.release()
+        other.release()
+
+    def test_renew_in_context(self):
+        lock = MongoLock("test", self.collection, lease_seconds=0.2)
+        with lock():
+            # the lease is renewed while the context runs
+            time.sleep(0.5)
+            with self.assertRaises(MongoLockAcquireError):
+                MongoLock("test", self.collection).acquire(timeout=0)
+        other = MongoLock("test", self.collection)
+        other.acquire(timeout=0)
+        other.release()
+
+    def test_threads(self):
+        lock = MongoLock("test", self.collection)
+        counter = []
+
+        def work():
+            with lock():
+                value = len(counter)
+                time.sleep(0.01)
+                counter.append(value)
+
+        threads = [Thread(target=work) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(list(range(5)), counter)
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+from alab_management.utils.data_objects import get_collection
+from alab_management.utils.db_profiler import DBProfiler, get_profile
+
+
+class TestDBProfiler(TestCase):
+    def setUp(self) -> None:
+        self.collection = get_collection("_db_profile")
+        self.collection.drop()
+        self.profiler = DBProfiler(bucket_seconds=60)
+        self.request_id = 0
+
+    def tearDown(self) -> None:
+        self.collection.drop()
+
+    def run_command(self, command: dict, duration_ms: float, failed: bool = False):
+        # the events that pymongo sends to the listeners
+        self.request_id += 1
+        self.profiler.started(
+            SimpleNamespace(
+                command_name=next(iter(command)),
+                command=command,
+                request_id=self.request_id,
+                connection_id=("localhost", 27017),
+            )
+        )
+        finished = SimpleNamespace(
+            request_id=self.request_id,
+            connection_id=("localhost", 27017),
+            duration_micros=int(duration_ms * 1000),
+            reply={"ok": 1, "n": 1},
+        )
+        if failed:
+            self.profiler.failed(finished)
+        else:
+            self.profiler.succeeded(finished)
+
+    def test_record(self):
+        for _ in range(3):
+            self.run_command({"find": "tasks", "filter": {"status": "READY"}}, 2)
+        self.run_command({"insert": "samples", "documents": [{"name": "a"}]}, 0.05)
+        self.run_command({"find": "experiments", "filter": {}}, 3000, failed=True)
+
+        profile = self.profiler.get_profile()
+        self.assertEqual(3, len(profile))
+        # the slowest in total come first
+        self.assertEqual(["find", "find", "insert"], [e["command"] for e in profile])
+        failed, find, insert = profile
+        self.assertEqual(1, failed["failures"])
+        self.assertEqual(1, failed["histogram"][-1])
+        self.assertEqual(0, find["failures"])
+        self.assertEqual(3, find["count"])
+        self.assertAlmostEqual(6, find["total_ms"])
+        self.assertAlmostEqual(2, find["mean_ms"])
+        self.assertEqual(3, find["histogram"][4])
+        self.assertEqual("tasks", find["collection"])
+        self.assertTrue(find["call_site"].startswith(f"{__name__}:run_command:"))
+        self.assertGreater(find["request_bytes"], 0)
+        self.assertGreater(find["reply_bytes"], 0)
+        self.assertEqual("samples", insert["collection"])
+        self.assertEqual(1, insert["histogram"][0])
+
+    def test_flush(self):
+        self.run_command({"find": "tasks", "filter": {}}, 1)
+        # no collection to write to
+        self.profiler.flush(all_buckets=True)
+        self.assertEqual(1, len(self.profiler.get_profile()))
+
+        self.profiler._collection = self.collection
+        self.profiler.flush(all_buckets=True)
+        self.assertEqual([], self.profiler.get_profile())
+        self.run_command({"find": "tasks", "filter": {}}, 1)
+        self.profiler.flush(all_buckets=True)
+
+        self.assertEqual(2, self.collection.count_documents({}))
+        profile = get_profile(seconds=3600)
+        self.assertEqual(1, len(profile))
+        self.assertEqual(2, profile[0]["count"])
+        self.assertEqual([], get_profile(seconds=0))
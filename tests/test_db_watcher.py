@@ -0,0 +1,43 @@
+import time
+from threading import Timer
+from unittest import TestCase
+
+from alab_management.utils.data_objects import get_collection
+from alab_management.utils.db_watcher import CollectionWatcher
+
+
+class TestCollectionWatcher(TestCase):
+    def setUp(self) -> None:
+        self.collection = get_collection("_test_watcher")
+        self.collection.drop()
+        self.watcher = CollectionWatcher(self.collection)
+
+    def tearDown(self) -> None:
+        self.watcher.stop()
+        self.collection.drop()
+
+    def test_wait_timeout(self):
+        generation = self.watcher.generation
+        start = time.time()
+        self.assertEqual(generation, self.watcher.wait(since=generation, timeout=0.2))
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_wake(self):
+        generation = self.watcher.generation
+        Timer(0.1, self.watcher.wake).start()
+        self.assertNotEqual(generation, self.watcher.wait(since=generation, timeout=5))
+
+        # the change before calling wait should not be lost
+        generation = self.watcher.generation
+        self.watcher.wake()
+        start = time.time()
+        self.watcher.wait(since=generation, timeout=5)
+        self.assertLess(time.time() - start, 1)
+
+    def test_change_stream(self):
+        if not self.watcher.start():
+            self.skipTest("Change streams are not supported by this MongoDB server.")
+        self.assertTrue(self.watcher.available)
+        generation = self.watcher.generation
+        self.collection.insert_one({"name": "test"})
+        self.assertNotEqual(generation, self.watcher.wait(since=generation, timeout=5))
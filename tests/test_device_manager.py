@@ -5,7 +5,13 @@ from unittest import TestCase
 
 from bson import ObjectId
 
-from alab_management.device_manager import DeviceManager, DevicesClient
+from alab_management.device_manager import (
+    DeviceManager,
+    DeviceOccupancyCache,
+    DevicesClient,
+    _SharedRPCConnection,
+)
+from alab_management.device_view import DeviceView
 from alab_management.scripts.cleanup_lab import cleanup_lab
 from alab_management.scripts.setup_lab import setup_lab
 
@@ -67,3 +73,56 @@ class TestDeviceManager(TestCase):
         # try to call a property
         with self.assertRaises(TypeError):
             f()
+
+    def test_shared_connection(self):
+        # the clients in the same process share one connection and one reply queue
+        other_client = DevicesClient(task_id=ObjectId(), timeout=5)
+        connection = _SharedRPCConnection.get()
+        self.assertIs(connection, _SharedRPCConnection.get())
+
+        self.assertEqual(300, other_client["furnace_1"].get_temperature())
+        self.assertEqual(300, self.devices_client["furnace_1"].get_temperature())
+        self.assertIs(connection, _SharedRPCConnection.get())
+
+
+class TestDeviceOccupancyCache(TestCase):
+    def setUp(self):
+        cleanup_lab(
+            all_collections=True,
+            _force_i_know_its_dangerous=True,
+            sim_mode=True,
+            database_name="Alab_sim",
+            user_confirmation="y",
+        )
+        setup_lab()
+        self.device_view = DeviceView()
+        self.cache = DeviceOccupancyCache()
+        if not self.cache.start():
+            self.skipTest("Change streams are not supported by this MongoDB server.")
+
+    def tearDown(self):
+        self.cache.stop()
+        cleanup_lab(
+            all_collections=True,
+            _force_i_know_its_dangerous=True,
+            sim_mode=True,
+            database_name="Alab_sim",
+            user_confirmation="y",
+        )
+
+    def test_is_occupied_by(self):
+        task_id = ObjectId()
+        self.assertFalse(self.cache.is_occupied_by("furnace_1", task_id))
+
+        self.device_view.occupy_device("furnace_1", task_id=task_id)
+        start = time.time()
+        while not self.cache.is_occupied_by("furnace_1", task_id):
+            self.assertLess(time.time() - start, 5)
+            time.sleep(0.05)
+        self.assertFalse(self.cache.is_occupied_by("furnace_1", ObjectId()))
+
+        self.device_view.release_device("furnace_1")
+        start = time.time()
+        while self.cache.is_occupied_by("furnace_1", task_id):
+            self.assertLess(time.time() - start, 5)
+            time.sleep(0.05)
@@ -0,0 +1,241 @@
+import time
+from datetime import datetime, timedelta
+from unittest import TestCase, mock
+
+import numpy as np
+
+from alab_management.device_signals import (
+    LATEST_COLLECTION,
+    ROLLUP_COLLECTION,
+    SIGNAL_COLLECTION,
+    DeviceSignalStore,
+)
+from alab_management.logger import DBLogger, LogBuffer
+from alab_management.utils.data_objects import get_collection
+
+
+class TestDeviceSignalStore(TestCase):
+    def setUp(self) -> None:
+        for name in (SIGNAL_COLLECTION, ROLLUP_COLLECTION, LATEST_COLLECTION):
+            get_collection(name).drop()
+        self.store = DeviceSignalStore()
+
+    def tearDown(self) -> None:
+        for name in (SIGNAL_COLLECTION, ROLLUP_COLLECTION, LATEST_COLLECTION):
+            get_collection(name).drop()
+
+    def test_log(self):
+        now = datetime.now().replace(second=30, microsecond=0)
+        for i in range(5):
+            self.store.log(
+                "furnace_1", "Temperature", 100.0 + i, now - timedelta(seconds=4 - i)
+            )
+        self.store.log("furnace_1", "Status", "heating", now)
+        self.store.log("furnace_2", "Temperature", 20, now)
+
+        latest = self.store.get_latest("furnace_1", "Temperature")
+        self.assertEqual(104.0, latest["value"])
+        self.assertEqual(now, latest["timestamp"])
+        self.assertIsNone(self.store.get_latest("furnace_1", "Pressure")["value"])
+
+        signal = self.store.get_signal("furnace_1", "Temperature", timedelta(hours=1))
+        self.assertEqual([100.0, 101.0, 102.0, 103.0, 104.0], signal["value"])
+        self.assertEqual(sorted(signal["timestamp"]), signal["timestamp"])
+        self.assertEqual(
+            ["heating"],
+            self.store.get_signal("furnace_1", "Status", timedelta(hours=1))["value"],
+        )
+
+    def test_rollups(self):
+        window = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=2)
+        for minute, values in enumerate([[1, 2, 3], [10, 20]]):
+            for i, value in enumerate(values):
+                self.store.log(
+                    "furnace_1",
+                    "Temperature",
+                    value,
+                    window + timedelta(minutes=minute, seconds=i),
+                )
+        # the first window is written when a reading of the next window arrives
+        self.assertEqual(1, get_collection(ROLLUP_COLLECTION).count_documents({}))
+
+        # another process logs the same signal in the same window
+        other_store = DeviceSignalStore()
+        other_store.log("furnace_1", "Temperature", 30, window + timedelta(minutes=1))
+        other_store.flush()
+        # the readings that are not numbers are not rolled up
+        self.store.log("furnace_1", "Temperature", "error", window)
+
+        rollups = self.store.get_rollups("furnace_1", "Temperature", timedelta(hours=1))
+        self.assertEqual([window, window + timedelta(minutes=1)], rollups["timestamp"])
+        self.assertEqual([1, 10], rollups["min"])
+        self.assertEqual([3, 30], rollups["max"])
+        self.assertEqual([2, 20], rollups["mean"])
+        self.assertEqual([3, 3], rollups["count"])
+
+    def test_latest(self):
+        now = datetime.now().replace(microsecond=0)
+        self.store.log("furnace_1", "Temperature", 300, now)
+        # a reading that arrives late does not replace the last one
+        self.store.log("furnace_1", "Temperature", 200, now - timedelta(seconds=1))
+        latest_collection = get_collection(LATEST_COLLECTION)
+        self.assertEqual(1, latest_collection.count_documents({}))
+        self.assertEqual(300, latest_collection.find_one()["value"])
+        self.assertEqual(
+            300, self.store.get_latest("furnace_1", "Temperature")["value"]
+        )
+
+        # the readings are not queried for the latest values
+        get_collection(SIGNAL_COLLECTION).drop()
+        other_store = DeviceSignalStore()
+        other_store.latest_cache_seconds = 0.2
+        self.assertEqual(
+            300, other_store.get_latest("furnace_1", "Temperature")["value"]
+        )
+
+        # the latest values logged by other processes are read after the cache expires
+        self.store.log("furnace_1", "Temperature", 400, now + timedelta(seconds=1))
+        self.assertEqual(
+            300, other_store.get_latest("furnace_1", "Temperature")["value"]
+        )
+        time.sleep(0.2)
+        self.assertEqual(
+            400, other_store.get_latest("furnace_1", "Temperature")["value"]
+        )
+
+    def test_latest_buffered(self):
+        self.store._buffer = LogBuffer(
+            get_collection(SIGNAL_COLLECTION), flush_interval=60
+        )
+        self.store._buffer.flush_callbacks.append(self.store._write_pending_latest)
+        self.store.log("furnace_1", "Temperature", 300)
+        self.assertEqual(0, get_collection(LATEST_COLLECTION).count_documents({}))
+        self.assertEqual(
+            300, self.store.get_latest("furnace_1", "Temperature")["value"]
+        )
+
+        self.store.flush()
+        self.assertEqual(1, get_collection(SIGNAL_COLLECTION).count_documents({}))
+        self.assertEqual(300, get_collection(LATEST_COLLECTION).find_one()["value"])
+
+    def test_signal_array(self):
+        start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=5)
+        for i in range(250):
+            value = "error" if i == 7 else float(i)
+            self.store.log(
+                "furnace_1", "Temperature", value, start + timedelta(seconds=i)
+            )
+        end = start + timedelta(seconds=300)
+
+        signal = self.store.get_signal_array(
+            "furnace_1", "Temperature", start=start, end=end
+        )
+        self.assertEqual(np.dtype("datetime64[ms]"), signal["timestamp"].dtype)
+        self.assertEqual(250, len(signal["value"]))
+        self.assertEqual(np.datetime64(start, "ms"), signal["timestamp"][0])
+        self.assertEqual(
+            np.timedelta64(249, "s"), signal["timestamp"][-1] - signal["timestamp"][0]
+        )
+        self.assertTrue(np.isnan(signal["value"][7]))
+        self.assertEqual(249.0, signal["value"][-1])
+        # the same readings as get_signal, in several chunks
+        with mock.patch("alab_management.device_signals._ARRAY_CHUNK_SIZE", 16):
+            chunked = self.store.get_signal_array(
+                "furnace_1", "Temperature", start=start, end=end
+            )
+        reference = self.store.get_signal(
+            "furnace_1", "Temperature", within=datetime.now() - start
+        )
+        np.testing.assert_array_equal(signal["value"], chunked["value"])
+        np.testing.assert_array_equal(
+            np.array(reference["timestamp"], dtype="datetime64[ms]"),
+            chunked["timestamp"],
+        )
+        empty = self.store.get_signal_array(
+            "furnace_1", "Pressure", within=timedelta(hours=1)
+        )
+        self.assertEqual(0, len(empty["timestamp"]))
+
+        # buckets of 30 s, from the raw readings
+        downsampled = self.store.get_signal_array(
+            "furnace_1", "Temperature", start=start, end=end, max_points=10
+        )
+        self.assertEqual(9, len(downsampled["value"]))
+        self.assertEqual(
+            np.timedelta64(30, "s"),
+            downsampled["timestamp"][1] - downsampled["timestamp"][0],
+        )
+        self.assertEqual(29, downsampled["count"][0])
+        self.assertAlmostEqual((sum(range(30)) - 7) / 29, downsampled["value"][0])
+        self.assertEqual(30, downsampled["min"][1])
+        self.assertEqual(59, downsampled["max"][1])
+
+        # buckets of 150 s, from the rollups (the minutes starting in each bucket)
+        downsampled = self.store.get_signal_array(
+            "furnace_1", "Temperature", start=start, end=end, max_points=2
+        )
+        self.assertEqual([179, 70], downsampled["count"].tolist())
+        self.assertEqual([179, 249], downsampled["max"].tolist())
+        with self.assertRaises(ValueError):
+            self.store.get_signal_array("furnace_1", "Temperature")
+
+    def test_db_logger(self):
+        logger = DBLogger(task_id=None)
+        logger.log_device_signal("furnace_1", "Temperature", 500)
+        self.assertEqual(
+            500, logger.get_latest_device_signal("furnace_1", "Temperature")["value"]
+        )
+        self.assertEqual(
+            [500],
+            logger.filter_device_signal(
+                "furnace_1", "Temperature", timedelta(minutes=1)
+            )["value"],
+        )
+        self.assertEqual(
+            0, get_collection("logs").count_documents({"type": "DEVICE_SIGNAL"})
+        )
+
+    def test_db_logger_legacy_signals(self):
+        # the signals logged in the logs collection before the device signal store
+        logs = get_collection("logs")
+        now = datetime.now().replace(microsecond=0)
+        logs.insert_many(
+            {
+                "task_id": None,
+                "type": "DEVICE_SIGNAL",
+                "level": 10,
+                "log_data": {
+                    "device_name": "furnace_2",
+                    "signal_name": "Temperature",
+                    "signal_value": value,
+                },
+                "created_at": now - timedelta(seconds=10 - i),
+            }
+            for i, value in enumerate([100, 200])
+        )
+        try:
+            logger = DBLogger(task_id=None)
+            latest = logger.get_latest_device_signal("furnace_2", "Temperature")
+            self.assertEqual(200, latest["value"])
+            self.assertEqual(now - timedelta(seconds=9), latest["timestamp"])
+            self.assertEqual(
+                [100, 200],
+                logger.filter_device_signal(
+                    "furnace_2", "Temperature", timedelta(minutes=1)
+                )["value"],
+            )
+
+            # the readings in the store take precedence
+            logger.log_device_signal("furnace_2", "Temperature", 300)
+            self.assertEqual(
+                300,
+                logger.get_latest_device_signal("furnace_2", "Temperature")["value"],
+            )
+            self.assertEqual(
+                [300],
+                logger.filter_device_signal(
+                    "furnace_2", "Temperature", timedelta(minutes=1)
+                )["value"],
+            )
+        finally:
+            logs.delete_many({"type": "DEVICE_SIGNAL"})
@@ -88,6 +88,39 @@ class TestDeviceView(TestCase):
         self.assertEqual("IDLE", self.device_view.get_status(device_name).name)
         self.assertEqual(None, self.device_view.get_device(device_name)["task_id"])
 
+    def test_occupy_devices(self):
+        device_names = self.device_names[:3]
+        task_id = ObjectId()
+        self.device_view.occupy_devices(devices=device_names, task_id=task_id)
+        self.assertEqual(
+            [self.device_list[device_name] for device_name in device_names],
+            self.device_view.get_devices_by_task(task_id=task_id),
+        )
+
+        # a device held by another task cannot be occupied
+        with self.assertRaises(ValueError):
+            self.device_view.occupy_devices(
+                devices=[self.device_names[3], device_names[0]], task_id=ObjectId()
+            )
+        with self.assertRaises(ValueError):
+            self.device_view.occupy_devices(devices=["not_exist"], task_id=task_id)
+
+        # the pause requested while the device is occupied takes effect after release
+        self.device_view.pause_device(device_names[0])
+        self.device_view.release_devices(device_names=device_names)
+        self.assertEqual([], self.device_view.get_devices_by_task(task_id=task_id))
+        self.assertEqual(
+            "PAUSED", self.device_view.get_device(device_names[0])["pause_status"]
+        )
+        self.assertEqual(
+            "RELEASED", self.device_view.get_device(device_names[1])["pause_status"]
+        )
+
+        # a paused device cannot be occupied even if it is idle
+        with self.assertRaisesRegex(ValueError, "not released"):
+            self.device_view.occupy_devices(devices=[device_names[0]], task_id=task_id)
+        self.assertEqual("IDLE", self.device_view.get_status(device_names[0]).name)
+
     def test_release_device(self):
         device_name = self.device_names[0]
 
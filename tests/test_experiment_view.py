@@ -9,6 +9,7 @@ from alab_management.experiment_view import (
 )
 from alab_management.scripts.cleanup_lab import cleanup_lab
 from alab_management.scripts.setup_lab import setup_lab
+from alab_management.task_view import TaskStatus
 
 
 class TestExperimentView(TestCase):
@@ -230,3 +231,67 @@ class TestExperimentView(TestCase):
         # try non exist exp id
         with self.assertRaises(ValueError):
             self.experiment_view.update_sample_task_id(ObjectId(), sample_ids, task_ids)
+
+    def test_get_finished_experiments(self):
+        exp_template = InputExperiment(
+            **{
+                "name": "test",
+                "tags": [],
+                "metadata": {},
+                "samples": [{"name": "test_sample", "tags": [], "metadata": {}}],
+                "tasks": [
+                    {
+                        "type": "Heating",
+                        "prev_tasks": [],
+                        "parameters": {},
+                        "samples": ["test_sample"],
+                    },
+                    {
+                        "type": "Heating",
+                        "prev_tasks": [0],
+                        "parameters": {},
+                        "samples": ["test_sample"],
+                    },
+                ],
+            }
+        )
+        task_view = self.experiment_view.task_view
+        exp_ids = []
+        task_ids = []
+        for _ in range(2):
+            exp_id = self.experiment_view.create_experiment(exp_template)
+            exp_task_ids = [
+                task_view.create_task(task_type="Heating", samples=[], parameters={})
+                for _ in range(2)
+            ]
+            self.experiment_view.update_sample_task_id(
+                exp_id, [ObjectId()], exp_task_ids
+            )
+            self.experiment_view.update_experiment_status(
+                exp_id, ExperimentStatus.RUNNING
+            )
+            exp_ids.append(exp_id)
+            task_ids.append(exp_task_ids)
+
+        self.assertListEqual([], self.experiment_view.get_finished_experiments())
+
+        task_view.update_status(task_ids[0][0], TaskStatus.COMPLETED)
+        task_view.update_status(task_ids[0][1], TaskStatus.CANCELLED)
+        task_view.update_status(task_ids[1][0], TaskStatus.ERROR)
+        self.assertListEqual(
+            [exp_ids[0]],
+            [exp["_id"] for exp in self.experiment_view.get_finished_experiments()],
+        )
+        # the $lookup for MongoDB < 5.0 gives the same result
+        self.experiment_view._concise_lookup = False
+        self.assertListEqual(
+            [exp_ids[0]],
+            [exp["_id"] for exp in self.experiment_view.get_finished_experiments()],
+        )
+        self.experiment_view._concise_lookup = None
+
+        # only the running experiments are returned
+        self.experiment_view.update_experiment_status(
+            exp_ids[0], ExperimentStatus.COMPLETED
+        )
+        self.assertListEqual([], self.experiment_view.get_finished_experiments())
@@ -39,3 +39,16 @@ class TestGraph(TestCase):
         graph = Graph(vertices, edges)
         self.assertListEqual([4], graph.get_children(3))
         self.assertListEqual([1, 2], graph.get_children(0))
+
+    def test_long_chain(self):
+        # longer than the recursion limit
+        n = 5000
+        vertices = list(range(n))
+        edges = {i: [i + 1] for i in range(n - 1)}
+        edges[n - 1] = []
+        graph = Graph(vertices, edges)
+        self.assertFalse(graph.has_cycle())
+        self.assertListEqual([n - 2], graph.get_parents(n - 1))
+
+        edges[n - 1] = [0]
+        self.assertTrue(Graph(vertices, edges).has_cycle())
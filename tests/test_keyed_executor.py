@@ -0,0 +1,67 @@
+import threading
+import time
+from unittest import TestCase
+
+from alab_management.utils.keyed_executor import KeyedExecutor
+
+
+class TestKeyedExecutor(TestCase):
+    def setUp(self) -> None:
+        self.executor = KeyedExecutor(max_workers=4)
+
+    def tearDown(self) -> None:
+        self.executor.shutdown()
+
+    def test_serial_per_key(self):
+        running = {"a": 0, "b": 0}
+        max_running = {"a": 0, "b": 0}
+        order = []
+        lock = threading.Lock()
+
+        def job(key, i):
+            with lock:
+                running[key] += 1
+                max_running[key] = max(max_running[key], running[key])
+            time.sleep(0.02)
+            with lock:
+                running[key] -= 1
+                order.append((key, i))
+            return i
+
+        futures = [
+            self.executor.submit(key, job, key, i) for i in range(5) for key in "ab"
+        ]
+        self.assertEqual(
+            [i for i in range(5) for _ in "ab"], [f.result() for f in futures]
+        )
+        self.assertEqual({"a": 1, "b": 1}, max_running)
+        self.assertEqual(
+            list(range(5)), [i for key, i in order if key == "a"]
+        )  # in submission order
+        self.assertEqual({}, self.executor.queue_depths())
+
+    def test_parallel_keys(self):
+        barrier = threading.Barrier(3, timeout=5)
+        futures = [self.executor.submit(key, barrier.wait) for key in "abc"]
+        for future in futures:
+            future.result(timeout=5)
+
+    def test_exception(self):
+        def fail():
+            raise ValueError("test")
+
+        future = self.executor.submit("a", fail)
+        with self.assertRaises(ValueError):
+            future.result()
+        # the queue of the key is not blocked by the failed job
+        self.assertEqual(1, self.executor.submit("a", lambda: 1).result())
+
+    def test_queue_depths(self):
+        event = threading.Event()
+        self.executor.submit("a", event.wait)
+        self.executor.submit("a", event.wait)
+        time.sleep(0.05)
+        self.assertEqual(
+            {"a": {"waiting": 1, "running": 1}}, self.executor.queue_depths()
+        )
+        event.set()
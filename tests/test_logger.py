@@ -0,0 +1,159 @@
+import time
+from unittest import TestCase
+
+import bson
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from alab_management.logger import LogBuffer, LoggingLevel
+from alab_management.utils.data_objects import get_collection
+
+
+class _FailingCollection:
+    name = "_test_logs"
+
+    def insert_many(self, documents, ordered=True):
+        raise AutoReconnect("database is down")
+
+
+class _EncodingCollection:
+    """A collection that encodes the documents before writing them, like pymongo."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.name = collection.name
+
+    def insert_many(self, documents, ordered=True):
+        for document in documents:
+            bson.encode(document)
+        return self._collection.insert_many(documents, ordered=ordered)
+
+
+class _RejectingCollection:
+    """A collection that writes the documents except the ones with ``rejected``, like a validation error."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.name = collection.name
+
+    def insert_many(self, documents, ordered=True):
+        write_errors = []
+        for i, document in enumerate(documents):
+            if document.get("rejected"):
+                write_errors.append({"index": i, "code": 121, "errmsg": "invalid"})
+            elif self._collection.find_one({"_id": document.get("_id")}) is not None:
+                write_errors.append({"index": i, "code": 11000, "errmsg": "dup"})
+            else:
+                self._collection.insert_one(document)
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors})
+
+
+class TestLogBuffer(TestCase):
+    def setUp(self) -> None:
+        self.collection = get_collection("_test_logs")
+        self.collection.drop()
+        get_collection("logs").drop()
+
+    def tearDown(self) -> None:
+        self.collection.drop()
+        get_collection("logs").drop()
+
+    @staticmethod
+    def make_entry(i: int):
+        return {"task_id": None, "type": "OTHER", "level": 20, "log_data": {"i": i}}
+
+    def test_flush(self):
+        log_buffer = LogBuffer(self.collection, max_batch_size=3, flush_interval=60)
+        for i in range(2):
+            self.assertTrue(log_buffer.put(self.make_entry(i)))
+        self.assertEqual(2, len(log_buffer))
+        self.assertEqual(0, self.collection.count_documents({}))
+
+        log_buffer.flush()
+        self.assertEqual(0, len(log_buffer))
+        self.assertEqual(
+            [0, 1], [entry["log_data"]["i"] for entry in self.collection.find()]
+        )
+
+    def test_background_flush(self):
+        # the background thread writes the buffer when a batch is full
+        log_buffer = LogBuffer(self.collection, max_batch_size=5, flush_interval=60)
+        for i in range(5):
+            log_buffer.put(self.make_entry(i))
+        for _ in range(50):
+            if self.collection.count_documents({}) == 5:
+                break
+            time.sleep(0.1)
+        self.assertEqual(5, self.collection.count_documents({}))
+
+    def test_overflow(self):
+        log_buffer = LogBuffer(
+            _FailingCollection(), max_batch_size=10, flush_interval=60, max_size=4
+        )
+        results = [log_buffer.put(self.make_entry(i)) for i in range(6)]
+        self.assertEqual([True] * 4 + [False] * 2, results)
+        self.assertEqual(2, log_buffer.dropped)
+        # the entries stay in the buffer if they cannot be written
+        with self.assertRaises(AutoReconnect):
+            log_buffer.flush()
+        self.assertEqual(4, len(log_buffer))
+        self.assertEqual(2, log_buffer.dropped)
+
+        # the number of dropped entries is logged once the database is back
+        log_buffer._collection = self.collection
+        log_buffer.flush()
+        self.assertEqual(4, self.collection.count_documents({}))
+        notice = get_collection("logs").find_one({"log_data.type": "LogsDropped"})
+        self.assertEqual(LoggingLevel.WARNING.value, notice["level"])
+        self.assertEqual("_test_logs", notice["log_data"]["collection"])
+        self.assertEqual(0, log_buffer.dropped)
+
+    def test_block(self):
+        log_buffer = LogBuffer(
+            _FailingCollection(),
+            max_batch_size=10,
+            flush_interval=60,
+            max_size=1,
+            overflow="block",
+            block_timeout=0.2,
+        )
+        self.assertTrue(log_buffer.put(self.make_entry(0)))
+        start = time.perf_counter()
+        self.assertFalse(log_buffer.put(self.make_entry(1)))
+        self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+
+    def test_invalid_entry(self):
+        # an entry that cannot be encoded does not block the others
+        log_buffer = LogBuffer(
+            _EncodingCollection(self.collection), max_batch_size=20, flush_interval=60
+        )
+        bad_entry = self.make_entry(-1)
+        bad_entry["log_data"]["value"] = object()
+        log_buffer.put(bad_entry)
+        for i in range(10):
+            log_buffer.put(self.make_entry(i))
+        log_buffer.flush()
+
+        self.assertEqual(0, len(log_buffer))
+        self.assertEqual(10, self.collection.count_documents({}))
+        notice = get_collection("logs").find_one({"log_data.type": "LogsDropped"})
+        self.assertIn("1 entries", notice["log_data"]["message"])
+
+    def test_partial_write(self):
+        log_buffer = LogBuffer(
+            _RejectingCollection(self.collection), max_batch_size=20, flush_interval=60
+        )
+        entries = [self.make_entry(i) for i in range(5)]
+        entries[2]["rejected"] = True
+        for entry in entries:
+            log_buffer.put(entry)
+        log_buffer.flush()
+        self.assertEqual(4, self.collection.count_documents({}))
+        self.assertEqual(1, get_collection("logs").count_documents({}))
+
+        # the entries that are written already (e.g. before a connection error) are skipped
+        log_buffer.put(entries[0])
+        log_buffer.put(self.make_entry(5))
+        log_buffer.flush()
+        self.assertEqual(5, self.collection.count_documents({}))
+        self.assertEqual(1, get_collection("logs").count_documents({}))
@@ -0,0 +1,159 @@
+from unittest import TestCase
+
+from bson import ObjectId
+
+from alab_management.device_view import DeviceView
+from alab_management.resource_manager.resource_index import DeviceHold, ResourceIndex
+from alab_management.sample_view import SampleView
+from alab_management.sample_view.sample_view import SamplePositionRequest
+from alab_management.scripts.cleanup_lab import cleanup_lab
+from alab_management.scripts.setup_lab import setup_lab
+
+
+class TestResourceIndex(TestCase):
+    def setUp(self):
+        cleanup_lab(
+            all_collections=True,
+            _force_i_know_its_dangerous=True,
+            sim_mode=True,
+            database_name="Alab_sim",
+            user_confirmation="y",
+        )
+        setup_lab()
+        self.device_view = DeviceView()
+        self.sample_view = SampleView()
+        self.resource_index = ResourceIndex.from_database()
+
+    def tearDown(self):
+        cleanup_lab(
+            all_collections=True,
+            _force_i_know_its_dangerous=True,
+            sim_mode=True,
+            database_name="Alab_sim",
+            user_confirmation="y",
+        )
+
+    def test_request_devices(self):
+        device_types = list(
+            {
+                device.__class__.__name__
+                for device in self.device_view._device_list.values()
+            }
+        )
+        task_id = ObjectId()
+        self.assertEqual(
+            self.device_view.request_devices(task_id, device_types_str=device_types),
+            self.resource_index.request_devices(task_id, device_types_str=device_types),
+        )
+
+        # the device with the fewest samples is picked
+        self.sample_view.create_sample("test", position="furnace_1/inside/1")
+        self.resource_index.refresh()
+        devices = self.resource_index.request_devices(
+            task_id, device_types_str=["Furnace"]
+        )
+        self.assertEqual(
+            self.device_view.request_devices(task_id, device_types_str=["Furnace"]),
+            devices,
+        )
+        self.assertNotEqual(devices["Furnace"]["name"], "furnace_1")
+
+        with self.assertRaises(ValueError):
+            self.resource_index.request_devices(task_id, device_names_str=["unknown"])
+
+    def test_occupy_and_release(self):
+        task_id = ObjectId()
+        task_id_2 = ObjectId()
+        devices = self.resource_index.request_devices(
+            task_id, device_names_str=["furnace_1"]
+        )
+        sample_positions = self.resource_index.request_sample_positions(
+            task_id, [SamplePositionRequest(prefix="furnace_1/inside", number=2)]
+        )
+        self.assertEqual(
+            sample_positions,
+            self.sample_view.request_sample_positions(
+                task_id, [SamplePositionRequest(prefix="furnace_1/inside", number=2)]
+            ),
+        )
+        self.resource_index.occupy(task_id, devices, sample_positions)
+
+        # held by this task, no need to release with the new request
+        self.assertFalse(
+            self.resource_index.request_devices(
+                task_id, device_names_str=["furnace_1"]
+            )["furnace_1"]["need_release"]
+        )
+        self.assertIsNone(
+            self.resource_index.request_devices(
+                task_id_2, device_names_str=["furnace_1"]
+            )
+        )
+        self.assertIsNone(
+            self.resource_index.request_sample_positions(
+                task_id_2, [SamplePositionRequest(prefix="furnace_1/inside", number=7)]
+            )
+        )
+
+        self.resource_index.release(devices, sample_positions)
+        self.assertIsNotNone(
+            self.resource_index.request_devices(
+                task_id_2, device_names_str=["furnace_1"]
+            )
+        )
+        self.assertIsNotNone(
+            self.resource_index.request_sample_positions(
+                task_id_2, [SamplePositionRequest(prefix="furnace_1/inside", number=8)]
+            )
+        )
+
+    def test_device_holds(self):
+        task_id = ObjectId()
+        task_id_2 = ObjectId()
+        self.resource_index.set_device_holds(
+            {"furnace_1": DeviceHold(task_id=task_id, priority=20)}
+        )
+
+        # held for another task with the same or higher priority
+        self.assertIsNone(
+            self.resource_index.request_devices(
+                task_id_2, device_names_str=["furnace_1"], priority=20
+            )
+        )
+        self.assertIsNone(
+            self.resource_index.request_devices(
+                task_id_2, device_names_str=["furnace_1"]
+            )
+        )
+        # a request with higher priority can take it
+        self.assertIsNotNone(
+            self.resource_index.request_devices(
+                task_id_2, device_names_str=["furnace_1"], priority=30
+            )
+        )
+        # the held device is picked for the task holding it, the others avoid it
+        self.assertEqual(
+            self.resource_index.request_devices(
+                task_id, device_types_str=["Furnace"], priority=20
+            )["Furnace"]["name"],
+            "furnace_1",
+        )
+        self.assertNotEqual(
+            self.resource_index.request_devices(
+                task_id_2, device_types_str=["Furnace"], priority=20
+            )["Furnace"]["name"],
+            "furnace_1",
+        )
+        # the snapshot shares the holds
+        self.assertIsNone(
+            self.resource_index.snapshot().request_devices(
+                task_id_2, device_names_str=["furnace_1"], priority=20
+            )
+        )
+
+        self.resource_index.set_device_holds({})
+        self.assertIsNotNone(
+            self.resource_index.request_devices(
+                task_id_2, device_names_str=["furnace_1"], priority=20
+            )
+        )
@@ -99,6 +99,45 @@ class TestSampleView(TestCase):
         with self.assertRaises(ValueError):
             self.sample_view.create_sample("test_2", position="furnace_table")
 
+    def test_create_samples(self):
+        sample_id = ObjectId()
+        sample_ids = self.sample_view.create_samples(
+            [
+                {"name": "test", "position": "furnace_table"},
+                {"name": "test_2", "sample_id": sample_id, "tags": ["tag"]},
+            ]
+        )
+        self.assertEqual(sample_id, sample_ids[1])
+        sample = self.sample_view.get_sample(sample_id=sample_ids[0])
+        self.assertEqual("furnace_table", sample.position)
+        self.assertEqual("test", sample.name)
+        sample = self.sample_view.get_sample(sample_id=sample_id)
+        self.assertIsNone(sample.position)
+        self.assertListEqual(["tag"], sample.tags)
+
+        # try to create samples with non-exist positions
+        with self.assertRaises(ValueError):
+            self.sample_view.create_samples(
+                [{"name": "test_3", "position": "non-exist position"}]
+            )
+
+        # try to create samples with the same position
+        with self.assertRaises(ValueError):
+            self.sample_view.create_samples(
+                [{"name": "test_3", "position": "furnace_table"}]
+            )
+        with self.assertRaises(ValueError):
+            self.sample_view.create_samples(
+                [
+                    {"name": "test_3", "position": "furnace_1/inside/1"},
+                    {"name": "test_4", "position": "furnace_1/inside/1"},
+                ]
+            )
+
+        # try to create samples with invalid names
+        with self.assertRaises(ValueError):
+            self.sample_view.create_samples([{"name": "test.3"}])
+
     def test_get_sample(self):
         # try to get a non-exist sample
         with self.assertRaises(ValueError):
@@ -211,6 +250,57 @@ class TestSampleView(TestCase):
         with self.assertRaises(ValueError):
             self.sample_view.lock_sample_position(task_id_2, position="furnace_table")
 
+    def test_lock_sample_positions(self):
+        task_id = ObjectId()
+        positions = [f"furnace_1/inside/{i}" for i in range(1, 5)]
+        self.sample_view.lock_sample_positions(task_id=task_id, positions=positions)
+        self.assertListEqual(
+            positions, self.sample_view.get_sample_positions_by_task(task_id)
+        )
+        # locking again with the same task is fine
+        self.sample_view.lock_sample_positions(task_id=task_id, positions=positions)
+
+        with self.assertRaises(ValueError):
+            self.sample_view.lock_sample_positions(
+                task_id=ObjectId(), positions=positions[-1:]
+            )
+        self.sample_view.create_sample("test", position="furnace_1/inside/5")
+        with self.assertRaises(ValueError):
+            self.sample_view.lock_sample_positions(
+                task_id=task_id, positions=["furnace_1/inside/5"]
+            )
+        with self.assertRaises(ValueError):
+            self.sample_view.release_sample_positions(positions=["not_exist"])
+
+        self.sample_view.release_sample_positions(positions=positions)
+        self.assertListEqual([], self.sample_view.get_sample_positions_by_task(task_id))
+
+    def test_get_sample_positions_with_prefix(self):
+        # the positions are returned in the order they are defined, not sorted by name
+        self.assertEqual(
+            self.sample_view.get_sample_positions_with_prefix("furnace_temp")[:11],
+            [f"furnace_temp/{i}" for i in range(1, 12)],
+        )
+        self.assertEqual(
+            len(self.sample_view.get_sample_positions_with_prefix("furnace_1/")), 8
+        )
+        self.assertEqual(self.sample_view.get_sample_positions_with_prefix("$"), [])
+        self.assertEqual(
+            self.sample_view.get_sample_position_parent_device("furnace_1/inside"),
+            "furnace_1",
+        )
+        self.assertIsNone(
+            self.sample_view.get_sample_position_parent_device("furnace_table")
+        )
+
+        # the positions added after the index is built can also be found
+        self.sample_view._sample_positions_collection.insert_one(
+            {"name": "new_position", "task_id": None}
+        )
+        self.assertEqual(
+            self.sample_view.get_sample_positions_with_prefix("new_"), ["new_position"]
+        )
+
     def test_request_sample_position_single(self):
         task_id = ObjectId()
 
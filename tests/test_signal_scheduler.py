@@ -0,0 +1,82 @@
+import threading
+import time
+from unittest import TestCase
+
+from alab_management.device_view.signal_scheduler import SignalScheduler
+
+
+class TestSignalScheduler(TestCase):
+    def setUp(self):
+        self.scheduler = SignalScheduler(
+            max_workers=4, phase_spread=0, report_interval=None
+        )
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def test_schedule(self):
+        calls = {"a": 0, "b": 0}
+
+        def read(name):
+            calls[name] += 1
+
+        self.scheduler.add("device_1", "a", 0.05, lambda: read("a"))
+        self.scheduler.add("device_2", "b", 0.1, lambda: read("b"))
+        time.sleep(0.53)
+        self.assertIn(calls["a"], range(9, 12))
+        self.assertIn(calls["b"], range(4, 6))
+
+        stats = self.scheduler.get_stats()
+        self.assertEqual({("device_1", "a"), ("device_2", "b")}, set(stats))
+        self.assertEqual(calls["a"], stats[("device_1", "a")].runs)
+        self.assertEqual(0, stats[("device_1", "a")].missed)
+        self.assertLess(stats[("device_1", "a")].mean_lateness, 0.05)
+
+    def test_missed(self):
+        # every reading takes longer than the interval
+        self.scheduler.add("device_1", "slow", 0.05, lambda: time.sleep(0.12))
+        time.sleep(0.55)
+        stats = self.scheduler.get_stats("device_1")[("device_1", "slow")]
+        self.assertIn(stats.runs, range(3, 6))
+        self.assertGreater(stats.missed, 3)
+
+    def test_remove(self):
+        started = threading.Event()
+        finished = []
+
+        def read():
+            started.set()
+            time.sleep(0.1)
+            finished.append(time.monotonic())
+
+        self.scheduler.add("device_1", "a", 0.05, read)
+        started.wait(timeout=1)
+        self.scheduler.remove("device_1")
+        # the running reading is finished before remove returns
+        self.assertEqual(1, len(finished))
+        self.assertEqual({}, self.scheduler.get_stats())
+        time.sleep(0.2)
+        self.assertEqual(1, len(finished))
+
+    def test_inline(self):
+        scheduler = SignalScheduler(max_workers=0, phase_spread=0, report_interval=None)
+        threads = []
+        scheduler.add(
+            "device_1", "a", 0.05, lambda: threads.append(threading.current_thread())
+        )
+        time.sleep(0.18)
+        scheduler.shutdown()
+        self.assertGreater(len(threads), 1)
+        self.assertEqual({"SignalScheduler"}, {thread.name for thread in threads})
+
+    def test_report(self):
+        scheduler = SignalScheduler(max_workers=2, phase_spread=0, report_interval=0.3)
+        reports = []
+        scheduler._report = reports.append
+        scheduler.add("device_1", "slow", 0.05, lambda: time.sleep(0.12))
+        scheduler.add("device_2", "fast", 0.05, lambda: None)
+        time.sleep(0.4)
+        scheduler.shutdown()
+        self.assertEqual(1, len(reports))
+        self.assertEqual(["slow"], [signal["signal_name"] for signal in reports[0]])
+        self.assertGreater(reports[0][0]["missed"], 0)
@@ -0,0 +1,71 @@
+from unittest import TestCase
+
+from bson import ObjectId
+
+from alab_management.builders.experimentbuilder import ExperimentBuilder
+from alab_management.device_view.device import get_all_devices
+from alab_management.resource_manager.simulator import CampaignSimulator
+from alab_management.utils.module_ops import load_definition
+
+
+def build_experiment(name: str) -> ExperimentBuilder:
+    experiment = ExperimentBuilder(name=name)
+    sample = experiment.add_sample(f"{name}_sample")
+    for task_name, task_kwargs in [
+        ("Starting", {"dest": "furnace_temp"}),
+        ("Heating", {"setpoints": [[10, 600]]}),
+        ("Ending", {}),
+    ]:
+        task_id = str(ObjectId())
+        experiment.add_task(task_id, task_name, task_kwargs, samples=[sample])
+        sample.add_task(task_id)
+    return experiment
+
+
+class TestCampaignSimulator(TestCase):
+    def setUp(self):
+        load_definition()
+        # the device class defined in the fake lab
+        self.furnace_type = type(get_all_devices()["furnace_1"])
+        self.duration_models = {
+            "Starting": 10,
+            "Heating": lambda parameters: parameters["setpoints"][0][1] / 6,
+            "Ending": 5,
+        }
+        self.resource_requests = {
+            "Starting": {None: {"furnace_temp": 1}},
+            "Heating": {self.furnace_type: {"inside": 8}},
+        }
+
+    def test_run(self):
+        # 32 experiments on 16 furnaces: the heating tasks run in two rounds
+        experiments = [build_experiment(f"experiment_{i}") for i in range(32)]
+        for allocation in ["greedy", "batch"]:
+            result = CampaignSimulator(
+                duration_models=self.duration_models,
+                resource_requests=self.resource_requests,
+                allocation=allocation,
+            ).run(experiments)
+
+            self.assertEqual(96, len(result.tasks))
+            self.assertAlmostEqual(10 + 100 * 2 + 5, result.makespan)
+            self.assertAlmostEqual(200 / 215, result.device_utilization["furnace_1"])
+            self.assertEqual(0.0, result.device_utilization["dummy"])
+            delays = result.get_queueing_delay_by_task_type()
+            self.assertAlmostEqual(0.0, delays["Starting"])
+            self.assertAlmostEqual(50.0, delays["Heating"])
+            self.assertAlmostEqual(100.0, result.max_queueing_delay)
+            for task in result.tasks:
+                self.assertGreaterEqual(task.started_at, task.ready_at)
+                self.assertGreater(task.completed_at, task.started_at)
+
+    def test_invalid_campaign(self):
+        experiments = [build_experiment("experiment")]
+        with self.assertRaises(ValueError):
+            CampaignSimulator(duration_models={"Starting": 10}).run(experiments)
+        # more positions than the furnace has
+        with self.assertRaises(ValueError):
+            CampaignSimulator(
+                duration_models=self.duration_models,
+                resource_requests={"Heating": {self.furnace_type: {"inside": 9}}},
+            ).run(experiments)
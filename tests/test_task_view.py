@@ -191,3 +191,278 @@ class TestTaskView(TestCase):
         self.assertListEqual(
             [task_id_5], self.task_view.get_task(task_id_6)["next_tasks"]
         )
+
+    def test_remaining_prev_tasks(self):
+        task_dict = {
+            "task_type": "Heating",
+            "samples": [{"name": "sample1", "sample_id": ObjectId()}],
+            "parameters": {"setpoints": [[10, 600]]},
+        }
+        # many tasks merging into one task
+        prev_task_ids = [self.task_view.create_task(**task_dict) for _ in range(5)]
+        task_id = self.task_view.create_task(prev_tasks=prev_task_ids, **task_dict)
+        for prev_task_id in prev_task_ids:
+            self.task_view.update_task_dependency(prev_task_id, next_tasks=task_id)
+        self.assertEqual(5, self.task_view.get_task(task_id)["remaining_prev_tasks"])
+
+        for i, prev_task_id in enumerate(prev_task_ids):
+            self.assertIs(TaskStatus.WAITING, self.task_view.get_status(task_id))
+            self.task_view.update_status(prev_task_id, TaskStatus.COMPLETED)
+            # completing a task twice does not count down twice
+            self.task_view.update_status(prev_task_id, TaskStatus.COMPLETED)
+            self.assertEqual(
+                4 - i, self.task_view.get_task(task_id)["remaining_prev_tasks"]
+            )
+        self.assertIs(TaskStatus.READY, self.task_view.get_status(task_id))
+
+        # the completed prev tasks are not counted
+        task_id_2 = self.task_view.create_task(prev_tasks=prev_task_ids[0], **task_dict)
+        self.assertEqual(0, self.task_view.get_task(task_id_2)["remaining_prev_tasks"])
+        self.task_view.try_to_mark_task_ready(task_id_2)
+        self.assertIs(TaskStatus.READY, self.task_view.get_status(task_id_2))
+
+    def test_cancel_downstream_tasks(self):
+        sample_1 = {"name": "sample1", "sample_id": ObjectId()}
+        sample_2 = {"name": "sample2", "sample_id": ObjectId()}
+        task_dict = {
+            "task_type": "Heating",
+            "parameters": {"setpoints": [[10, 600]]},
+        }
+        # 1 -> 2 -> 3
+        #   \
+        # 4 -> 5
+        task_id_1 = self.task_view.create_task(samples=[sample_1], **task_dict)
+        task_id_2 = self.task_view.create_task(
+            samples=[sample_1], prev_tasks=task_id_1, **task_dict
+        )
+        task_id_3 = self.task_view.create_task(
+            samples=[sample_1], prev_tasks=task_id_2, **task_dict
+        )
+        task_id_4 = self.task_view.create_task(samples=[sample_2], **task_dict)
+        task_id_5 = self.task_view.create_task(
+            samples=[sample_1, sample_2],
+            prev_tasks=[task_id_1, task_id_4],
+            **task_dict,
+        )
+        self.task_view.update_task_dependency(
+            task_id_1, next_tasks=[task_id_2, task_id_5]
+        )
+        self.task_view.update_task_dependency(task_id_2, next_tasks=task_id_3)
+        self.task_view.update_task_dependency(task_id_4, next_tasks=task_id_5)
+        self.task_view.update_status(task_id_4, TaskStatus.COMPLETED)
+
+        self.task_view.update_status(task_id_1, TaskStatus.ERROR)
+        self.assertIs(TaskStatus.CANCELLED, self.task_view.get_status(task_id_2))
+        self.assertIs(TaskStatus.CANCELLED, self.task_view.get_status(task_id_3))
+        self.assertEqual(
+            "Cancelled due to an upstream task being cancelled or throwing an error.",
+            self.task_view.get_task(task_id_3)["message"],
+        )
+
+        task_5 = self.task_view.get_task(task_id_5)
+        self.assertListEqual([task_id_4], task_5["prev_tasks"])
+        self.assertListEqual([sample_2], task_5["samples"])
+        self.assertEqual(0, task_5["remaining_prev_tasks"])
+        self.assertEqual(TaskStatus.READY.name, task_5["status"])
+
+    def test_legacy_task_without_counter(self):
+        task_dict = {
+            "task_type": "Heating",
+            "samples": [{"name": "sample1", "sample_id": ObjectId()}],
+            "parameters": {"setpoints": [[10, 600]]},
+        }
+        task_id = self.task_view.create_task(**task_dict)
+        task_id_2 = self.task_view.create_task(prev_tasks=task_id, **task_dict)
+        self.task_view.update_task_dependency(task_id, next_tasks=task_id_2)
+        # tasks created before the counter was introduced
+        self.task_view._task_collection.update_many(
+            {}, {"$unset": {"remaining_prev_tasks": ""}}
+        )
+
+        self.task_view.try_to_mark_task_ready(task_id_2)
+        self.assertIs(TaskStatus.WAITING, self.task_view.get_status(task_id_2))
+        self.task_view.update_status(task_id, TaskStatus.COMPLETED)
+        self.assertIs(TaskStatus.READY, self.task_view.get_status(task_id_2))
+
+    def test_create_tasks(self):
+        task_dict = {
+            "task_type": "Heating",
+            "samples": [{"name": "sample1", "sample_id": ObjectId()}],
+            "parameters": {"setpoints": [[10, 600]]},
+        }
+        existing_task_id = self.task_view.create_task(**task_dict)
+        completed_task_id = self.task_view.create_task(**task_dict)
+        self.task_view.update_status(completed_task_id, TaskStatus.COMPLETED)
+
+        # 1 -> 2
+        # existing -> 3, completed -> 4
+        task_id_1, task_id_2 = ObjectId(), ObjectId()
+        task_ids = self.task_view.create_tasks(
+            [
+                {**task_dict, "task_id": task_id_1, "next_tasks": [task_id_2]},
+                {**task_dict, "task_id": task_id_2, "prev_tasks": [task_id_1]},
+                {**task_dict, "prev_tasks": existing_task_id},
+                {**task_dict, "prev_tasks": [completed_task_id]},
+            ]
+        )
+        self.assertListEqual([task_id_1, task_id_2], task_ids[:2])
+        self.assertEqual(
+            [
+                TaskStatus.READY,
+                TaskStatus.WAITING,
+                TaskStatus.WAITING,
+                TaskStatus.READY,
+            ],
+            [self.task_view.get_status(task_id) for task_id in task_ids],
+        )
+        self.assertListEqual(
+            [existing_task_id], self.task_view.get_task(task_ids[2])["prev_tasks"]
+        )
+
+        self.task_view.update_status(task_id_1, TaskStatus.COMPLETED)
+        self.assertIs(TaskStatus.READY, self.task_view.get_status(task_id_2))
+
+        with self.assertRaises(ValueError):
+            self.task_view.create_tasks([{**task_dict, "prev_tasks": [ObjectId()]}])
+        with self.assertRaises(ValueError):
+            self.task_view.create_tasks([{**task_dict, "task_type": "NOT A TASK"}])
+
+    def test_claim_ready_task(self):
+        task_dict = {
+            "task_type": "Heating",
+            "samples": [{"name": "sample1", "sample_id": ObjectId()}],
+        }
+        task_id_1 = self.task_view.create_task(parameters={}, **task_dict)
+        task_id_2 = self.task_view.create_task(parameters={"priority": 30}, **task_dict)
+        task_id_3 = self.task_view.create_task(parameters={}, **task_dict)
+        task_id_4 = self.task_view.create_task(parameters={}, **task_dict)
+        for task_id in [task_id_1, task_id_2, task_id_3]:
+            self.task_view.update_status(task_id, TaskStatus.READY)
+        self.assertEqual(3, self.task_view.count_tasks_by_status(TaskStatus.READY))
+
+        # the highest priority first, then the oldest
+        claimed = [self.task_view.claim_ready_task() for _ in range(4)]
+        self.assertListEqual(
+            [task_id_2, task_id_1, task_id_3], [task["task_id"] for task in claimed[:3]]
+        )
+        self.assertEqual("Heating", claimed[0]["type"].__name__)
+        self.assertEqual(30, claimed[0]["priority"])
+        self.assertIsNone(claimed[3])
+
+        self.assertEqual(0, self.task_view.count_tasks_by_status(TaskStatus.READY))
+        self.assertEqual(3, self.task_view.count_tasks_by_status(TaskStatus.INITIATED))
+        self.assertIs(TaskStatus.WAITING, self.task_view.get_status(task_id_4))
+
+        tasks = self.task_view.get_tasks_by_status(TaskStatus.INITIATED, projection=[])
+        self.assertSetEqual(
+            {"task_id", "type"}, {key for task in tasks for key in task}
+        )
+
+    def test_subtasks(self):
+        task_id = self.task_view.create_task(
+            task_type="Heating",
+            samples=[{"name": "sample1", "sample_id": ObjectId()}],
+            parameters={},
+        )
+        subtask_ids = [
+            self.task_view.create_subtask(
+                task_id, "Dosing", samples=["sample1"], parameters={"vial": i}
+            )
+            for i in range(3)
+        ]
+
+        self.task_view.update_subtask_status(
+            task_id, subtask_ids[1], TaskStatus.RUNNING
+        )
+        started_at = self.task_view.get_task(task_id)["subtasks"][1]["started_at"]
+        # started_at is kept when the subtask runs again
+        self.task_view.update_subtask_status(
+            task_id, subtask_ids[1], TaskStatus.RUNNING
+        )
+        self.task_view.update_subtask_status(
+            task_id, subtask_ids[1], TaskStatus.COMPLETED
+        )
+        self.task_view.update_subtask_result(task_id, subtask_ids[1], {"mass": 1.0})
+
+        subtasks = self.task_view.get_task(task_id)["subtasks"]
+        self.assertListEqual(subtask_ids, [s["subtask_id"] for s in subtasks])
+        self.assertListEqual(
+            ["INITIATED", "COMPLETED", "INITIATED"], [s["status"] for s in subtasks]
+        )
+        self.assertEqual(started_at, subtasks[1]["started_at"])
+        self.assertIn("completed_at", subtasks[1])
+        self.assertDictEqual({"mass": 1.0}, subtasks[1]["result"])
+        self.assertNotIn("result", subtasks[0])
+
+        with self.assertRaises(ValueError):
+            self.task_view.update_subtask_status(
+                task_id, ObjectId(), TaskStatus.RUNNING
+            )
+        with self.assertRaises(ValueError):
+            self.task_view.update_subtask_result(ObjectId(), subtask_ids[0], None)
+        with self.assertRaises(ValueError):
+            self.task_view.create_subtask(ObjectId(), "Dosing", [], {})
+
+    def test_claim_ready_task_exclude_types(self):
+        samples = [{"name": "sample1", "sample_id": ObjectId()}]
+        heating_task_id = self.task_view.create_task(
+            task_type="Heating", samples=samples, parameters={"priority": 30}
+        )
+        ending_task_id = self.task_view.create_task(
+            task_type="Ending", samples=samples, parameters={}
+        )
+        for task_id in [heating_task_id, ending_task_id]:
+            self.task_view.update_status(task_id, TaskStatus.READY)
+
+        task = self.task_view.claim_ready_task(exclude_types=["Heating"])
+        self.assertEqual(ending_task_id, task["task_id"])
+        self.assertIsNone(self.task_view.claim_ready_task(exclude_types=["Heating"]))
+        self.assertDictEqual(
+            {"Ending": 1},
+            self.task_view.count_tasks_by_type([TaskStatus.INITIATED]),
+        )
+
+        self.task_view.claim_ready_task()
+        self.task_view.update_status(heating_task_id, TaskStatus.RUNNING)
+        self.assertDictEqual(
+            {"Ending": 1, "Heating": 1},
+            self.task_view.count_tasks_by_type(
+                [TaskStatus.INITIATED, TaskStatus.RUNNING]
+            ),
+        )
+
+    def test_get_imminent_tasks(self):
+        task_dict = {
+            "task_type": "Heating",
+            "samples": [{"name": "sample1", "sample_id": ObjectId()}],
+            "parameters": {"setpoints": [[10, 600]]},
+        }
+        # a chain of three tasks
+        task_id_1 = self.task_view.create_task(**task_dict)
+        task_id_2 = self.task_view.create_task(prev_tasks=task_id_1, **task_dict)
+        task_id_3 = self.task_view.create_task(prev_tasks=task_id_2, **task_dict)
+        self.task_view.update_task_dependency(task_id_1, next_tasks=task_id_2)
+        self.task_view.update_task_dependency(task_id_2, next_tasks=task_id_3)
+        self.task_view.update_status(task_id_1, TaskStatus.RUNNING)
+        ready_task_id = self.task_view.create_task(
+            task_type="Heating",
+            samples=task_dict["samples"],
+            parameters={"priority": 30},
+        )
+        self.task_view.update_status(ready_task_id, TaskStatus.READY)
+
+        # the second task is imminent as its only previous task is running
+        tasks = self.task_view.get_imminent_tasks()
+        self.assertListEqual(
+            [ready_task_id, task_id_2], [task["task_id"] for task in tasks]
+        )
+        self.assertEqual(30, tasks[0]["priority"])
+        self.assertListEqual([task_id_1], tasks[1]["prev_tasks"])
+        self.assertListEqual([], self.task_view.get_imminent_tasks(["Ending"]))
+
+        self.task_view.update_status(task_id_1, TaskStatus.COMPLETED)
+        self.task_view.update_status(task_id_2, TaskStatus.RUNNING)
+        self.assertListEqual(
+            [ready_task_id, task_id_3],
+            [task["task_id"] for task in self.task_view.get_imminent_tasks()],
+        )